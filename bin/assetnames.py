@@ -0,0 +1,65 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Give the bundled files in a package names containing a hash of their contents, such as ``numbas.3f2a9c0b1d4e.js``.
+
+    A file with a hashed name never changes, so it can be cached for as long as a browser or CDN likes,
+    and the same file built for different exams has the same name.
+
+    The references to renamed files in the other files of the package are rewritten.
+    A reference is the path of the file in quotes or brackets, optionally followed by a query string or fragment, such as ``src="numbas.js?build_time=1"``.
+"""
+
+import hashlib
+from pathlib import PurePath
+import re
+
+HASH_LENGTH = 12
+
+re_absolute_url = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*:|/)')
+
+
+def hashed_name(dst, data):
+    """
+        The path ``dst``, with a hash of ``data`` inserted before the extension.
+    """
+    dst = PurePath(dst)
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return dst.with_name('{}.{}{}'.format(dst.stem, digest, dst.suffix))
+
+
+def reference_pattern(names):
+    """
+        A regular expression matching references to any of the given paths.
+    """
+    alternatives = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(r'''(?<=['"(])(\./)?({})(?=[?#'")])'''.format(alternatives))
+
+
+def rewrite_references(text, renames):
+    """
+        Replace references to the paths in the dictionary ``renames`` with their new paths.
+        Paths are strings relative to the root of the package, with forward slashes. The new paths can also be URLs.
+    """
+    if not renames:
+        return text
+
+    def replace(m):
+        new = renames[m.group(2)]
+        # Keep a leading ./ unless the new path is absolute.
+        prefix = m.group(1) if m.group(1) and not re_absolute_url.match(new) else ''
+        return prefix + new
+
+    return reference_pattern(renames).sub(replace, text)
@@ -0,0 +1,196 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from collections import OrderedDict
+import json
+import os
+from pathlib import Path
+import threading
+
+
+def stamp(path):
+    """
+        A value which changes whenever the file or directory at the given path is modified, or None if it doesn't exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def value_size(value):
+    """
+        The number of bytes a value counts for towards the size of the cache: the length of the text and binary data in it,
+        including inside lists, tuples and dictionaries such as parsed JSON. Other objects count as nothing.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(value_size(k) + value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(v) for v in value)
+    return 0
+
+
+class BuildCache(object):
+    """
+        Keep things derived from files on disk - file contents, parsed JSON, directory listings - in memory,
+        so that they can be reused by later compilations in the same process.
+
+        Each entry remembers the modification times of the files it was made from, and is rebuilt when any of them change.
+
+        The cache holds at most ``max_entries`` entries, and at most ``max_bytes`` bytes of text and binary values.
+        When it's full, the entries which were used least recently are dropped.
+    """
+    def __init__(self, max_entries=4096, max_bytes=256*1024*1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        # A lock for each key whose value is being made, so that it's only made once, without holding up other keys.
+        self.key_locks = {}
+
+    def __getstate__(self):
+        # Only entries which can be sent to another process are kept.
+        with self.lock:
+            entries = OrderedDict((key, entry) for key, entry in self.entries.items() if not entry[2])
+        return {'max_entries': self.max_entries, 'max_bytes': self.max_bytes, 'entries': entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_entries'], state['max_bytes'])
+        self.entries = state['entries']
+        self.size = sum(value_size(entry[0]) for entry in self.entries.values())
+
+    def lookup(self, key):
+        """
+            The entry stored under ``key``, if there is one and the files it was made from haven't changed, otherwise ``None``.
+            Must be called with the lock held.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, stamps, _ = entry
+        if not all(stamp(path) == s for path, s in stamps):
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def store(self, key, entry):
+        """
+            Store an entry, and drop the least recently used entries until the cache is within its limits.
+            Must be called with the lock held.
+        """
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= value_size(old[0])
+        self.entries[key] = entry
+        self.size += value_size(entry[0])
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, dropped = self.entries.popitem(last=False)
+            self.size -= value_size(dropped[0])
+
+    def get(self, key, make, local=False):
+        """
+            Get the value stored under ``key``, or call ``make`` to produce it.
+
+            ``make`` should return a pair ``(value, paths)``, where ``paths`` is a list of the files and directories the value depends on.
+            Only one thread makes the value for a key at a time, and other keys can be used while it's being made.
+
+            If ``local`` is ``True``, the value can't be pickled, so it isn't copied when the cache is sent to another process.
+        """
+        with self.lock:
+            entry = self.lookup(key)
+            if entry is not None:
+                return entry[0]
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread might have made the value while this one was waiting.
+            with self.lock:
+                entry = self.lookup(key)
+            if entry is not None:
+                return entry[0]
+
+            try:
+                value, paths = make()
+                with self.lock:
+                    self.store(key, (value, [(path, stamp(path)) for path in paths], local))
+            finally:
+                with self.lock:
+                    if self.key_locks.get(key) is key_lock:
+                        del self.key_locks[key]
+            return value
+
+    def update(self, other):
+        """
+            Add all the entries from another cache to this one.
+        """
+        with other.lock:
+            entries = list(other.entries.items())
+        with self.lock:
+            for key, entry in entries:
+                self.store(key, entry)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def read_text(self, path):
+        path = Path(path)
+        return self.get(('text', path), lambda: (path.read_text(encoding='utf-8'), [path]))
+
+    def load_json(self, path):
+        path = Path(path)
+        def make():
+            with open(path, encoding='utf-8') as f:
+                return json.loads(f.read()), [path]
+        return self.get(('json', path), make)
+
+    def join_texts(self, paths, separator):
+        """
+            The contents of the given files, joined with ``separator``.
+        """
+        paths = tuple(Path(path) for path in paths)
+        return self.get(('join', paths, separator), lambda: (separator.join(self.read_text(path) for path in paths), paths))
+
+    def walk(self, src, followlinks=False):
+        """
+            Like ``os.walk``, but the listing is remembered until one of the directories in the tree is modified.
+            Hidden directories are not descended into.
+            Directories and files are listed in order of name, so the result doesn't depend on the filesystem.
+
+            Returns a list of pairs ``(directory, filenames)``.
+        """
+        src = Path(src)
+        def make():
+            listing = []
+            dirs = []
+            for path, dirnames, filenames in os.walk(src, followlinks=followlinks):
+                dirs.append(path)
+                listing.append((Path(path), sorted(filenames)))
+                dirnames[:] = sorted(d for d in dirnames if not (d[0]=='.' and len(d)>1))
+            if not dirs:
+                dirs.append(src)
+            return listing, dirs
+        return self.get(('walk', src, followlinks), make)
+
+    def listdir(self, path):
+        """
+            The entries of a directory, remembered until the directory is modified.
+        """
+        path = Path(path)
+        return self.get(('listdir', path), lambda: (sorted(path.iterdir()), [path]))
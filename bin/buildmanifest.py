@@ -0,0 +1,174 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    A record of the files written by a directory build, kept in the output directory.
+
+    For each file, the manifest records a hash of its contents, its size, the modification time and size of the file written,
+    and, for files copied from disk, the modification time and size of the source.
+    The next build into the same directory uses it to skip files whose contents haven't changed, and to remove files which are no longer produced.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path, PurePosixPath
+
+
+MANIFEST_NAME = '.numbas-build.json'
+MANIFEST_VERSION = 1
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_chunks(chunks):
+    h = hashlib.sha256()
+    for chunk in chunks:
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class BuildManifest(object):
+    def __init__(self, root, stored=False):
+        """
+            ``stored`` is ``True`` if the files in this build are linked to an object store.
+        """
+        self.root = Path(root)
+        self.stored = stored
+        self.files = {}
+
+    @property
+    def path(self):
+        return self.root / MANIFEST_NAME
+
+    def load(self):
+        """
+            Load the manifest left by the previous build. If there isn't one, or it can't be read, the manifest is empty.
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.files = data['files']
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.files = {}
+        return self
+
+    def save(self):
+        # The output files are stamped, so that the next build can tell whether they've been changed since.
+        for name, entry in self.files.items():
+            try:
+                entry['output'] = source_stamp(self.root / name)
+            except OSError:
+                entry.pop('output', None)
+            if self.stored:
+                entry['stored'] = True
+            else:
+                entry.pop('stored', None)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def get(self, name):
+        return self.files.get(name)
+
+    def unchanged(self, name, digest):
+        """
+            Does the output directory already contain the file ``name`` with the given hash?
+            The file must have the same hash in the manifest, and the same modification time and size as when the manifest was saved.
+            It must also be linked to an object store only if this build uses one.
+        """
+        entry = self.files.get(name)
+        if entry is None or entry.get('hash') != digest or entry.get('output') is None:
+            return False
+        if entry.get('stored', False) != self.stored:
+            return False
+        try:
+            return source_stamp(self.root / name) == entry['output']
+        except OSError:
+            return False
+
+    def inside_root(self, name):
+        """
+            Is ``name`` the path of a file inside the output directory?
+            Names with ``..`` in them, absolute paths and paths through links to other directories aren't.
+        """
+        pure = PurePosixPath(name)
+        if pure.is_absolute() or '..' in pure.parts or not pure.parts:
+            return False
+        path = self.root / pure
+        try:
+            root = self.root.resolve()
+            parent = path.parent.resolve()
+        except OSError:
+            return False
+        return parent == root or root in parent.parents
+
+    def unchanged_source(self, name, src):
+        """
+            Was the file ``name`` copied from ``src`` by the previous build, and has ``src`` not been modified since?
+            If so, returns the recorded entry, so the source doesn't need to be hashed again.
+        """
+        entry = self.files.get(name)
+        if entry is None or entry.get('source') != source_stamp(src):
+            return None
+        if not self.unchanged(name, entry['hash']):
+            return None
+        return entry
+
+    def remove_orphans(self, names):
+        """
+            Delete the files recorded by the previous build which aren't in ``names``, along with any directories left empty.
+            Returns the list of names of deleted files.
+        """
+        removed = []
+        for name in sorted(set(self.files) - set(names)):
+            # The manifest might have been edited, or copied from somewhere else.
+            if not self.inside_root(name):
+                continue
+            path = self.root / name
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            removed.append(name)
+            parent = path.parent
+            while parent != self.root and self.root in parent.parents:
+                try:
+                    parent.rmdir()
+                except OSError:
+                    break
+                parent = parent.parent
+        return removed
@@ -0,0 +1,238 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    A profile of a compilation: how long each phase took, how much CPU time and memory it used, and how many bytes of files it produced.
+
+    The profile is written as a JSON summary, and in the Chrome trace event format, which can be loaded into a trace viewer such as Perfetto or ``chrome://tracing``.
+
+    Memory is the peak size of the memory allocated by Python, measured with ``tracemalloc``, which slows the compilation down.
+    It's measured for the whole process, so the memory used by work in other threads, such as the minifier calls, counts towards the phase that started it.
+    For the same reason, memory is only recorded while a single profiled compilation is running in the process:
+    if compilations overlap, for example in the compile server, their profiles record time but not memory.
+    The CPU time of a phase includes the time used by the programs it ran, such as minifiers, once they've finished.
+    When compilations overlap, the CPU time is only that of the thread which ran the phase.
+"""
+
+from contextlib import contextmanager, nullcontext
+import json
+import os
+from pathlib import Path
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# The profiles which have started and not yet stopped in this process.
+_running = set()
+_running_lock = threading.Lock()
+_started_tracing = False
+
+
+def children_cpu_time():
+    """
+        The CPU time used by the finished child processes of this process.
+    """
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profile(object):
+    """
+        The phases of a compilation, recorded as they happen. If ``enabled`` is ``False``, nothing is recorded.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.thread_ids = {}
+        # Is memory being measured? Only while this is the only profile running.
+        self.memory = False
+        self.start_time = time.perf_counter()
+
+    def start(self):
+        global _started_tracing
+        if not self.enabled:
+            return
+        with _running_lock:
+            _running.add(self)
+            if len(_running) == 1:
+                self.memory = True
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _started_tracing = True
+            else:
+                # Neither compilation could tell its allocations from the other's.
+                for profile in _running:
+                    profile.memory = False
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        global _started_tracing
+        with _running_lock:
+            if self not in _running:
+                return
+            _running.discard(self)
+            if not _running and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        if not self.memory:
+            for event in self.events:
+                event['peak_memory'] = None
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def thread_id(self):
+        """
+            A small number identifying the current thread, which is 0 for the thread the compilation runs in.
+        """
+        ident = threading.get_ident()
+        with self.lock:
+            if ident not in self.thread_ids:
+                self.thread_ids[ident] = (len(self.thread_ids), threading.current_thread().name)
+            return self.thread_ids[ident][0]
+
+    def phase(self, name, category='phase', **args):
+        """
+            A context manager recording a phase of the compilation.
+            Phases in the compilation's own thread can be nested, and each one's peak memory includes the phases inside it.
+            Phases in other threads, such as the minifier calls, record their wall and CPU time, but not memory.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name, category, args)
+
+    @contextmanager
+    def _phase(self, name, category, args):
+        tid = self.thread_id()
+        main = tid == 0
+        measure = main and self.memory
+        stack = self.stack
+        event = {
+            'name': name,
+            'category': category,
+            'thread': tid,
+            'depth': len(stack),
+            'args': args,
+            'bytes': 0,
+        }
+        if measure:
+            # The peak is reset for this phase, so the peak so far is kept for the phase containing it.
+            _, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak_memory'] = max(stack[-1]['peak_memory'], peak)
+            tracemalloc.reset_peak()
+            event['peak_memory'] = 0
+        if measure:
+            cpu_start = time.process_time() + children_cpu_time()
+        else:
+            cpu_start = time.thread_time()
+        stack.append(event)
+        event['start'] = time.perf_counter() - self.start_time
+        try:
+            yield event
+        finally:
+            event['wall'] = time.perf_counter() - self.start_time - event['start']
+            stack.pop()
+            if measure:
+                event['cpu'] = time.process_time() + children_cpu_time() - cpu_start
+            else:
+                event['cpu'] = time.thread_time() - cpu_start
+            if measure and self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                event['peak_memory'] = max(event['peak_memory'], peak)
+            else:
+                event['peak_memory'] = None
+            with self.lock:
+                self.events.append(event)
+
+    def add_bytes(self, size):
+        """
+            Count some bytes as produced by the current phase of this thread.
+        """
+        if self.enabled and self.stack:
+            self.stack[-1]['bytes'] += size
+
+    def summary(self, **info):
+        """
+            The recorded phases, in the order they started, as a dictionary which can be saved as JSON.
+        """
+        phases = []
+        for event in sorted(self.events, key=lambda e: (e['start'], e['depth'])):
+            phase = {k: event[k] for k in ('name', 'category', 'thread', 'depth', 'start', 'wall', 'cpu', 'peak_memory', 'bytes')}
+            phase.update(event['args'])
+            phases.append(phase)
+        summary = dict(info)
+        summary['memory_measured'] = self.memory
+        summary['phases'] = phases
+        return summary
+
+    def trace(self):
+        """
+            The recorded phases in the Chrome trace event format.
+        """
+        pid = os.getpid()
+        events = []
+        for tid, name in sorted(self.thread_ids.values()):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        for event in sorted(self.events, key=lambda e: (e['start'], e['depth'])):
+            args = dict(event['args'])
+            args.update({'cpu_ms': event['cpu'] * 1000, 'bytes': event['bytes']})
+            if event['peak_memory'] is not None:
+                args['peak_memory'] = event['peak_memory']
+            events.append({
+                'name': event['name'],
+                'cat': event['category'],
+                'ph': 'X',
+                'ts': event['start'] * 1e6,
+                'dur': event['wall'] * 1e6,
+                'pid': pid,
+                'tid': event['thread'],
+                'args': args,
+            })
+            if event['peak_memory'] is not None and event['depth'] > 0:
+                events.append({'name': 'peak memory', 'ph': 'C', 'ts': (event['start'] + event['wall']) * 1e6, 'pid': pid, 'args': {'bytes': event['peak_memory']}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path, **info):
+        """
+            Save the summary to ``path``, and the trace to a file next to it with the extension ``.trace.json``.
+        """
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(**info), f, indent=4)
+        with open(trace_path(path), 'w', encoding='utf-8') as f:
+            json.dump(self.trace(), f)
+
+
+def trace_path(path):
+    """
+        The path of the trace file written alongside the summary at ``path``.
+    """
+    path = Path(path)
+    stem = path.name[:-len('.json')] if path.name.endswith('.json') else path.name
+    return path.with_name(stem + '.trace.json')
@@ -12,6 +12,7 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+from bisect import bisect_right
 import sys
 import re
 from collections import OrderedDict
@@ -19,49 +20,105 @@ from collections import OrderedDict
 class ParseError(Exception):
     def __init__(self,parser,message,hint=''):
         self.expression = parser.source[parser.cursor:parser.cursor+50]
-        self.line = parser.source[:parser.cursor].count('\n')+1
+        self.line, self.column = parser.position(parser.cursor)
         self.message = message
         self.hint = hint
     
     def __str__(self):
-        msg = '%s at line %s near: \n\t %s ' % (self.message,self.line,self.expression)
+        msg = '%s at line %s, column %s near: \n\t %s ' % (self.message,self.line,self.column,self.expression)
         if self.hint:
             msg += '\nPossible fix: '+self.hint
         return msg
 
 class ExamParser:
+    """
+        Parser for the old .exam format.
+
+        The cursor only ever moves forwards, and every scan is done with a precompiled regular expression or a string search starting at the cursor,
+        so parsing takes time linear in the length of the source.
+    """
     source = ''
     cursor = 0
+    line_starts = None
+
+    def __init__(self,recover=False):
+        """
+            If ``recover`` is ``True``, syntax errors don't stop the parser: each one is added to ``self.errors``,
+            the rest of the line is skipped, and parsing carries on with the next item in the enclosing object or array.
+        """
+        self.recover = recover
+        self.errors = []
+
+    # All whitespace, as removed by str.strip
+    re_whitespace = re.compile(r'\s*')
+    # Whitespace other than line breaks
+    re_inline_space = re.compile(r'[ \t\r\x0b\x0c]*')
+    # The longest prefix of an object property name which is valid: a name is made of word characters followed by any number of single quotes
+    re_name = re.compile(r"\s*\w*'*\s*")
+    # The end of an undelimited literal
+    re_literal_end = re.compile(r'[\]}\n,:]|//')
 
     #parse a string into a data structure
     def parse(self,source):
         self.source = source
         self.cursor = 0
-        self.data = self.getthing()
-        if self.source[self.cursor:].strip()!='':
-            raise ParseError(self,"Didn't parse all input","check for unmatched brackets")
+        self.line_starts = None
+        self.errors = []
+        try:
+            self.data = self.getthing()
+            if self.cursor < len(self.source) and self.re_whitespace.match(self.source,self.cursor).end()!=len(self.source):
+                raise ParseError(self,"Didn't parse all input","check for unmatched brackets")
+        except ParseError as err:
+            if not self.recover:
+                raise
+            self.errors.append(err)
+            if not hasattr(self,'data'):
+                self.data = None
 
         return self.data
 
+    #the line and column numbers, counting from 1, of a position in the source
+    def position(self,offset):
+        if self.line_starts is None:
+            self.line_starts = [0]+[m.end() for m in re.finditer('\n',self.source)]
+        line = bisect_right(self.line_starts,offset)
+        return line, offset-self.line_starts[line-1]+1
+
+    #in recovery mode, note the error and skip to the start of the next line
+    def recover_from(self,err):
+        if not self.recover:
+            raise err
+        self.errors.append(err)
+        end = self.source.find('\n',self.cursor)
+        self.cursor = len(self.source) if end==-1 else end+1
+        self.lstripcomments()
+
+    #the character at the cursor
+    def current(self):
+        if self.cursor>=len(self.source):
+            raise ParseError(self,"Unexpected end of input","check for unmatched brackets")
+        return self.source[self.cursor]
+
     #scan past comments
     def lstripcomments(self):
-        os=self.source[self.cursor:]
-        s = os.lstrip()
-        s=s.lstrip()    #get rid of leading whitespace
-
-        while s[:2]=='//':
-            s=s[s.find('\n')+1:].lstrip()
-        self.cursor += len(os)-len(s)
+        source = self.source
+        cursor = self.re_whitespace.match(source,self.cursor).end() if self.cursor<len(source) else self.cursor
+        while source.startswith('//',cursor):
+            end = source.find('\n',cursor)
+            if end==-1:
+                cursor = len(source)
+            else:
+                cursor = self.re_whitespace.match(source,end+1).end()
+        self.cursor = cursor
 
     def stripspace(self):
-        os = self.source[self.cursor:]
-        s=os.lstrip(' \t\r\x0b\x0c')
-        self.cursor += len(os)-len(s)
+        if self.cursor<len(self.source):
+            self.cursor = self.re_inline_space.match(self.source,self.cursor).end()
 
     def getthing(self):
         self.lstripcomments()
 
-        f=self.source[self.cursor]
+        f=self.current()
 
         if f=='{':    #object
             self.cursor+=1
@@ -69,40 +126,14 @@ class ExamParser:
 
             obj = OrderedDict()
             while self.cursor<len(self.source) and self.source[self.cursor]!='}':
-                i=self.cursor
-                namere = re.compile(r'^[\w_]*\'*$')
-                while i<len(self.source) and self.source[i]!=':':
-                    name = self.source[self.cursor:i+1].strip()
-                    if(not namere.match(name)):
-                        raise ParseError(self,"Invalid name '%s' for an object property" % name,"check for mismatched brackets")
-                    i+=1
-                if i==len(self.source):
-                    raise ParseError(self,"Expected a colon")
-
-                name = self.source[self.cursor:i].rstrip().lower()
-                self.cursor = i+1
-                thing = self.getthing()
-                obj[name] = thing
-
-                self.stripspace()
-
-                if self.source[self.cursor]=='\n':
-                    self.cursor +=1
-                    self.lstripcomments()
-
-                elif self.source[self.cursor:self.cursor+2]=='//':
-                    self.lstripcomments()
-                else:
-                    self.lstripcomments()
-                    if self.source[self.cursor]==',' or self.source[self.cursor]=='\n':
-                        self.cursor+=1
-                        self.lstripcomments()
-                    elif self.source[self.cursor]=='}':
+                try:
+                    if self.getproperty(obj):
                         break
-                    else:
-                        raise ParseError(self,'Expected either } or , in object definition')
-            if self.cursor == len(self.source):
-                raise ParseError(self,'Expected a } to close an object')
+                except ParseError as err:
+                    self.recover_from(err)
+            if self.cursor >= len(self.source):
+                self.recover_from(ParseError(self,'Expected a } to close an object'))
+                return obj
 
             self.cursor +=1
             return obj
@@ -113,74 +144,24 @@ class ExamParser:
 
             arr=[]
             while self.cursor<len(self.source) and self.source[self.cursor]!=']':
-                thing = self.getthing()
-                arr.append(thing)
-
-                self.stripspace()
-
-                if self.source[self.cursor]=='\n':
-                    self.cursor+=1
-                    self.lstripcomments()
-                elif self.source[self.cursor:self.cursor+2]=='//':
-                    self.lstripcomments()
-                else:
-                    self.lstripcomments()
-                    if self.source[self.cursor]==',':
-                        self.cursor +=1
-                    elif self.source[self.cursor]==']':
+                try:
+                    if self.getitem(arr):
                         break
-                    else:
-                        raise ParseError(self,"Expected either , or ] in array definition")
-            if self.cursor == len(self.source):
-                raise ParseError(self,'Expected a ] to end an array')
+                except ParseError as err:
+                    self.recover_from(err)
+            if self.cursor >= len(self.source):
+                self.recover_from(ParseError(self,'Expected a ] to end an array'))
+                return arr
             self.cursor +=1
             return arr
 
-        elif f=='"':    #string literal - double quotes
-            if self.source[self.cursor:self.cursor+3]=='"""':    #triple-quoted  string
-                i=self.cursor+3
-                while i<len(self.source)-2 and self.source[i:i+3]!='"""':
-                    i+=1
-                while i<len(self.source)-3 and self.source[i+3]=='"':    #grab extra double-quotes which are part of the string. e.g. """"hi"""" parses as the string "hi", with double-quotes included
-                    i+=1
-                if i==len(self.source)-2:
-                    raise ParseError(self,'Expected """ to end string literal')
-                string = self.source[self.cursor+3:i]
-                self.cursor = i+3
-            else:
-                i=self.cursor+1
-                while i<len(self.source) and self.source[i]!='"':
-                    i+=1
-                if i==len(self.source):
-                    raise ParseError(self,'Expected " to end string literal')
-                string = self.source[self.cursor+1:i]
-                self.cursor = i+1
-            return string
-        elif f=="'":    #string literal - single quotes
-            if self.source[self.cursor:self.cursor+3]=="'''":    #triple-quoted  string
-                i=self.cursor+3
-                while i<len(self.source)-2 and self.source[i:i+3]!="'''":
-                    i+=1
-                while i<len(self.source)-3 and self.source[i+3]=="'":    #grab extra quotes which are part of the string. e.g. ''''hi'''' parses as the string "hi", with quotes included
-                    i+=1
-                if i==len(self.source)-2:
-                    raise ParseError(self,"Expected ''' to end string literal")
-                string = self.source[self.cursor+3:i]
-                self.cursor = i+3
-            else:
-                i=self.cursor+1
-                while i<len(self.source) and self.source[i]!="'":
-                    i+=1
-                if i==len(self.source):
-                    raise ParseError(self,"Expected ' to end string literal")
-                string = self.source[self.cursor+1:i]
-                self.cursor = i+1
-            return string
+        elif f=='"' or f=="'":    #string literal
+            return self.getstring(f)
+
         else:    #undelimited literal
-            i=self.cursor
-            while i<len(self.source) and self.source[i] not in ']}\n,:' and self.source[i:i+2]!='//':
-                i+=1
-            
+            m = self.re_literal_end.search(self.source,self.cursor)
+            i = m.start() if m else len(self.source)
+
             v=self.source[self.cursor:i].strip()
             l=v.lower()
             if is_number(v):
@@ -196,55 +177,227 @@ class ExamParser:
             self.cursor = i
             return v
 
+    #parse a property of an object, and the separator after it. Returns True if the end of the object has been reached.
+    def getproperty(self,obj):
+        valid_end = self.re_name.match(self.source,self.cursor).end()
+        i = self.source.find(':',self.cursor)
+        if valid_end<len(self.source) and (i==-1 or valid_end<i):
+            name = self.source[self.cursor:valid_end+1].strip()
+            raise ParseError(self,"Invalid name '%s' for an object property" % name,"check for mismatched brackets")
+        if i==-1:
+            raise ParseError(self,"Expected a colon")
+
+        name = self.source[self.cursor:i].rstrip().lower()
+        self.cursor = i+1
+        thing = self.getthing()
+        obj[name] = thing
+
+        self.stripspace()
+
+        if self.current()=='\n':
+            self.cursor +=1
+            self.lstripcomments()
+
+        elif self.source.startswith('//',self.cursor):
+            self.lstripcomments()
+        else:
+            self.lstripcomments()
+            if self.current()==',' or self.current()=='\n':
+                self.cursor+=1
+                self.lstripcomments()
+            elif self.current()=='}':
+                return True
+            else:
+                raise ParseError(self,'Expected either } or , in object definition')
+        return False
+
+    #parse an item in an array, and the separator after it. Returns True if the end of the array has been reached.
+    def getitem(self,arr):
+        thing = self.getthing()
+        arr.append(thing)
+
+        self.stripspace()
+
+        if self.current()=='\n':
+            self.cursor+=1
+            self.lstripcomments()
+        elif self.source.startswith('//',self.cursor):
+            self.lstripcomments()
+        else:
+            self.lstripcomments()
+            if self.current()==',':
+                self.cursor +=1
+            elif self.current()==']':
+                return True
+            else:
+                raise ParseError(self,"Expected either , or ] in array definition")
+        return False
+
+    def getstring(self,quote):
+        source = self.source
+        triple = quote*3
+        if source.startswith(triple,self.cursor):    #triple-quoted  string
+            start = self.cursor+3
+            i = source.find(triple,start)
+            if i==-1:
+                i = max(start,len(source)-2)
+            while i<len(source)-3 and source[i+3]==quote:    #grab extra quotes which are part of the string. e.g. """"hi"""" parses as the string "hi", with double-quotes included
+                i+=1
+            if i==len(source)-2:
+                raise ParseError(self,'Expected %s to end string literal' % triple)
+            string = source[start:i]
+            self.cursor = i+3
+        else:
+            i = source.find(quote,self.cursor+1)
+            if i==-1:
+                raise ParseError(self,'Expected %s to end string literal' % quote)
+            string = source[self.cursor+1:i]
+            self.cursor = i+1
+        return string
+
 def printdata(data,ntabs=0):
-    tabs = ntabs*'\t'
-    if type(data)==dict or type(data)==OrderedDict:
-        s=''
-        first=True
-        for x in data.keys():
-            if not first:
-                s+='\n'
-            if type(data[x])==dict or type(data[x])==list:
-                s+='\n'
-            s+=x+': '+printdata(data[x],ntabs+1)
-            first=False
-        if '\n' in s: 
-            s='{\n'+s+'\n'+'}'
+    return ''.join(iter_printdata(data))
+
+def write_data(data,f):
+    """
+        Write data in the .exam format to a file-like object.
+        The output is the same as ``printdata(data)``, but is written a piece at a time.
+    """
+    for fragment in iter_printdata(data):
+        f.write(fragment)
+
+def is_container(data):
+    return type(data)==dict or type(data)==OrderedDict or type(data)==list
+
+def printscalar(data):
+    if data=='infinity':
+        return '"infinity"'
+    if '"' in str(data) and not isinstance(data,str):
+        print("Unexpected type: "+str)
+
+    if isinstance(data,str) and ('\n' in data or '}' in data or ']' in data or ',' in data or '"' in data or "'" in data or ':' in data or '//' in data):
+        if '"' in data:
+            return '"""'+data+'"""'
         else:
-            s='{'+s+'}'
-        return s
-    elif type(data)==list:
-        s=''
-        first=True
-        for x in data:
+            return '"'+data+'"'
+    elif isinstance(data,str) and data.strip()=='':
+        return "'"+data+"'"
+    else:
+        return strcons_fix(data)
+
+def scalar_has_newline(data):
+    if isinstance(data,str):
+        return '\n' in data
+    if type(data) in (int,float,bool) or data is None:
+        return False
+    return '\n' in printscalar(data)
+
+def multiline_containers(data):
+    """
+        Find which objects and arrays in ``data`` will be written over more than one line.
+        Returns a dictionary mapping the ``id`` of each object and array to ``True`` or ``False``.
+
+        Objects are written over more than one line when they have more than one property, and arrays when they contain an object or array.
+        Either is written over more than one line when anything inside it is.
+    """
+    multiline = {}
+    visiting = set()
+    stack = [(data,False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not is_container(node) or id(node) in multiline:
+            continue
+        if children_done:
+            visiting.discard(id(node))
+            if type(node)==list:
+                items = node
+                nl = False
+            else:
+                items = node.values()
+                nl = len(node)>1 or any('\n' in key for key in node.keys())
+            for x in items:
+                if nl:
+                    break
+                if is_container(x):
+                    nl = type(x)==dict or type(x)==list or multiline[id(x)]
+                else:
+                    nl = scalar_has_newline(x)
+            multiline[id(node)] = nl
+        else:
+            if id(node) in visiting:
+                raise ValueError("Can't write data containing a circular reference")
+            visiting.add(id(node))
+            stack.append((node,True))
+            items = node if type(node)==list else node.values()
+            for x in items:
+                if is_container(x) and id(x) not in multiline:
+                    stack.append((x,False))
+    return multiline
+
+def iter_printdata(data):
+    """
+        Generate the .exam format representation of ``data``, a piece at a time.
+        Joining the pieces together gives the same string as ``printdata(data)``.
+
+        This doesn't recurse, so it works on deeply nested data, and takes time linear in the size of the output.
+    """
+    if not is_container(data):
+        yield printscalar(data)
+        return
+
+    multiline = multiline_containers(data)
+
+    def open_container(node):
+        nl = multiline[id(node)]
+        if type(node)==list:
+            yield '[\n' if nl else '['
+            return [node,iter(node),True,False,nl]
+        else:
+            yield '{\n' if nl else '{'
+            return [node,iter(node.items()),True,False,nl]
+
+    # Each frame is [container, iterator over its items, is this the first item?, has a line break been written inside it yet?, is it multi-line?]
+    stack = []
+    frame = yield from open_container(data)
+    stack.append(frame)
+    while stack:
+        frame = stack[-1]
+        node, items, first, seen_nl, nl = frame
+        try:
+            item = next(items)
+        except StopIteration:
+            stack.pop()
+            if type(node)==list:
+                yield '\n]' if nl else ']'
+            else:
+                yield '\n}' if nl else '}'
+            continue
+
+        if type(node)==list:
+            x = item
             if not first:
-                s+=', '
-                if '\n' in s:
-                    s+='\n'
+                yield ', '
+                if seen_nl:
+                    yield '\n'
             if type(x)==dict or type(x)==list:
-                s+='\n'
-            s+=printdata(x,ntabs+1)
-            first=False
-        if '\n' in s: 
-            s='[\n'+s+'\n'+']'
+                yield '\n'
+                seen_nl = True
         else:
-            s='['+s+']'
-        return s
-    else:
-        if data=='infinity':
-            return '"infinity"'
-        if '"' in str(data) and not isinstance(data,str):
-            print("Unexpected type: "+str)
-
-        if isinstance(data,str) and ('\n' in data or '}' in data or ']' in data or ',' in data or '"' in data or "'" in data or ':' in data or '//' in data):
-            if '"' in data:
-                return '"""'+data+'"""'
-            else:
-                return '"'+data+'"'
-        elif isinstance(data,str) and data.strip()=='':
-            return "'"+data+"'"
+            key, x = item
+            if not first:
+                yield '\n'
+            if type(x)==dict or type(x)==list:
+                yield '\n'
+            yield key+': '
+
+        frame[2] = False
+        if is_container(x):
+            frame[3] = seen_nl or multiline[id(x)]
+            stack.append((yield from open_container(x)))
         else:
-            return strcons_fix(data)
+            text = printscalar(x)
+            frame[3] = seen_nl or '\n' in text
+            yield text
 
 
 #utility functions
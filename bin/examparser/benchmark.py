@@ -0,0 +1,158 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Time ExamParser.parse on synthetic .exam files of increasing size, to check that parsing time grows linearly.
+# With --migrations, time migrating the parsed exams to the latest version, applying each migration in turn and in a single pass, and check that both give the same result.
+# Run from the bin directory with: python -m examparser.benchmark
+
+from . import ExamParser, printdata
+from .migrations import migrate, migrations
+from collections import OrderedDict
+import copy
+import gc
+import json
+from optparse import OptionParser
+import time
+
+
+def make_part(n, gaps=0):
+    part = OrderedDict([
+        ('type', 'gapfill' if gaps else 'numberentry'),
+        ('prompt', '<p>Part %i: what is {a}+{b}? Write your answer, then press "submit".</p>' % n),
+        ('marks', 1),
+        ('minvalue', 'a+b-0.5'),
+        ('maxvalue', 'a+b+0.5'),
+        ('scripts', OrderedDict([('mark', 'question.marks = 1;\n// full marks\n')])),
+    ])
+    if gaps:
+        part['gaps'] = [make_part(i) for i in range(gaps)]
+    return part
+
+
+def make_question(n, parts=3, gaps=2):
+    return OrderedDict([
+        ('name', 'Question %i' % n),
+        ('statement', '<p>Let $a = {a}$ and $b = {b}$: here\'s a question, with "quotes" and a // comment-like string.</p>'),
+        ('advice', 'Add them up.\nThat\'s all.'),
+        ('variables', OrderedDict([('a', 'random(1..10)'), ('b', 'random(1..10 except a)')])),
+        ('variable_groups', OrderedDict()),
+        ('parts', [make_part(i, gaps=gaps if i % 2 == 0 else 0) for i in range(parts)]),
+    ])
+
+
+def make_exam_data(questions, parts=3, gaps=2):
+    """
+        A synthetic exam, as it's parsed from the .exam format, with the given number of questions, parts per question and gaps per gap-fill part.
+    """
+    return OrderedDict([
+        ('name', 'Synthetic exam'),
+        ('duration', 0),
+        ('percentpass', 50),
+        ('navigation', OrderedDict([('allowregen', True), ('reverse', True), ('browse', True)])),
+        ('questions', [make_question(i, parts=parts, gaps=gaps) for i in range(questions)]),
+    ])
+
+
+def make_exam(questions, parts=3, gaps=2):
+    """
+        The source of a synthetic exam in the .exam format, with the given number of questions, parts per question and gaps per gap-fill part.
+    """
+    return exam_source(make_exam_data(questions, parts=parts, gaps=gaps))
+
+
+def exam_source(data):
+    return '// A synthetic exam\n' + printdata(data) + '\n'
+
+
+def time_parse(source, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ExamParser().parse(source)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def migrate_sequentially(data, version):
+    """
+        Apply each migration in turn, walking the whole exam once per migration.
+    """
+    class MigrationTarget:
+        pass
+    target = MigrationTarget()
+    target.data = data
+    while version in migrations:
+        version = migrations[version](target)
+    return version
+
+
+def time_migrate(data, migrate_fn, repeats=3):
+    best = None
+    for _ in range(repeats):
+        copied = copy.deepcopy(data)
+        # Like timeit, turn off the garbage collector while timing, so that collections triggered by the copy don't land in the measurement.
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            version = migrate_fn(copied, '1')
+            t = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = t if best is None else min(best, t)
+    return best, version, copied
+
+
+def run_migrations(sizes, repeats):
+    print('{:>10} {:>14} {:>14} {:>8}'.format('questions', 'in turn (s)', 'one pass (s)', 'speedup'))
+    for n in sizes:
+        data = ExamParser().parse(make_exam(n))
+        t_seq, v_seq, d_seq = time_migrate(data, migrate_sequentially, repeats)
+        t_fused, v_fused, d_fused = time_migrate(data, migrate, repeats)
+        if v_seq != v_fused or json.dumps(d_seq) != json.dumps(d_fused):
+            raise Exception('Migrating in a single pass gave a different result to migrating in turn, for an exam with %i questions' % n)
+        print('{:>10} {:>14.4f} {:>14.4f} {:>8.2f}'.format(n, t_seq, t_fused, t_seq/t_fused))
+
+
+def run():
+    parser = OptionParser(usage="usage: python -m examparser.benchmark [options]")
+    parser.add_option('--sizes',
+                      dest='sizes',
+                      default='10,20,40,80,160,320',
+                      help='Comma-separated numbers of questions in each synthetic exam')
+    parser.add_option('--repeats',
+                      dest='repeats',
+                      type='int',
+                      default=3,
+                      help='Number of times to parse each exam; the fastest time is reported')
+    parser.add_option('--migrations',
+                      dest='migrations',
+                      action='store_true',
+                      default=False,
+                      help='Time migrating the exams instead of parsing them')
+    (options, args) = parser.parse_args()
+
+    if options.migrations:
+        run_migrations([int(x) for x in options.sizes.split(',')], options.repeats)
+        return
+
+    print('{:>10} {:>12} {:>10} {:>12}'.format('questions', 'bytes', 'seconds', 'us per KB'))
+    for n in [int(x) for x in options.sizes.split(',')]:
+        source = make_exam(n)
+        t = time_parse(source, options.repeats)
+        print('{:>10} {:>12} {:>10.4f} {:>12.2f}'.format(n, len(source), t, t*1e6/(len(source)/1024)))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,155 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Parsed and migrated exams stored on disk, so that an exam which hasn't changed since it was last compiled doesn't have to be parsed and migrated again.
+#
+# Entries are keyed by a hash of the source and the latest migration, so they're ignored once a new migration is added.
+# Each entry is the version and data of the exam, encoded as JSON and compressed.
+# Entries are never unpickled or executed, so nobody who can write to the cache directory can run code in the compiler.
+# When the cache gets bigger than its size limit, the least recently used entries are deleted.
+
+from .migrations import migration_head
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import zlib
+
+# Change this if the format of the entries, or the output of the parser, changes.
+CACHE_FORMAT = '2'
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# The total size of the entries in each cache directory, as far as this process knows.
+# The directory is only scanned when this passes the size limit, and the first time an entry is added to it.
+_sizes = {}
+_sizes_lock = threading.Lock()
+
+
+class ExamCache(object):
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        self.path = Path(path)
+        self.max_size = max_size
+
+    def key(self, source):
+        h = hashlib.sha256()
+        h.update(CACHE_FORMAT.encode('utf-8'))
+        h.update(b'\0')
+        h.update(migration_head().encode('utf-8'))
+        h.update(b'\0')
+        h.update(source.encode('utf-8'))
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return self.path / key[:2] / key
+
+    def get(self, source):
+        """
+            The ``(version, data)`` stored for the given source, or ``None``.
+        """
+        path = self.entry_path(self.key(source))
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            version, data = entry['version'], entry['data']
+        except (OSError, zlib.error, ValueError, TypeError, KeyError):
+            return None
+
+        # Mark the entry as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return version, data
+
+    def set(self, source, version, data):
+        path = self.entry_path(self.key(source))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            out = zlib.compress(json.dumps({'version': version, 'data': data}).encode('utf-8'), 1)
+        except (TypeError, ValueError):
+            return
+        # Write to a temporary file and rename it into place, so that other processes never see a partly-written entry.
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(out)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+
+        self.add_size(len(out))
+
+    def add_size(self, size):
+        """
+            Count a new entry towards the size of the cache, and evict old entries if that takes it over ``max_size``.
+        """
+        key = str(self.path.resolve())
+        with _sizes_lock:
+            if key not in _sizes:
+                _sizes[key] = self.scan()[1]
+            else:
+                _sizes[key] += size
+            if _sizes[key] <= self.max_size:
+                return
+            _sizes[key] = self.evict()
+
+    def scan(self):
+        """
+            A list of ``(last used time, size, path)`` for each entry in the cache, and their total size.
+        """
+        entries = []
+        total = 0
+        try:
+            subdirs = list(os.scandir(self.path))
+        except OSError:
+            return entries, total
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            try:
+                for entry in os.scandir(subdir.path):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+            except OSError:
+                continue
+        return entries, total
+
+    def evict(self):
+        """
+            Delete the least recently used entries until the cache is no bigger than ``max_size``.
+            Returns the size of the cache afterwards.
+        """
+        entries, total = self.scan()
+        if total <= self.max_size:
+            return total
+
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_size:
+                break
+        return total
@@ -0,0 +1,65 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Report all of the syntax errors in some .exam files, rather than stopping at the first one.
+# Run from the bin directory with: python -m examparser.lint file.exam [file.exam ...]
+
+from . import ExamParser
+from .numbasobject import NUMBAS_FILE_PREFIX
+import json
+import sys
+
+
+def find_errors(source):
+    """
+        Parse the source in recovery mode, and return the list of syntax errors found.
+    """
+    parser = ExamParser(recover=True)
+    parser.parse(source)
+    return parser.errors
+
+
+def run():
+    paths = sys.argv[1:]
+    if not paths:
+        print('usage: python -m examparser.lint file.exam [file.exam ...]')
+        return
+
+    failed = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            source = f.read().replace('\ufeff','')
+        if source.startswith(NUMBAS_FILE_PREFIX):
+            # Versioned files are JSON, after the first line.
+            try:
+                json.loads(source.partition('\n')[2])
+            except ValueError as err:
+                failed += 1
+                print('%s:%s:%s: %s' % (path, err.lineno+1, err.colno, err.msg))
+            continue
+
+        errors = find_errors(source)
+        if errors:
+            failed += 1
+        for err in errors:
+            msg = '%s:%s:%s: %s' % (path, err.line, err.column, err.message)
+            if err.hint:
+                msg += ' (possible fix: %s)' % err.hint
+            print(msg)
+
+    if failed:
+        exit(1)
+
+if __name__ == '__main__':
+    run()
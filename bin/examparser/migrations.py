@@ -1,5 +1,8 @@
 from functools import wraps
 
+# Each migration records the level it applies at, and the function it applies there, so that the planner can run a chain of migrations in a single pass over an exam.
+# Exam-level migrations may change the exam's own settings and move its list of questions, but mustn't look inside the questions.
+# Question- and part-level migrations must only change the question or part they're given.
 migrations = {}
 def migration(version_from):
     def migration_decorator(f):
@@ -10,6 +13,9 @@ def migration(version_from):
                 data['type'] = 'exam' if 'navigation' in data else 'question'
             f(data)
             return f.__name__
+        if not hasattr(do_migration, 'level'):
+            do_migration.level = 'exam'
+            do_migration.hook = f
         migrations[version_from] = do_migration
         return do_migration
     return migration_decorator
@@ -26,6 +32,8 @@ def question_migration(f):
                 f(question)
         elif data.get('type')=='question':
             f(data)
+    do_migration.level = 'question'
+    do_migration.hook = f
     return do_migration
 
 def part_migration(f):
@@ -41,8 +49,111 @@ def part_migration(f):
                 if 'gaps' in part:
                     for gap in part['gaps']:
                         f(gap)
+    do_migration.level = 'part'
+    do_migration.hook = f
     return do_migration
 
+def migration_chain(version):
+    """
+        The list of migrations to apply to an object with the given version, in order, and the version it ends up at.
+    """
+    chain = []
+    while version in migrations:
+        chain.append(migrations[version])
+        version = migrations[version].__name__
+    return chain, version
+
+def migration_head():
+    """
+        The version that an object ends up at once every migration has been applied.
+    """
+    return migration_chain('1')[1]
+
+def part_pass(hooks):
+    """
+        A function which applies a run of part migrations to a question, in one pass over its parts.
+    """
+    def apply(question):
+        if 'parts' in question:
+            for part in question['parts']:
+                # Each hook sees the part after the previous hooks have changed it, and then its steps and gaps, as part_migration would.
+                for hook in hooks:
+                    hook(part)
+                    if 'steps' in part:
+                        for step in part['steps']:
+                            hook(step)
+                    if 'gaps' in part:
+                        for gap in part['gaps']:
+                            hook(gap)
+    return apply
+
+def plan_question_migrations(chain):
+    """
+        Turn a list of question- and part-level migrations into a list of functions to apply to each question, in order.
+    """
+    plan = []
+    for m in chain:
+        if m.level == 'question':
+            plan.append(m.hook)
+        elif plan and isinstance(plan[-1], list):
+            plan[-1].append(m.hook)
+        else:
+            plan.append([m.hook])
+    return [part_pass(step) if isinstance(step, list) else step for step in plan]
+
+def apply_question_migrations(questions, chain):
+    plan = plan_question_migrations(chain)
+    for question in questions:
+        for step in plan:
+            step(question)
+
+def migrate(data, version):
+    """
+        Apply all of the migrations from the given version to the data, in a single pass over its questions and parts.
+        The result is the same as applying each migration in turn.
+
+        Returns the version the data ends up at.
+    """
+    chain, version = migration_chain(version)
+    if not chain:
+        return version
+
+    if not data.get('type'):
+        data['type'] = 'exam' if 'navigation' in data else 'question'
+
+    if data.get('type')=='exam':
+        # Exam-level migrations run straight away; the rest are saved up and run in one pass over the questions.
+        # If an exam-level migration replaces the list of questions, the saved migrations are run on the old list first.
+        questions = None
+        pending = []
+        for m in chain:
+            if m.level == 'exam':
+                m.hook(data)
+            else:
+                current = data.setdefault('questions',[])
+                if current is not questions:
+                    apply_question_migrations(questions or [], pending)
+                    questions = current
+                    pending = []
+                pending.append(m)
+        apply_question_migrations(questions or [], pending)
+
+    else:
+        i = 0
+        while i < len(chain):
+            if chain[i].level == 'exam':
+                chain[i].hook(data)
+                i += 1
+            else:
+                j = i
+                while j < len(chain) and chain[j].level != 'exam':
+                    j += 1
+                if data.get('type')=='question':
+                    apply_question_migrations([data], chain[i:j])
+                i = j
+
+    return version
+
 @migration('1')
 def exam_or_question(data):
     if not data.get('type'):
@@ -1,7 +1,7 @@
 # Load an exam from a source file, migrating it to the latest version if necessary.
 
 from . import ExamParser
-from .migrations import migrations
+from .migrations import migrate
 import json
 
 NUMBAS_FILE_PREFIX = '// Numbas version: '
@@ -15,18 +15,21 @@ class VersionError(Exception):
 class NumbasObject:
     version = '1'
 
-    def __init__(self,source=None,data=None,version='1'):
+    def __init__(self,source=None,data=None,version='1',cache=None):
+        """
+            ``cache`` is an :class:`examparser.cache.ExamCache`, used to avoid parsing and migrating a source which has been loaded before.
+        """
         if data is not None:
             self.set_data(data,version)
         elif source:
-            self.from_source(source)
+            self.from_source(source,cache=cache)
     
     def set_data(self,data,version):
         self.data = data
         self.version = version
         self.migrate_data()
 
-    def from_source(self,source):
+    def from_source(self,source,cache=None):
         self.source = source
         try:
             if not isinstance(source,unicode):
@@ -38,6 +41,12 @@ class NumbasObject:
         if len(source)==0:
             raise Exception("Empty source string")
 
+        if cache is not None:
+            cached = cache.get(source)
+            if cached is not None:
+                self.version, self.data = cached
+                return
+
         # Files with version numbers have a line of the format     
         # // Numbas version: <version string> 
         # at the start, and are encoded in JSON. Older files have no version number and are in the .exam format
@@ -55,9 +64,11 @@ class NumbasObject:
         self.version, self.data = version,data
         self.migrate_data()
 
+        if cache is not None:
+            cache.set(source,self.version,self.data)
+
     def migrate_data(self):
-        while self.version in migrations:
-            self.version = migrations[self.version](self)
+        self.version = migrate(self.data, self.version)
 
     def __str__(self):
         return '%s%s\n%s' % (NUMBAS_FILE_PREFIX,self.version,json.dumps(self.data))
@@ -0,0 +1,161 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Work out which optional features of the runtime an exam uses: part types, diagnostic mode and attempt data download.
+
+    Each feature is provided by some scripts. The scripts for features which aren't used can be left out of the package, along with anything only they depend on.
+"""
+
+import re
+
+
+# The scripts providing each built-in part type, and the name of its marking script.
+PART_TYPES = {
+    'jme': (['parts/jme', 'display/parts/jme'], 'jme'),
+    'patternmatch': (['parts/patternmatch', 'display/parts/patternmatch'], 'patternmatch'),
+    'numberentry': (['parts/numberentry', 'display/parts/numberentry'], 'numberentry'),
+    'matrix': (['parts/matrixentry', 'display/parts/matrix'], 'matrixentry'),
+    '1_n_2': (['parts/multipleresponse', 'display/parts/multipleresponse'], 'multipleresponse'),
+    'm_n_2': (['parts/multipleresponse', 'display/parts/multipleresponse'], 'multipleresponse'),
+    'm_n_x': (['parts/multipleresponse', 'display/parts/multipleresponse'], 'multipleresponse'),
+    'gapfill': (['parts/gapfill', 'display/parts/gapfill'], 'gapfill'),
+    'information': (['parts/information', 'display/parts/information'], None),
+    'extension': (['parts/extension', 'display/parts/extension'], None),
+}
+
+CUSTOM_PART_TYPE_SCRIPTS = ['parts/custom_part_type', 'display/parts/custom']
+
+DIAGNOSTIC_SCRIPTS = ['diagnostic', 'diagnostic_scripts']
+
+ATTEMPT_DOWNLOAD_SCRIPTS = ['analysis-display', 'download', 'csv']
+
+# Scripts which aren't needed to show the front page of an exam, and the names of the files they're put in when the scripts are split into chunks.
+# The loader fetches a chunk the first time one of its scripts is asked for.
+DEFERRED_CHUNKS = [
+    ('analysis', ['analysis-display']),
+    ('download', ['download']),
+    ('csv', ['csv']),
+    ('diagnostic', DIAGNOSTIC_SCRIPTS),
+]
+
+
+def get(d, key, default=None):
+    """
+        Get an item from a dictionary, ignoring the case of the key, as the runtime does when it loads an exam.
+    """
+    if key in d:
+        return d[key]
+    key = key.lower()
+    for k, v in d.items():
+        if k.lower() == key:
+            return v
+    return default
+
+
+def all_parts(parts):
+    """
+        Every part in a list of parts, including steps and gaps.
+    """
+    for part in parts or []:
+        if not isinstance(part, dict):
+            continue
+        yield part
+        yield from all_parts(get(part, 'steps'))
+        yield from all_parts(get(part, 'gaps'))
+
+
+class ExamFeatures(object):
+    def __init__(self, exam):
+        navigation = get(exam, 'navigation', {}) or {}
+        diagnostic = get(exam, 'diagnostic', {}) or {}
+
+        self.custom_part_types = {cpt.get('short_name') for cpt in get(exam, 'custom_part_types', []) or []}
+        # The runtime loads a knowledge graph if there's one, even if the exam isn't in diagnostic mode. An empty object still counts, as it does in Javascript.
+        self.diagnostic = get(navigation, 'navigatemode') == 'diagnostic' or get(diagnostic, 'knowledge_graph') not in (None, False, '')
+        self.attempt_download = bool(get(navigation, 'allowAttemptDownload'))
+
+        questions = list(get(exam, 'questions', []) or [])
+        for group in get(exam, 'question_groups', []) or []:
+            questions += get(group, 'questions', []) or []
+        if get(exam, 'type') == 'question':
+            questions.append(exam)
+
+        self.part_types = set()
+        for question in questions:
+            for part in all_parts(get(question, 'parts')):
+                if get(part, 'type'):
+                    self.part_types.add(get(part, 'type'))
+
+    @property
+    def uses_custom_part_types(self):
+        return bool(self.custom_part_types) or any(t not in PART_TYPES for t in self.part_types)
+
+    def feature_scripts(self):
+        """
+            All of the scripts which are only needed for some features.
+        """
+        scripts = set(CUSTOM_PART_TYPE_SCRIPTS + DIAGNOSTIC_SCRIPTS + ATTEMPT_DOWNLOAD_SCRIPTS)
+        for part_scripts, _ in PART_TYPES.values():
+            scripts.update(part_scripts)
+        return scripts
+
+    def used_scripts(self):
+        """
+            The scripts for the features this exam uses.
+        """
+        scripts = set()
+        for t in self.part_types:
+            if t in PART_TYPES:
+                scripts.update(PART_TYPES[t][0])
+        if self.uses_custom_part_types:
+            scripts.update(CUSTOM_PART_TYPE_SCRIPTS)
+        if self.diagnostic:
+            scripts.update(DIAGNOSTIC_SCRIPTS)
+        if self.attempt_download:
+            scripts.update(ATTEMPT_DOWNLOAD_SCRIPTS)
+        return scripts
+
+    def excluded_scripts(self):
+        return self.feature_scripts() - self.used_scripts()
+
+    def extension_scripts(self, text):
+        """
+            The feature scripts that an extension or a question's own scripts, with the given code, might use without declaring them as dependencies.
+            An extension which registers an answer widget or works with parts could need any of the part types, so they're all kept.
+        """
+        if any(s in text for s in ('register_custom_widget', 'Numbas.parts', 'partConstructors')):
+            scripts = set(CUSTOM_PART_TYPE_SCRIPTS)
+            for part_scripts, _ in PART_TYPES.values():
+                scripts.update(part_scripts)
+            return scripts
+        return set()
+
+    def marking_scripts(self, names, texts):
+        """
+            The built-in marking scripts this exam needs, out of ``names``.
+
+            As well as the marking scripts for the part types used, a custom marking algorithm can run any marking script with ``apply_marking_script``,
+            so if that's used in any of ``texts``, every marking script whose name appears in quotes is kept.
+            If any of ``texts`` might create parts of any type, every marking script is kept.
+        """
+        if any(self.extension_scripts(text) for text in texts):
+            return list(names)
+        used = {PART_TYPES[t][1] for t in self.part_types if t in PART_TYPES}
+        if any('apply_marking_script' in text for text in texts):
+            for name in names:
+                pattern = re.compile(r'''\\?['"]{}\\?['"]'''.format(re.escape(name)))
+                if any(pattern.search(text) for text in texts):
+                    used.add(name)
+        return [name for name in names if name in used]
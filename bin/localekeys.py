@@ -0,0 +1,94 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Work out which translation keys are used by the files in a package, so that the others can be left out of locale.js.
+
+    Keys are looked up in lots of different ways: ``R('key')``, ``data-localise="key"``, ``<localise>key</localise>``, ``new Numbas.Error('key')``,
+    the JME function ``translate("key")``, and ``R(name)`` where ``name`` holds a string defined somewhere else.
+    So rather than trying to find the calls, a key is kept if it's the whole of a string literal or the text of an element anywhere in the package.
+    The text of the package is scanned once to find these, and each key is looked up in the results.
+
+    Some keys are built up at run time, such as ``R('question.score feedback.' + key)``.
+    Any string literal followed by a ``+``, or the start of a template literal before the first ``${``, is treated as a prefix, and every key starting with it is kept.
+
+    This errs on the side of keeping keys: a key that isn't needed costs a few bytes, but a missing key shows the student a raw key instead of a message.
+"""
+
+import re
+
+
+# i18next looks up keys with these suffixes for plurals and counts, so they're kept whenever the key without the suffix is.
+re_plural_suffix = re.compile(r'_(?:plural|zero|one|two|few|many|other|\d+)$')
+
+# Translations can refer to other translations with $t(key) or $t(key, options).
+re_nested = re.compile(r'\$t\(([^,)]+)')
+
+
+def key_patterns(keys):
+    """
+        Regular expressions finding the strings in a text which could be keys, and the prefixes of keys built at run time.
+        Each has a group called ``key``.
+        Only the characters used in ``keys`` are matched, so a stray apostrophe in some prose doesn't swallow the strings after it.
+        Each expression starts with a single character, so the regular expression engine can quickly skip to the places where it might match.
+    """
+    chars = '[{}]'.format(''.join(re.escape(c) for c in sorted(set(''.join(keys)))))
+    strings = [
+        # Every quote is tried as the start of a string, so strings inside other strings, such as in data-bind="text: R('key')", are found too.
+        # The closing quote can be escaped, for strings inside JSON or other string literals.
+        r"""(['"`])(?=(?P<key>{chars}+)\\?\1)""",
+        r""">\s*(?P<key>{chars}+?)\s*<""",
+    ]
+    prefixes = [
+        r"""(['"])(?=(?P<key>{chars}+)\\?\1\s*\+)""",
+        r"""`(?P<key>{chars}+)\$\{{""",
+    ]
+    return [re.compile(p.format(chars=chars)) for p in strings], [re.compile(p.format(chars=chars)) for p in prefixes]
+
+
+def used_keys(keys, texts):
+    """
+        The subset of ``keys`` which might be used by the given texts.
+    """
+    keys = set(keys)
+    if not keys:
+        return set()
+    corpus = '\n'.join(texts)
+    string_patterns, prefix_patterns = key_patterns(keys)
+    strings = {m.group('key') for pattern in string_patterns for m in pattern.finditer(corpus)}
+    prefixes = tuple({m.group('key') for pattern in prefix_patterns for m in pattern.finditer(corpus) if m.group('key').strip()})
+
+    def used(key):
+        base = re_plural_suffix.sub('', key)
+        return any(k in strings or k.startswith(prefixes) for k in {key, base})
+
+    return {key for key in keys if used(key)}
+
+
+def prune_translations(translations, keys):
+    """
+        Keep only the translations for the given keys, along with any translations they refer to.
+    """
+    keep = set()
+    stack = [key for key in keys if key in translations]
+    while stack:
+        key = stack.pop()
+        if key in keep:
+            continue
+        keep.add(key)
+        value = translations[key]
+        if isinstance(value, str):
+            stack += [k.strip() for k in re_nested.findall(value) if k.strip() in translations]
+
+    return {key: value for key, value in translations.items() if key in keep}
@@ -0,0 +1,260 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Run minifiers over the files in a package.
+
+    Minifiers are normally run once per file: the file's contents are written to the minifier's stdin, and the minified output is read from its stdout.
+
+    Alternatively, a minifier can be started once and kept running as a persistent worker.
+    It's then sent one file after another using a simple framed protocol over stdin and stdout:
+
+    * request: a 4-byte big-endian length, followed by that many bytes of UTF-8 encoded input.
+    * response: a status byte (0 for success, anything else for failure), a 4-byte big-endian length,
+      and that many bytes of UTF-8 encoded output, or an error message if the status is not 0.
+
+    Minified output can be cached on disk, keyed by a hash of the input and the minifier's command line.
+"""
+
+import atexit
+import hashlib
+import os
+from pathlib import Path
+import struct
+import subprocess
+import tempfile
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class MinifyError(Exception):
+    def __init__(self, message):
+        super(MinifyError, self).__init__()
+        self.message = message
+    def __str__(self):
+        return self.message
+
+
+class MinifierWorker(object):
+    """
+        A minifier process which is kept running, and sent files using the framed protocol.
+    """
+    def __init__(self, command):
+        self.command = command
+        self.lock = threading.Lock()
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([self.command], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read_exactly(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.process.stdout.read(n - len(data))
+            if not chunk:
+                raise MinifyError('The minifier %s stopped unexpectedly' % self.command)
+            data += chunk
+        return data
+
+    def minify(self, data):
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            try:
+                self.process.stdin.write(struct.pack('>I', len(data)) + data)
+                self.process.stdin.flush()
+                status, length = struct.unpack('>BI', self.read_exactly(5))
+                out = self.read_exactly(length)
+            except (OSError, MinifyError):
+                self.close()
+                raise MinifyError('The minifier %s stopped unexpectedly' % self.command)
+            if status != 0:
+                raise MinifyError(out.decode('utf-8', errors='replace'))
+            return out
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+def get_worker(command):
+    """
+        The persistent worker for the given minifier command, shared by every compilation in this process.
+    """
+    with _workers_lock:
+        if command not in _workers:
+            _workers[command] = MinifierWorker(command)
+        return _workers[command]
+
+@atexit.register
+def close_workers():
+    for worker in _workers.values():
+        worker.close()
+
+
+class MinifyCache(object):
+    """
+        Minified outputs stored on disk, keyed by a hash of the input and the minifier command.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def key(self, command, data):
+        return self.key_chunks(command, [data])
+
+    def key_chunks(self, command, chunks):
+        h = hashlib.sha256()
+        h.update(command.encode('utf-8'))
+        h.update(b'\0')
+        for chunk in chunks:
+            h.update(chunk)
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return self.path / key[:2] / key
+
+    def get(self, key):
+        try:
+            return self.entry_path(key).read_bytes()
+        except OSError:
+            return None
+
+    def set(self, key, out):
+        self.set_chunks(key, [out])
+
+    def set_chunks(self, key, chunks):
+        path = self.entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename it into place, so that other processes never see a partly-written entry.
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+def run_minifier(command, data, persistent=False):
+    """
+        Minify ``data`` (bytes) with the given minifier command, and return the output.
+    """
+    if persistent:
+        return get_worker(command).minify(data)
+
+    p = subprocess.Popen([command], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate(data)
+    if p.returncode != 0:
+        raise MinifyError(err.decode('utf-8', errors='replace'))
+    return out
+
+
+def minify(command, data, cache=None, persistent=False):
+    """
+        Minify ``data`` (bytes) with the given minifier command, using the cache if given.
+    """
+    if cache is not None:
+        key = cache.key(command, data)
+        out = cache.get(key)
+        if out is not None:
+            return out
+
+    out = run_minifier(command, data, persistent=persistent)
+
+    if cache is not None:
+        cache.set(key, out)
+
+    return out
+
+
+def run_minifier_stream(command, chunks, out):
+    """
+        Minify the data in the sequence ``chunks`` of bytes with the given minifier command,
+        writing the output to the file-like object ``out`` as it's produced.
+    """
+    p = subprocess.Popen([command], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # The input and the error output are dealt with in separate threads, so the minifier never blocks waiting for one while its output is read.
+    def feed():
+        try:
+            for chunk in chunks:
+                p.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    errors = []
+    feeder = threading.Thread(target=feed)
+    error_reader = threading.Thread(target=lambda: errors.append(p.stderr.read()))
+    feeder.start()
+    error_reader.start()
+
+    while True:
+        chunk = p.stdout.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        out.write(chunk)
+
+    feeder.join()
+    error_reader.join()
+    p.wait()
+    if p.returncode != 0:
+        raise MinifyError(errors[0].decode('utf-8', errors='replace'))
+
+
+def minify_stream(command, source, out, cache=None):
+    """
+        Like :func:`minify`, but without holding the input or output in memory all at once.
+        ``source`` is a function returning the input as a sequence of chunks of bytes - it's called twice if there's a cache - and the output is written to ``out``,
+        which must have a ``write`` method and, if there's a cache, a ``chunks`` method.
+    """
+    if cache is not None:
+        key = cache.key_chunks(command, source())
+        try:
+            f = open(cache.entry_path(key), 'rb')
+        except OSError:
+            f = None
+        if f is not None:
+            with f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            return
+
+    run_minifier_stream(command, source(), out)
+
+    if cache is not None:
+        cache.set_chunks(key, out.chunks())
@@ -15,23 +15,40 @@
 #   limitations under the License.
 
 
+import assetnames
+from buildcache import BuildCache
+from buildmanifest import BuildManifest, hash_chunks, hash_file, source_stamp
+import buildprofile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+import copy
 import datetime
+import examparser
+import features
+from examparser.cache import ExamCache
 from examparser.numbasobject import NumbasObject
-import io
 from itertools import count
 import jinja2
 import json
+import localekeys
+import minify
+import objectstore
+import outputsink
 from optparse import OptionParser
 import os
 from pathlib import Path, PurePath
+import precompress
+import scriptgraph
 import shutil
-import subprocess
+import spooltext
 import sys
+import themebundle
+import themetemplates
+import thinpackage
 import traceback
 import xml.etree.ElementTree as etree
 import xml2js
-import zipfile
-from zipfile import ZipFile, ZipInfo
+import zipwriter
 
 
 NUMBAS_VERSION = '10.0'
@@ -71,19 +88,38 @@ class CompileError(Exception):
 
 class NumbasCompiler(object):
     exam = None
-    minify_extensions = {}
-    themepaths = []
     build_time = None
-    files = {}
-    custom_part_types = []
-    resources = []
-    extensions = []
     xmls = ''
     question_xslt = ''
     part_xslt = ''
 
-    def __init__(self, options):
+    def __init__(self, options, cache=None):
+        """
+            ``cache`` is a :class:`buildcache.BuildCache` holding files which have already been read, shared between compilations in a long-running process.
+            If not given, a new cache is created for this compilation.
+        """
         self.options = options
+        self.cache = cache if cache is not None else BuildCache()
+
+        # Every compilation has its own copies of these, so that nothing leaks between jobs when a compiler is run in a long-running process.
+        self.files = {}
+        self.themepaths = []
+        self.custom_part_types = []
+        self.resources = []
+        self.extensions = []
+        self.extension_data = {}
+
+        # Scripts in the package which shouldn't be bundled into the main script file.
+        self.unbundled_files = set()
+
+        # The features of the runtime used by the exam, if only those are to be included.
+        self.features = None
+
+        # Generated files are moved to disk once they take up more than this much memory.
+        self.memory_budget = spooltext.MemoryBudget(self.options.memory_budget * 1024 * 1024 if self.options.memory_budget else None)
+
+        # The time, memory and output of each phase of the compilation, if they're to be recorded.
+        self.profile = buildprofile.Profile(enabled=bool(self.options.profile))
 
         self.get_themepaths()
 
@@ -93,13 +129,25 @@ class NumbasCompiler(object):
         }
 
     def get_themepaths(self):
+        self.theme_bundle = None
+        if themebundle.is_bundle(self.options.theme):
+            # A theme bundle already contains everything from the themes it inherits from.
+            path = Path(self.options.theme)
+            try:
+                self.theme_bundle = self.cache.get(('theme-bundle', path), lambda: (themebundle.ThemeBundle.load(path), [path]))
+            except themebundle.BundleError as err:
+                raise CompileError(str(err))
+            if self.theme_bundle.numbas_version != NUMBAS_VERSION:
+                raise CompileError("The theme bundle {} was made by Numbas {}, but this is Numbas {}.".format(path, self.theme_bundle.numbas_version, NUMBAS_VERSION))
+            self.themepaths = []
+            return
+
         self.themepaths = [self.options.theme]
         for theme, i in zip(self.themepaths, count()):
             theme = self.themepaths[i] = self.get_theme_path(theme)
             inherit_file = theme / 'inherit.txt'
             if inherit_file.exists():
-                with open(inherit_file) as ifile:
-                    self.themepaths += ifile.read().splitlines()
+                self.themepaths += self.cache.read_text(inherit_file).splitlines()
 
         self.themepaths.reverse()
 
@@ -127,75 +175,241 @@ class NumbasCompiler(object):
             },
         }
 
+        if self.theme_bundle is not None:
+            self.theme_options = copy.deepcopy(self.theme_bundle.options)
+            return
+
         for themepath in self.themepaths:
             options_path = themepath / 'numbas-theme.json'
             if options_path.exists():
-                with open(options_path) as f:
-                    d = json.load(f)
+                d = self.cache.load_json(options_path)
 
                 for k,v in d.items():
                     self.theme_options.get(k,{}).update(v)
 
     def compile(self):
-        if not self.options.generic:
-            self.parse_exam()
+        self.profile.start()
+        try:
+            with self.phase('compile'):
+                if self.options.runtime:
+                    self.compile_thin()
+                else:
+                    self.compile_package()
+        finally:
+            self.profile.stop()
+            if self.options.profile:
+                self.profile.write(self.options.profile, numbas_version=NUMBAS_VERSION, output=self.options.output, theme=self.options.theme)
+
+    def phase(self, name):
+        """
+            A context manager for one phase of the compilation, recorded in the profile if there is one.
+            The bytes produced by a phase are the sizes of the files it generates.
+            Files copied from disk, and files which are only moved to a different path, weren't produced by the phase, so don't count.
+        """
+        if not self.profile.enabled:
+            return nullcontext()
+        return self._phase(name)
 
-        self.build_time = datetime.datetime.now()
+    @contextmanager
+    def _phase(self, name):
+        with self.profile.phase(name):
+            # Keep hold of the files, so that the id of a file made during the phase can't be the same as one of these.
+            before = {id(src): src for src in self.files.values()}
+            yield
+            for src in self.files.values():
+                if not isinstance(src, Path) and id(src) not in before:
+                    self.profile.add_bytes(src.size)
 
-        self.load_theme_options()
+    def compile_package(self):
+        self.build_time = self.get_build_time()
 
-        files = self.files = self.collect_files()
+        for name, step in self.package_steps():
+            self.run_step(name, step)
 
-        self.render_templates()
+        self.write_package()
+
+    def run_step(self, name, step):
+        """
+            Run one step of the compilation.
+        """
+        with self.phase(name):
+            step()
 
-        self.make_xml()
-        files[PurePath('.', 'settings.js')] = io.StringIO(self.xmls)
+    def package_steps(self):
+        """
+            The steps of compiling a package, in the order they're run, as a list of pairs ``(name, function)``.
+        """
+        def parse_exam():
+            self.parse_exam()
+            if self.options.tree_shake or self.options.split_scripts:
+                self.features = features.ExamFeatures(self.exam)
 
-        files[PurePath('.', 'marking_scripts.js')] = io.StringIO(self.collect_marking_scripts())
-        files[PurePath('.', 'diagnostic_scripts.js')] = io.StringIO(self.collect_diagnostic_scripts())
+        def collect_files():
+            self.files = self.collect_files()
+            if self.options.source_url:
+                self.files[PurePath('.', 'downloaded-from.txt')] = self.spooled(self.options.source_url)
 
-        if self.options.source_url:
-            files[PurePath('.', 'downloaded-from.txt')] = io.StringIO(self.options.source_url)
+        def make_xml():
+            self.make_xml()
+            self.files[PurePath('.', 'settings.js')] = self.spooled(self.xmls)
 
-        self.make_locale_file()
+        def collect_marking_scripts():
+            self.files[PurePath('.', 'marking_scripts.js')] = self.spooled(self.collect_marking_scripts())
+            self.files[PurePath('.', 'diagnostic_scripts.js')] = self.spooled(self.collect_diagnostic_scripts())
 
+        steps = []
         if not self.options.generic:
-            self.add_source()
+            steps.append(('parse_exam', parse_exam))
+        steps += [
+            ('load_theme_options', self.load_theme_options),
+            ('collect_files', collect_files),
+            ('render_templates', self.render_templates),
+            ('make_xml', make_xml),
+            ('collect_marking_scripts', collect_marking_scripts),
+            ('make_locale_file', self.make_locale_file),
+        ]
+        if not self.options.generic:
+            steps.append(('add_source', self.add_source))
+        steps.append(('add_manifest', self.add_manifest))
+        if self.options.scorm:
+            steps.append(('add_scorm', self.add_scorm))
+        steps += [
+            ('collect_stylesheets', self.collect_stylesheets),
+            ('collect_scripts', self.collect_scripts),
+            ('minify', self.minify),
+        ]
+        if self.options.content_hash:
+            steps.append(('hash_asset_names', self.hash_asset_names))
+        if self.options.generic:
+            steps.append(('add_runtime_hash', self.add_runtime_hash))
+        return steps
+
+    def output_sink(self):
+        """
+            Where the package is written to: see :mod:`outputsink`.
+        """
+        return outputsink.make_sink(self.options)
+
+    def write_package(self):
+        sink = self.output_sink()
+        with self.phase(sink.phase):
+            sink.write(self)
+
+    def compile_thin(self):
+        """
+            Compile a thin package, containing only the exam, its resources and extensions, and pages which load a generic runtime built earlier from ``--runtime-url``.
+            The runtime is checked before anything is built, and its hash is recorded in the package's manifest.
+        """
+        if self.options.generic:
+            raise CompileError("A generic runtime can't be compiled as a thin package.")
+        if not self.options.runtime_url:
+            raise CompileError("The URL of the runtime for a thin package was not given.")
+
+        with self.phase('check_runtime'):
+            try:
+                runtime = thinpackage.GenericRuntime(self.options.runtime, followlinks=self.options.followlinks)
+                runtime.check(NUMBAS_VERSION, self.options.theme, self.options.runtime_hash)
+            except thinpackage.RuntimeMismatch as err:
+                raise CompileError(str(err))
+
+        with self.phase('parse_exam'):
+            self.parse_exam()
+
+        self.build_time = self.get_build_time()
+
+        with self.phase('load_theme_options'):
+            self.load_theme_options()
+            # The pages load the runtime's script and stylesheet files, which might have hashed names.
+            self.theme_options['js']['output'] = runtime.manifest['features']['js']
+            self.theme_options['css']['output'] = runtime.manifest['features']['css']
+
+        with self.phase('collect_files'):
+            self.files = self.collect_files(runtime=False)
 
-        self.add_manifest()
+        with self.phase('render_templates'):
+            self.render_templates()
+
+        with self.phase('add_source'):
+            self.files[PurePath('.') / 'source.exam'] = self.spooled(str(self.exam_object))
+
+        with self.phase('add_manifest'):
+            self.add_manifest()
+            manifest = json.loads(self.source_text(self.files[PurePath('.') / 'numbas-manifest.json']))
+            manifest['runtime'] = {'hash': runtime.hash, 'url': self.options.runtime_url}
+            self.files[PurePath('.') / 'numbas-manifest.json'] = self.spooled(json.dumps(manifest))
 
         if self.options.scorm:
-            self.add_scorm()
+            with self.phase('add_scorm'):
+                self.add_scorm()
 
-        self.collect_stylesheets()
-        self.collect_scripts()
+        with self.phase('rewrite_references'):
+            own_paths = set()
+            for dst in self.files:
+                own_paths.add(PurePath(dst).as_posix())
+                own_paths.update(p.as_posix() for p in PurePath(dst).parents if p != PurePath('.'))
+            self.rewrite_references(runtime.renames(self.options.runtime_url, exclude=own_paths))
 
-        self.minify()
+        with self.phase('minify'):
+            self.minify()
 
-        if self.options.zip:
-            self.compileToZip()
-        else:
-            self.compileToDir()
+        self.write_package()
+
+    def get_build_time(self):
+        """
+            The time the package was built.
+            This is normally the current time, but can be fixed with the ``--build-time`` option or the ``SOURCE_DATE_EPOCH`` environment variable,
+            so that compiling the same exam twice gives exactly the same output.
+        """
+        timestamp = self.options.build_time or os.environ.get('SOURCE_DATE_EPOCH')
+        if not timestamp:
+            return datetime.datetime.now()
+        try:
+            return datetime.datetime.fromtimestamp(int(timestamp), datetime.timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            raise CompileError("The build time should be a number of seconds since 1970, not {}".format(timestamp))
+
+    def prepare_shared(self):
+        """
+            Do the parts of the compilation which don't depend on the exam, leaving the results in the cache,
+            so that later compilations with the same theme, locale and options can reuse them.
+        """
+        self.load_theme_options()
+        self.files = self.collect_files()
+        self.make_locale_file()
+        self.collect_marking_scripts()
+        self.collect_diagnostic_scripts()
+        self.collect_stylesheets()
+        self.collect_scripts()
 
     def parse_exam(self):
         """
             Parse an exam definition from the given source
         """
         try:
-            exam_object = NumbasObject(self.options.source)
-            self.exam = exam_object.data
-            self.custom_part_types = self.exam.get('custom_part_types',[])
-            self.resources = self.exam.get('resources',[])
-            self.extensions = self.exam.get('extensions',[])
+            cache = ExamCache(self.options.exam_cache, max_size=self.options.exam_cache_size*1024*1024) if self.options.exam_cache else None
+            self.use_exam(NumbasObject(self.options.source, cache=cache))
         except examparser.ParseError as err:
             raise CompileError(f"Failed to compile exam due to parsing error.\n{err}")
         except:
             raise CompileError('Failed to compile exam.')
 
-    def collect_files(self, dirs=[('runtime', '.')]):
+    def use_exam(self, exam_object):
+        """
+            Compile the exam in the given :class:`examparser.numbasobject.NumbasObject`.
         """
-            Collect files from the given directories to be included in the compiled package
+        self.exam_object = exam_object
+        self.exam = exam_object.data
+        self.custom_part_types = self.exam.get('custom_part_types',[])
+        self.resources = self.exam.get('resources',[])
+        self.extensions = self.exam.get('extensions',[])
+
+    def collect_files(self, dirs=None, runtime=True):
         """
+            Collect files from the given directories to be included in the compiled package.
+            If ``runtime`` is ``False``, the runtime and theme files are left out, leaving only the exam's resources and extensions.
+        """
+        dirs = list(dirs) if dirs is not None else [('runtime', '.')] if runtime else []
+
         resources = [x if isinstance(x, list) else [x, x] for x in self.resources]
 
         for name, path in resources:
@@ -222,11 +436,13 @@ class NumbasCompiler(object):
             }
             self.extension_data[x.name] = ed
 
-            for d, _, files in extension_dir.walk():
+            for d, dirnames, files in os.walk(extension_dir, followlinks=self.options.followlinks):
+                d = Path(d)
+                dirnames.sort()
                 if any(p.name == 'standalone_scripts' for p in [d]+list(d.parents)):
                     continue
 
-                for f in files:
+                for f in sorted(files):
                     relf = (d / f).relative_to(extension_dir)
                     if relf.suffix == '.css':
                         ed['stylesheets'].append(str(relf))
@@ -235,39 +451,73 @@ class NumbasCompiler(object):
 
         dirs += extfiles
 
-        for themepath in self.themepaths:
-            dirs.append((themepath / 'files', PurePath('.')))
+        if runtime:
+            for themepath in self.themepaths:
+                dirs.append((themepath / 'files', PurePath('.')))
 
-        files = {}
-        for (src, dst) in dirs:
-            src = Path(self.options.path) / src
-            for path, dirnames, filenames in os.walk(src, followlinks=self.options.followlinks):
-                xsrc = Path(path)
-                xdst = dst / xsrc.relative_to(src)
-                for filename in [f for f in filenames if realFile(f)]:
-                    files[xdst / filename] = xsrc / filename
-                hidden_dirnames = []
-                for d in dirnames:
-                    if d[0]=='.' and len(d)>1:
-                        hidden_dirnames.append(d)
-                for d in hidden_dirnames:
-                    dirnames.remove(d)
+        files = self.walk_files(dirs)
+
+        if runtime and self.theme_bundle is not None:
+            files.update(self.theme_bundle.files())
 
         for name, path in resources:
             if not Path(path).is_dir():
                 files[Path('resources') / name] = Path(self.options.resource_root) / path
 
-        files[Path('extensions') / 'extensions.json'] = io.StringIO(json.dumps(self.extension_data))
+        files[Path('extensions') / 'extensions.json'] = self.spooled(json.dumps(self.extension_data))
         
         return files
 
+    def walk_files(self, dirs):
+        """
+            A dictionary mapping paths in the package to the files in the given pairs of directories ``(source, destination)``.
+            Files from later directories replace files with the same path from earlier ones.
+        """
+        files = {}
+        for (src, dst) in dirs:
+            src = Path(self.options.path) / src
+            for xsrc, filenames in self.cache.walk(src, followlinks=self.options.followlinks):
+                xdst = dst / xsrc.relative_to(src)
+                for filename in [f for f in filenames if realFile(f)]:
+                    files[xdst / filename] = xsrc / filename
+        return files
+
+    def theme_templates(self):
+        """
+            The templates in each theme, as a list of pairs ``(theme name, {template name: path})``, starting with the theme being used and followed by the themes it inherits from.
+        """
+        templates = []
+        for themepath in reversed(self.themepaths):
+            templates_path = themepath / 'templates'
+            theme_templates = {}
+            for d, filenames in self.cache.walk(templates_path, followlinks=self.options.followlinks):
+                for f in filenames:
+                    if realFile(f):
+                        theme_templates[(d / f).relative_to(templates_path).as_posix()] = d / f
+            templates.append((themepath.name, theme_templates))
+        return templates
+
+    def make_theme_bundle(self, output):
+        """
+            Flatten the theme and the themes it inherits from into a theme bundle, saved at ``output``.
+        """
+        if self.theme_bundle is not None:
+            raise CompileError("The theme {} is already a theme bundle.".format(self.options.theme))
+        self.load_theme_options()
+        files = self.walk_files([(themepath / 'files', PurePath('.')) for themepath in self.themepaths])
+        template_paths = [path / 'templates' for path in reversed(self.themepaths)]
+        environment = self.make_template_environment(template_paths)
+        themebundle.write_bundle(output, NUMBAS_VERSION, self.theme_options, files, self.theme_templates(), environment)
+
     def collect_marking_scripts(self):
         scripts_dir = Path(self.options.path) / 'marking_scripts'
+        filenames = [filename for filename in self.cache.listdir(scripts_dir) if filename.suffix == '.jme']
+        if self.options.tree_shake and self.features is not None:
+            used = self.features.marking_scripts([filename.stem for filename in filenames], [self.options.source] + self.extension_texts())
+            filenames = [filename for filename in filenames if filename.stem in used]
         scripts = {}
-        for filename in scripts_dir.iterdir():
-            if filename.suffix == '.jme':
-                with open(filename) as f:
-                    scripts[filename.stem] = f.read()
+        for filename in filenames:
+            scripts[filename.stem] = self.cache.read_text(filename)
         template = """Numbas.queueScript('marking_scripts', ['marking'], function() {{
             Numbas.raw_marking_scripts = {scripts};
         }});
@@ -278,10 +528,9 @@ class NumbasCompiler(object):
     def collect_diagnostic_scripts(self):
         scripts_dir = Path(self.options.path) / 'diagnostic_scripts'
         scripts = {}
-        for filename in scripts_dir.iterdir():
+        for filename in self.cache.listdir(scripts_dir):
             if filename.suffix == '.jme':
-                with open(filename) as f:
-                    scripts[filename.stem] = f.read()
+                scripts[filename.stem] = self.cache.read_text(filename)
         template = """Numbas.queueScript('diagnostic_scripts', ['diagnostic', 'marking'], function() {{
             Numbas.raw_diagnostic_scripts = {scripts};
         }});
@@ -309,28 +558,21 @@ class NumbasCompiler(object):
         """
             Render the HTML output using the theme templates - index.html by default.
         """
-        template_paths = [path / 'templates' for path in self.themepaths]
-        template_paths.reverse()
-
-        self.template_environment = jinja2.Environment(
-            loader=jinja2.ChoiceLoader([
-                jinja2.FileSystemLoader(template_paths),
-                *[jinja2.PrefixLoader({p.parent.name: jinja2.FileSystemLoader(p)}) for p in template_paths],
-            ])
-        )
-
-        def safe_script(txt):
-            txt = txt.replace('<script>', r'\u003cscript\u003e')
-            txt = txt.replace('</script>', r'\u003c/script\u003e')
-            return txt
+        if self.theme_bundle is not None:
+            bundle = self.theme_bundle
+            self.template_environment = self.cache.get(('jinja', bundle.path), lambda: (self.make_template_environment(loader=themebundle.BundleLoader(bundle)), [bundle.path]), local=True)
+        else:
+            template_paths = [path / 'templates' for path in self.themepaths]
+            template_paths.reverse()
 
-        self.template_environment.filters['safe_script'] = safe_script
+            # The environment keeps compiled templates, and reloads them when their source files change.
+            self.template_environment = self.cache.get(('jinja', tuple(template_paths), self.options.template_cache), lambda: (self.make_template_environment(template_paths), []), local=True)
 
         index_dest = Path('.') / self.theme_options['html']['output']
         if index_dest not in self.files:
             index_html = self.render_template('index.html')
             if index_html:
-                self.files[index_dest] = io.StringIO(index_html)
+                self.files[index_dest] = self.spooled(index_html)
             else:
                 if self.options.expect_index_html:
                     raise CompileError("The theme has not produced any HTML. Check that the `templates` and `files` folders are at the top level of the theme package.")
@@ -340,11 +582,37 @@ class NumbasCompiler(object):
             if analysis_dest not in self.files:
                 analysis_html = self.render_template('analysis.html')
                 if analysis_html:
-                    self.files[analysis_dest] = io.StringIO(analysis_html)
+                    self.files[analysis_dest] = self.spooled(analysis_html)
 
         self.question_xslt = self.render_template('question.xslt')
         self.part_xslt = self.render_template('part.xslt')
 
+    def make_template_environment(self, template_paths=None, loader=None):
+        """
+            A jinja environment for the given template paths, which uses each theme's precompiled templates where possible,
+            and caches the bytecode of the others in the ``--template-cache`` directory, if it's given.
+            Alternatively, ``loader`` is a jinja loader to use instead.
+        """
+        bytecode_cache = None
+        if loader is None:
+            loaders = [themetemplates.template_loader(p) for p in template_paths]
+            loader = jinja2.ChoiceLoader([
+                *loaders,
+                *[jinja2.PrefixLoader({p.parent.name: loader}) for p, loader in zip(template_paths, loaders)],
+            ])
+            if self.options.template_cache:
+                bytecode_cache = themetemplates.bytecode_cache(self.options.template_cache, template_paths)
+        environment = jinja2.Environment(loader=loader, bytecode_cache=bytecode_cache)
+
+        def safe_script(txt):
+            txt = txt.replace('<script>', r'\u003cscript\u003e')
+            txt = txt.replace('</script>', r'\u003c/script\u003e')
+            return txt
+
+        environment.filters['safe_script'] = safe_script
+
+        return environment
+
     def render_template(self, name):
         try:
             template = self.template_environment.get_template(name)
@@ -365,26 +633,104 @@ class NumbasCompiler(object):
 
     def make_locale_file(self):
         """
-            Make locale.js using the selected locale file
+            Make locale.js using the selected locale file.
+
+            Normally, locale.js contains every locale.
+            With the ``lazy_locales`` option, it only contains the selected locale and the locales i18next falls back to;
+            the others are written to separate files in ``locales/``, and the page loads the one it needs before it starts, if the student's preferred locale is one of them.
+            With the ``prune_locale_keys`` option, translations which aren't used by anything in the package are left out.
         """
         localePath = Path(self.options.path) / 'locales'
-        locales = {}
-        for fname in localePath.iterdir():
-            if fname.suffix == '.json':
-                with open(fname, encoding='utf-8') as f:
-                    locales[fname.stem.lower()] = {'translation': json.loads(f.read())}
 
         locale_js_template = """
         Numbas.queueScript('localisation-resources', ['i18next'], function() {{
         Numbas.locale = {{
             preferred_locale: {},
-            resources: {}
+            resources: {}{}
         }}
         }});
         """
-        locale_js = locale_js_template.format(json.dumps(self.options.locale), json.dumps(locales))
 
-        self.files[PurePath('.') / 'locale.js'] = io.StringIO(locale_js)
+        if not (self.options.lazy_locales or self.options.prune_locale_keys):
+            def make():
+                locales = self.load_locales(localePath)
+                locale_js = locale_js_template.format(json.dumps(self.options.locale), json.dumps(locales), '')
+                return locale_js, self.locale_dependencies(localePath)
+
+            locale_js = self.cache.get(('locale.js', localePath, self.options.locale), make)
+
+            self.files[PurePath('.') / 'locale.js'] = self.spooled(locale_js)
+            return
+
+        locales = self.cache.get(('locales', localePath), lambda: (self.load_locales(localePath), self.locale_dependencies(localePath)))
+
+        if self.options.prune_locale_keys:
+            keys = set().union(*(locale['translation'] for locale in locales.values()))
+            keep = localekeys.used_keys(keys, self.locale_key_sources())
+            locales = {code: {'translation': localekeys.prune_translations(locale['translation'], keep)} for code, locale in locales.items()}
+
+        lazy_resources = ''
+        if self.options.lazy_locales:
+            embedded = {code for code in self.locale_fallbacks(self.options.locale) if code in locales}
+            lazy = {}
+            for code, locale in locales.items():
+                if code in embedded:
+                    continue
+                dst = PurePath('.') / 'locales' / (code + '.js')
+                lazy[code] = dst.as_posix()
+                self.files[dst] = self.spooled("Numbas.locale.add_resources({}, {});\n".format(json.dumps(code), json.dumps(locale)))
+                self.unbundled_files.add(dst)
+            locales = {code: locale for code, locale in locales.items() if code in embedded}
+            lazy_resources = ',\n            lazy_resources: {}'.format(json.dumps(lazy))
+
+        locale_js = locale_js_template.format(json.dumps(self.options.locale), json.dumps(locales), lazy_resources)
+        self.files[PurePath('.') / 'locale.js'] = self.spooled(locale_js)
+
+    def load_locales(self, localePath):
+        """
+            Load every locale file, as a dictionary of i18next resources keyed by the lowercase locale code.
+        """
+        locales = {}
+        for fname in self.locale_dependencies(localePath)[1:]:
+            locales[fname.stem.lower()] = {'translation': self.cache.load_json(fname)}
+        return locales
+
+    def locale_dependencies(self, localePath):
+        return [localePath] + [fname for fname in self.cache.listdir(localePath) if fname.suffix == '.json']
+
+    def locale_fallbacks(self, locale):
+        """
+            The codes of the locales i18next looks in for a translation, in order, when the given locale is selected.
+        """
+        code = locale.lower()
+        return [code, code.split('-')[0], 'dev']
+
+    def locale_key_sources(self):
+        """
+            The text of everything in the package which might use a translation key: the runtime and theme scripts, rendered templates, extensions and the exam itself.
+        """
+        texts = []
+        for dst, src in self.files.items():
+            if Path(dst).suffix not in ('.js', '.html', '.xslt', '.xml', '.jme', '.json'):
+                continue
+            texts.append(self.source_text(src))
+
+        if self.theme_bundle is not None:
+            texts += self.theme_bundle.template_sources()
+        else:
+            for themepath in self.themepaths:
+                for d, filenames in self.cache.walk(themepath / 'templates', followlinks=self.options.followlinks):
+                    texts += [self.cache.read_text(d / f) for f in filenames if realFile(f)]
+
+        if self.question_xslt:
+            texts.append(self.question_xslt)
+        if self.part_xslt:
+            texts.append(self.part_xslt)
+
+        if not self.options.generic:
+            texts.append(self.options.source)
+
+        return texts
 
     def add_scorm(self):
         """
@@ -413,7 +759,7 @@ class NumbasCompiler(object):
         except AttributeError:
             pass
 
-        self.files[PurePath('.') / 'imsmanifest.xml'] = io.StringIO(manifest_string)
+        self.files[PurePath('.') / 'imsmanifest.xml'] = self.spooled(manifest_string)
 
     def collect_stylesheets(self):
         """
@@ -430,8 +776,7 @@ class NumbasCompiler(object):
         for dst, src in stylesheets:
             del self.files[dst]
         stylesheets = [src for dst, src in stylesheets]
-        stylesheets = '\n'.join(src.read_text(encoding='utf-8') if isinstance(src, Path) else src.read() for src in stylesheets)
-        self.files[PurePath('.') / self.theme_options['css']['output']] = io.StringIO(stylesheets)
+        self.files[PurePath('.') / self.theme_options['css']['output']] = self.join_sources(stylesheets, '\n')
 
     def collect_scripts(self):
         """
@@ -439,7 +784,7 @@ class NumbasCompiler(object):
         """
         javascripts = []
         for dst, src in self.files.items():
-            if Path(dst).suffix != '.js':
+            if Path(dst).suffix != '.js' or dst in self.unbundled_files:
                 continue
             if not any(p in ('standalone_scripts', 'extensions') for p in Path(dst).parts[:-1]):
                 javascripts.append((dst, src))
@@ -449,19 +794,216 @@ class NumbasCompiler(object):
 
         javascripts.sort(key=lambda x:x[0])
 
+        if self.options.split_scripts:
+            self.split_scripts(javascripts)
+            return
+
+        if self.options.tree_shake and self.features is not None:
+            javascripts = self.tree_shake(javascripts)
+
         javascripts = [src for dst, src in javascripts]
         numbas_loader_path = Path(self.options.path) / 'runtime' / 'scripts' / 'numbas.js'
         javascripts.remove(numbas_loader_path)
 
         javascripts.insert(0, numbas_loader_path)
-        javascripts = ';\n'.join(src.read_text(encoding='utf-8') if isinstance(src, Path) else src.read() for src in javascripts)
-        self.files[PurePath('.') / self.theme_options['js']['output']] = io.StringIO(javascripts)
+        self.files[PurePath('.') / self.theme_options['js']['output']] = self.join_sources(javascripts, ';\n')
+
+    def tree_shake(self, javascripts):
+        """
+            Leave out the scripts for the features of the runtime that the exam doesn't use, along with anything only they depend on.
+            The lists of dependencies in the remaining scripts are changed so that they don't wait for the scripts that were left out.
+
+            ``javascripts`` is a list of pairs ``(dst, src)``; returns the list of the ones to keep.
+        """
+        graph = scriptgraph.ScriptGraph(self.source_text(src) for dst, src in javascripts)
+        roots, required = self.script_requirements(graph)
+        excluded = self.features.excluded_scripts() - required
+
+        keep = graph.needed(roots - excluded, excluded)
+        removed = set(graph.modules) - keep
+
+        shaken = []
+        for i in sorted(graph.needed_sources(keep)):
+            dst, src = javascripts[i]
+            text = graph.rewrite(i, removed)
+            shaken.append((dst, self.spooled(text) if text is not None else src))
+        return shaken
+
+    def script_requirements(self, graph):
+        """
+            The scripts which must be in the main script file: the ones that no other script depends on, and the ones that the extensions or the exam's own scripts use.
+
+            Returns the set of all of those scripts, and the set of the ones used by the extensions or the exam.
+        """
+        texts = self.extension_texts()
+        if not self.options.generic:
+            texts.append(self.options.source)
+
+        required = set()
+        for text in texts:
+            if self.features is not None:
+                required |= self.features.extension_scripts(text)
+            for name, deps, _ in scriptgraph.find_declarations(text):
+                required.update(deps)
+        return graph.roots() | required, required
+
+    def split_scripts(self, javascripts):
+        """
+            Split the scripts into a main script file, containing everything needed to show the front page of the exam, and chunks containing the scripts in :data:`features.DEFERRED_CHUNKS`.
+            Scripts in the main file are ordered so that each one comes after the ones it depends on.
+            The chunks are written to the ``chunks`` directory, and the loader fetches a chunk the first time one of its scripts is asked for.
+
+            A chunk's scripts stay in the main file if any script there needs them, unless the exam is known not to use them.
+            If ``--tree-shake`` is also given, the scripts for unused features are left out entirely.
+
+            ``javascripts`` is a list of pairs ``(dst, src)``.
+        """
+        graph = scriptgraph.ScriptGraph(self.source_text(src) for dst, src in javascripts)
+        modules = set(graph.modules)
+        roots, required = self.script_requirements(graph)
+
+        unused = self.features.excluded_scripts() - required if self.features is not None else set()
+        if self.options.tree_shake:
+            available = graph.needed(roots - unused, unused) & modules
+        else:
+            available = modules
+        shaken = modules - available
+
+        entries = {name for chunk, names in features.DEFERRED_CHUNKS for name in names if name in available and name not in required}
+        while True:
+            critical = graph.needed((roots & available) - entries, shaken | entries) & modules
+            depended = {dep for name in critical for dep in graph.modules[name].deps} - unused
+            kept = entries & (depended | critical)
+            if not kept:
+                break
+            entries -= kept
+
+        chunks = []
+        assigned = set(critical)
+        for chunk, names in features.DEFERRED_CHUNKS:
+            names = [name for name in names if name in entries]
+            if not names:
+                continue
+            chunk_modules = (graph.needed(names, shaken | assigned | (entries - set(names))) & modules) - assigned
+            assigned |= chunk_modules
+            chunks.append((chunk, chunk_modules))
+
+        # Anything that isn't needed by any of the roots, such as scripts which only depend on each other, goes in the main file.
+        critical |= available - assigned
+
+        for name, dep in graph.missing():
+            if name in available and dep not in required:
+                self.report("Warning: the script {} depends on {}, which isn't in the package.".format(name, dep))
+
+        deferred_scripts = {}
+        for chunk, chunk_modules in chunks:
+            dst = PurePath('chunks') / (chunk + '.js')
+            sources = self.ordered_script_sources(graph, javascripts, chunk_modules, shaken)
+            self.files[dst] = self.join_sources(sources, ';\n')
+            for name in chunk_modules:
+                deferred_scripts[name] = dst.as_posix()
+
+        numbas_loader_path = Path(self.options.path) / 'runtime' / 'scripts' / 'numbas.js'
+        plain = [javascripts[i][1] for i in sorted(graph.plain_sources)]
+        plain.remove(numbas_loader_path)
+        sources = [numbas_loader_path, self.spooled('Numbas.deferred_scripts = {}'.format(json.dumps(deferred_scripts, sort_keys=True)))]
+        sources += plain
+        sources += self.ordered_script_sources(graph, javascripts, critical, shaken | entries)
+
+        self.files[PurePath('.') / self.theme_options['js']['output']] = self.join_sources(sources, ';\n')
+
+    def ordered_script_sources(self, graph, javascripts, names, removed):
+        """
+            The files declaring the given scripts, ordered so that each script comes after the ones it depends on, with the scripts in ``removed`` taken out of their lists of dependencies.
+        """
+        _, cycles = graph.order(names)
+        for cycle in cycles:
+            self.report("Warning: there's a cycle in the dependencies of the scripts: {}".format(' -> '.join(cycle)))
+
+        sources = []
+        for i in graph.source_order(names):
+            dst, src = javascripts[i]
+            text = graph.rewrite(i, removed)
+            sources.append(self.spooled(text) if text is not None else src)
+        return sources
+
+    def extension_texts(self):
+        """
+            The code of the extensions' scripts.
+        """
+        return [self.source_text(src) for dst, src in self.files.items() if Path(dst).suffix == '.js' and 'extensions' in Path(dst).parts[:-1]]
+
+    def source_text(self, src):
+        """
+            The contents of a file in the package, as a string.
+        """
+        if isinstance(src, Path):
+            return self.cache.read_text(src)
+        else:
+            return src.read_text()
+
+    def source_chunks(self, src):
+        """
+            The contents of a file in the package, as a sequence of chunks of bytes.
+        """
+        if isinstance(src, Path):
+            with open(src, 'rb') as f:
+                while True:
+                    chunk = f.read(spooltext.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        else:
+            yield from src.chunks()
+
+    def spooled(self, text=None):
+        """
+            A new generated file, counting against this compilation's memory budget.
+        """
+        return spooltext.SpooledText(text, self.memory_budget)
+
+    def join_sources(self, sources, separator):
+        """
+            Join together the contents of a list of files, separated by ``separator``, into a new generated file.
+
+            Runs of files on disk are joined through the cache, so that the runtime and theme files, which are the same for every exam, are only joined once.
+            With a memory budget, they're copied into the output a chunk at a time instead, so the whole of the output is never held in memory.
+        """
+        groups = []
+        for src in sources:
+            if not isinstance(src, Path):
+                groups.append(src)
+            elif groups and isinstance(groups[-1], list):
+                groups[-1].append(src)
+            else:
+                groups.append([src])
+
+        out = self.spooled()
+        for i, group in enumerate(groups):
+            if i > 0:
+                out.write(separator)
+            if not isinstance(group, list):
+                for chunk in group.chunks():
+                    out.write(chunk)
+            elif self.memory_budget.limit is None:
+                out.write(self.cache.join_texts(group, separator))
+            else:
+                for j, path in enumerate(group):
+                    if j > 0:
+                        out.write(separator)
+                    with open(path, encoding='utf-8') as f:
+                        while True:
+                            chunk = f.read(spooltext.CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            out.write(chunk)
+        return out
 
     def add_source(self):
         """
         	Add the original .exam file, so that it can be recreated later on
         """
-        self.files[PurePath('.') / 'source.exam'] = io.StringIO(self.options.source)
+        self.files[PurePath('.') / 'source.exam'] = self.spooled(self.options.source)
 
     def add_manifest(self):
         features = {
@@ -479,49 +1021,112 @@ class NumbasCompiler(object):
             'locale': self.options.locale,
             'features': features,
         }
-        self.files[PurePath('.') / 'numbas-manifest.json'] = io.StringIO(json.dumps(manifest))
+        self.files[PurePath('.') / 'numbas-manifest.json'] = self.spooled(json.dumps(manifest))
 
     def minify(self):
         """
             Minify all files in the package with associated minifiers.
         """
+        jobs = []
         for dst, src in self.files.items():
             suffix = Path(dst).suffix
             minifier = self.minify_extensions.get(suffix)
             if minifier is not None:
-                if isinstance(src, Path):
-                    p = subprocess.Popen([minifier,src], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    out, err = p.communicate()
-                elif isinstance(src, io.StringIO):
-                    p = subprocess.Popen([minifier],stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-                    out,err = p.communicate(src.read().encode())
-                code = p.poll()
-                if code != 0:
-                    raise CompileError('Failed to minify %s with minifier %s' % (src, minifier))
-                else:
-                    self.files[dst] = io.StringIO(out.decode('utf-8'))
+                jobs.append((dst, src, minifier))
+
+        if not jobs:
+            return
 
-    def compileToZip(self):
-        """ 
-            Compile the exam as a .zip file
+        cache = minify.MinifyCache(self.options.minify_cache) if self.options.minify_cache else None
+
+        def do_minify(job):
+            dst, src, minifier = job
+            with self.profile.phase(PurePath(dst).as_posix(), category='minifier', minifier=minifier):
+                out = self.minify_file(src, minifier, cache)
+                self.profile.add_bytes(out.size)
+                return out
+
+        with ThreadPoolExecutor(max_workers=self.options.minify_jobs) as executor:
+            for (dst, src, minifier), out in zip(jobs, executor.map(do_minify, jobs)):
+                self.files[dst] = out
+
+    def minify_file(self, src, minifier, cache=None):
         """
-        Path(self.options.output).parent.mkdir(exist_ok=True, parents=True)
-        
-        f = ZipFile(self.options.output, 'w')
+            Minify a file in the package, returning the minified file.
+        """
+        try:
+            # With a memory budget, files are streamed through the minifier, unless it's a persistent worker, whose protocol sends whole files.
+            if self.memory_budget.limit is not None and not self.options.minify_server:
+                out = self.spooled()
+                minify.minify_stream(minifier, lambda: self.source_chunks(src), out, cache=cache)
+                return out
+            return self.spooled(minify.minify(minifier, src.read_bytes(), cache=cache, persistent=self.options.minify_server))
+        except (OSError, minify.MinifyError):
+            raise CompileError('Failed to minify %s with minifier %s' % (src, minifier))
+
+    def hash_asset_names(self):
+        """
+            Give the main script and stylesheet files, the chunks of scripts and the separate locale files names containing a hash of their contents,
+            and change the references to them in the other files.
+
+            Files are renamed after the files they refer to, so that their hashes cover the new references.
+        """
+        outputs = [PurePath('.') / self.theme_options['css']['output'], PurePath('.') / self.theme_options['js']['output']]
+        leaves = [PurePath(dst) for dst in self.files if PurePath(dst).parts[:1] in (('chunks',), ('locales',))]
+
+        renames = {}
+        renamed = {}
+        for dst in sorted(leaves) + outputs:
+            if dst not in self.files:
+                continue
+            text = assetnames.rewrite_references(self.source_text(self.files[dst]), renames)
+            new_dst = assetnames.hashed_name(dst, text.encode('utf-8'))
+            renames[dst.as_posix()] = new_dst.as_posix()
+            renamed[dst] = (new_dst, self.spooled(text))
+
+        self.files = dict(renamed.get(dst, (dst, src)) for dst, src in self.files.items())
+        self.rewrite_references(renames)
+
+    def rewrite_references(self, renames):
+        """
+            Change the references to the paths in ``renames`` in the package's files, except for the exam's resources and extensions.
+        """
+        for dst, src in self.files.items():
+            if Path(dst).suffix in ('.html', '.json', '.xml', '.js', '.css') and PurePath(dst).parts[0] not in ('resources', 'extensions'):
+                text = self.source_text(src)
+                new_text = assetnames.rewrite_references(text, renames)
+                if new_text != text:
+                    self.files[dst] = self.spooled(new_text)
 
-        for (dst, src) in self.files.items():
-            dst = ZipInfo(str(Path(dst).relative_to('.')))
-            dst.compress_type = zipfile.ZIP_DEFLATED
-            dst.external_attr = 0o644<<16
-            dst.date_time = self.build_time.timetuple()
+    def add_runtime_hash(self):
+        """
+            Record a hash of the files in a generic runtime in its manifest, so that thin packages can check that they're used with the runtime they were built against.
+        """
+        file_hashes = {}
+        for dst, src in self.files.items():
             if isinstance(src, Path):
-                f.writestr(dst, src.read_bytes())
+                file_hashes[PurePath(dst).as_posix()] = hash_file(src)
             else:
-                f.writestr(dst, src.read())
+                file_hashes[PurePath(dst).as_posix()] = getattr(src, 'hash', None) or hash_chunks(src.chunks())
+
+        manifest_path = PurePath('.') / 'numbas-manifest.json'
+        manifest = json.loads(self.source_text(self.files[manifest_path]))
+        manifest['runtime'] = {'hash': thinpackage.package_hash(file_hashes), 'theme': self.options.theme}
+        self.files[manifest_path] = self.spooled(json.dumps(manifest))
 
-        print("Exam created in %s" % os.path.relpath(self.options.output))
+    def sorted_files(self):
+        """
+            The pairs ``(dst, src)`` in ``self.files``, sorted by path, so that archives don't depend on the order directories were listed in.
+        """
+        return sorted(self.files.items(), key=lambda item: PurePath(item[0]).as_posix())
 
-        f.close()
+    def write_zip(self, fileobj):
+        """
+            Write the package as a zip file to a binary file object, which doesn't need to be seekable.
+        """
+        # Zip files can't store dates before 1980.
+        date_time = max(self.build_time.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+        zipwriter.write_package(fileobj, self.sorted_files(), date_time=date_time)
 
     def compileToDir(self):
         """
@@ -536,19 +1141,116 @@ class NumbasCompiler(object):
         outpath = Path(self.options.output)
 
         outpath.mkdir(exist_ok=True,parents=True)
-        
-        for (dst, src) in self.files.items():
+
+        self.object_store = objectstore.ObjectStore(self.options.object_store, self.options.object_store_link) if self.options.object_store else None
+
+        # The manifest from the previous build says which files are already in place, and which files it wrote that aren't produced any more.
+        manifest = BuildManifest(outpath, stored=self.object_store is not None)
+        if self.options.action != 'clean':
+            manifest.load()
+
+        built = {}
+        for (dst, src) in self.sorted_files():
+            name = PurePath(dst).as_posix()
             dst = outpath / dst
-            dst.parent.mkdir(exist_ok=True,parents=True)
             if isinstance(src, Path):
-                if self.options.action=='clean' or not dst.exists() or src.stat().st_mtime > dst.stat().st_mtime:
-                    shutil.copyfile(src, dst)
+                entry = manifest.unchanged_source(name, src)
+                if entry is None:
+                    # With an object store, the file is only copied into the store if its contents aren't already there.
+                    digest = self.object_store.add_file(src) if self.object_store is not None else hash_file(src)
+                    entry = {'hash': digest, 'size': src.stat().st_size, 'source': source_stamp(src)}
+                    if not manifest.unchanged(name, entry['hash']):
+                        self.write_output(dst, entry['hash'], src)
             else:
-                shutil.copyfileobj(src, open(dst, 'w', encoding='utf-8'))
-        
-        print("Exam created in %s" % os.path.relpath(self.options.output))
+                # Files from a theme bundle already know their hash.
+                entry = {'hash': getattr(src, 'hash', None) or hash_chunks(src.chunks()), 'size': src.size}
+                if not manifest.unchanged(name, entry['hash']):
+                    self.write_output(dst, entry['hash'], src)
+            built[name] = entry
 
-def run():
+            if self.options.precompress and Path(name).suffix in precompress.TEXT_SUFFIXES and entry['size'] >= self.options.precompress_threshold:
+                built.update(self.precompress_file(manifest, name, dst, entry))
+
+        manifest.remove_orphans(built.keys())
+        manifest.files = built
+        manifest.save()
+
+        self.profile.add_bytes(sum(entry['size'] for entry in built.values()))
+
+        self.report("Exam created in %s" % os.path.relpath(self.options.output))
+
+    def write_output(self, dst, digest, src):
+        """
+            Write a file in a directory build, copied from ``src``, which is either a file on disk or a generated file, and whose contents have the hash ``digest``.
+            With an object store, the file is a link to the stored copy of its contents, which must already be in the store if ``src`` is on disk.
+
+            Any existing file is removed rather than overwritten, since it might be a link to a stored file.
+        """
+        dst.parent.mkdir(exist_ok=True,parents=True)
+        try:
+            dst.unlink()
+        except FileNotFoundError:
+            pass
+
+        if self.object_store is not None:
+            if not isinstance(src, Path):
+                self.object_store.add_chunks(src.chunks(), digest)
+            self.object_store.link(digest, dst)
+        elif isinstance(src, Path):
+            shutil.copyfile(src, dst)
+        else:
+            with open(dst, 'wb') as f:
+                for chunk in src.chunks():
+                    f.write(chunk)
+
+    def precompress_file(self, manifest, name, path, entry):
+        """
+            Write compressed copies of a file in a directory build next to it, unless they wouldn't be any smaller.
+
+            The file's manifest entry records which compressed copies were made for its current contents,
+            so the file is only compressed again if it has changed or its compressed copies have gone.
+            Returns the manifest entries for the compressed copies.
+        """
+        previous = manifest.get(name) or {}
+        done = previous.get('compressed', {}) if previous.get('hash') == entry['hash'] else {}
+        entry['compressed'] = {}
+
+        siblings = {}
+        for suffix, compress in precompress.compressors():
+            compressed_name = name + suffix
+            if suffix in done:
+                compressed_entry = manifest.get(compressed_name)
+                if not done[suffix]:
+                    entry['compressed'][suffix] = False
+                    continue
+                elif compressed_entry is not None and manifest.unchanged(compressed_name, compressed_entry['hash']):
+                    entry['compressed'][suffix] = True
+                    siblings[compressed_name] = compressed_entry
+                    continue
+
+            compressed = self.spooled()
+            compress(self.source_chunks(path), compressed)
+            if compressed.size >= entry['size']:
+                entry['compressed'][suffix] = False
+                continue
+            compressed_entry = {'hash': hash_chunks(compressed.chunks()), 'size': compressed.size}
+            self.write_output(path.with_name(path.name + suffix), compressed_entry['hash'], compressed)
+            entry['compressed'][suffix] = True
+            siblings[compressed_name] = compressed_entry
+
+        return siblings
+
+    def report(self, message):
+        """
+            Show a message about the progress of the compilation.
+            When the package is written to stdout, messages go to stderr instead.
+        """
+        print(message, file=sys.stderr if self.options.pipeout else sys.stdout)
+
+def make_option_parser():
+    """
+        The parser for the command-line options which control a compilation.
+    """
     parser = OptionParser(usage="usage: %prog [options] source")
     parser.add_option('-t', '--theme',
                         dest='theme',
@@ -575,6 +1277,12 @@ def run():
                         default=False,
                         help='Create a zip file instead of a directory'
         )
+    parser.add_option('--tar',
+                        dest='tar',
+                        action='store_true',
+                        default=False,
+                        help='Create a tar archive instead of a directory. It is compressed if the output path ends with .tar.gz, .tgz, .tar.bz2 or .tar.xz.'
+        )
     parser.add_option('-s', '--scorm',
                         dest='scorm',
                         action='store_true',
@@ -596,11 +1304,99 @@ def run():
                         default=False,
                         help="Read .exam from stdin")
 
+    parser.add_option('--pipeout',
+                        dest='pipeout',
+                        action='store_true',
+                        default=False,
+                        help="Write the package to stdout as it's produced, as a zip file, or an uncompressed tar archive with --tar. Messages are written to stderr.")
+
+    parser.add_option('--watch',
+                        dest='watch',
+                        action='store_true',
+                        default=False,
+                        help="After compiling, keep watching the exam's source, the runtime, the theme, the extensions and the resources, and compile again when any of them change, only remaking the output files which depend on the changed files.")
+
+    parser.add_option('--watch-interval',
+                        dest='watch_interval',
+                        type='float',
+                        default=0.5,
+                        help='In watch mode, on systems without inotify, the number of seconds between checks for changes. Defaults to 0.5.')
+
     parser.add_option('-l', '--language',
                         dest='locale',
                         default='en-GB',
                         help='Language (ISO language code) to use when displaying text')
 
+    parser.add_option('--tree-shake',
+                        dest='tree_shake',
+                        action='store_true',
+                        default=False,
+                        help="Only include the parts of the runtime that the exam uses: its part types, diagnostic mode and attempt data download. Ignored for a generic runtime.")
+
+    parser.add_option('--split-scripts',
+                        dest='split_scripts',
+                        action='store_true',
+                        default=False,
+                        help="Put the scripts needed to show the front page of the exam first, in the order they depend on each other, and move the ones that aren't needed straight away, such as attempt data download and diagnostic mode, to files that are only loaded when they're used.")
+
+    parser.add_option('--content-hash',
+                        dest='content_hash',
+                        action='store_true',
+                        default=False,
+                        help="Put a hash of their contents in the names of the main script and stylesheet files, the chunks of scripts and the separate locale files, so they can be cached indefinitely.")
+
+    parser.add_option('--precompress',
+                        dest='precompress',
+                        action='store_true',
+                        default=False,
+                        help='When compiling to a directory, write gzip-compressed copies of text files next to them, and brotli-compressed copies if the brotli module is installed.')
+
+    parser.add_option('--precompress-threshold',
+                        dest='precompress_threshold',
+                        type='int',
+                        default=precompress.DEFAULT_THRESHOLD,
+                        help='The size in bytes of the smallest file to compress with --precompress. Defaults to 1024.')
+
+    parser.add_option('--object-store',
+                        dest='object_store',
+                        default=None,
+                        help='When compiling to a directory, keep one copy of each file in this directory, and make the files in the package links to them. Useful when building lots of exams which share most of their files.')
+
+    parser.add_option('--object-store-link',
+                        dest='object_store_link',
+                        type='choice',
+                        choices=objectstore.LINK_MODES,
+                        default='hardlink',
+                        help='How to link files to the object store: "hardlink", or "reflink" for copy-on-write clones. Falls back to a reflink and then a copy if a link can\'t be made.')
+
+    parser.add_option('--memory-budget',
+                        dest='memory_budget',
+                        type='int',
+                        default=None,
+                        help='The most memory, in megabytes, to use for the files generated during the compilation. Once they use more, they are written to temporary files. If not given, there is no limit.')
+
+    parser.add_option('--profile',
+                        dest='profile',
+                        default=None,
+                        help="Record the wall time, CPU time, peak memory and bytes produced of each phase of the compilation and each minifier call, and save them as JSON to the given file, and in the Chrome trace event format to a file next to it ending .trace.json. Measuring memory slows the compilation down.")
+
+    parser.add_option('--build-time',
+                        dest='build_time',
+                        default=None,
+                        help='The time to record as when the package was built, as a number of seconds since 1970. Defaults to the SOURCE_DATE_EPOCH environment variable if it is set, otherwise the current time.')
+
+    parser.add_option('--lazy-locales',
+                        dest='lazy_locales',
+                        action='store_true',
+                        default=False,
+                        help='Only include the selected language in locale.js. The other languages are written to separate files, which are loaded if the page switches to them.')
+
+    parser.add_option('--prune-locale-keys',
+                        dest='prune_locale_keys',
+                        action='store_true',
+                        default=False,
+                        help="Leave out translations which aren't used by the runtime, the theme, the extensions or the exam.")
+
     parser.add_option('--minify_js', '--minify',
                         dest='minify_js',
                         default=None,
@@ -611,6 +1407,39 @@ def run():
                         default=None,
                         help='Path to CSS minifier. If not given, no minification is performed.')
 
+    parser.add_option('--minify-cache',
+                        dest='minify_cache',
+                        default=None,
+                        help='Directory in which to cache minified files. If not given, minified files are not cached.')
+
+    parser.add_option('--minify-jobs',
+                        dest='minify_jobs',
+                        type='int',
+                        default=None,
+                        help='The maximum number of files to minify at the same time. Defaults to the number of processors.')
+
+    parser.add_option('--minify-server',
+                        dest='minify_server',
+                        action='store_true',
+                        default=False,
+                        help='Keep each minifier running as a persistent worker, and send it files using a framed protocol. See bin/minify.py for a description of the protocol.')
+
+    parser.add_option('--template-cache',
+                        dest='template_cache',
+                        default=None,
+                        help="Directory in which to cache compiled theme templates. If not given, templates that the theme doesn't ship precompiled are compiled on every compilation.")
+
+    parser.add_option('--exam-cache',
+                        dest='exam_cache',
+                        default=None,
+                        help='Directory in which to cache parsed and migrated exams. If not given, exams are not cached.')
+
+    parser.add_option('--exam-cache-size',
+                        dest='exam_cache_size',
+                        type='int',
+                        default=256,
+                        help='The maximum size of the exam cache, in megabytes. When it gets bigger, the least recently used exams are removed.')
+
     parser.add_option('--show_traceback',
                         dest='show_traceback',
                         action='store_true',
@@ -663,17 +1492,81 @@ def run():
                       help='Build a generic runtime'
                      )
 
+    parser.add_option('--runtime',
+                      dest='runtime',
+                      default=None,
+                      help='Build a thin package, containing only the exam, which uses the generic runtime at this path, built earlier with --generic.'
+                     )
+
+    parser.add_option('--runtime-url',
+                      dest='runtime_url',
+                      default=None,
+                      help='The URL that the generic runtime used by a thin package is served from.'
+                     )
+
+    parser.add_option('--runtime-hash',
+                      dest='runtime_hash',
+                      default=None,
+                      help="The hash of the generic runtime that a thin package must be built against. The compilation fails if the runtime's hash is different."
+                     )
+
     parser.add_option('--load-exam-script-url',
                       dest='load_exam_script_url',
                       default='',
                       help='URL of the script to load the exam, used by the generic runtime.'
                      )
 
-    (options, args) = parser.parse_args()
+    return parser
+
+def parse_compile_args(args, source=None):
+    """
+        Parse a list of command-line arguments into an options object, as :func:`run` does.
+
+        If ``source`` is not given, the exam source is read from the path given in the arguments.
+        Problems with the arguments raise a :class:`CompileError` instead of exiting.
+    """
+    parser = make_option_parser()
+    def error(msg):
+        raise CompileError(msg)
+    parser.error = error
+
+    (options, args) = parser.parse_args(list(args))
+
+    if options.pipeout:
+        raise CompileError("The package can't be written to stdout here.")
 
     if not options.output:
         raise CompileError("The output path was not given.")
 
+    if not options.generic:
+        if source is not None:
+            options.source = source
+        else:
+            try:
+                source_path = Path(args[0])
+            except IndexError:
+                raise CompileError("No source was given.")
+            if not source_path.exists():
+                raise CompileError("Couldn't find source file %s" % source_path)
+            with open(source_path, encoding='utf-8') as f:
+                options.source = f.read()
+
+    return options
+
+def run():
+    parser = make_option_parser()
+    (options, args) = parser.parse_args()
+
+    if not (options.output or options.pipeout):
+        raise CompileError("The output path was not given.")
+
+    if options.zip and options.tar:
+        raise CompileError("The package can be either a zip file or a tar archive, not both.")
+
+    if options.watch and (options.pipein or options.pipeout or options.zip or options.tar):
+        raise CompileError("Watch mode can only compile an exam from a file to a directory.")
+
+    source_path = None
     if not options.generic:
         if options.pipein:
             options.source = sys.stdin.detach().read().decode('utf-8')
@@ -685,15 +1578,19 @@ def run():
                 return
 
             if not source_path.exists():
-                print("Couldn't find source file %s" % osource)
+                print("Couldn't find source file %s" % source_path)
                 exit(1)
 
             with open(source_path, encoding='utf-8') as f:
                 options.source=f.read()
 
     try:
-        compiler = NumbasCompiler(options)
-        compiler.compile()
+        if options.watch:
+            import watch
+            watch.watch(options, source_path)
+        else:
+            compiler = NumbasCompiler(options)
+            compiler.compile()
     except Exception as err:
         sys.stderr.write(str(err)+'\n')
         _, _, exc_traceback = sys.exc_info()
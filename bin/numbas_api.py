@@ -0,0 +1,203 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Compile exams from Python, without building a list of command-line arguments or writing anything to disk.
+
+    The exam is given either as the source of a ``.exam`` file, or as data which has already been parsed from JSON.
+    The compiled package is returned as a dictionary mapping the path of each file in the package to its contents,
+    or written as a zip file to a binary file object, such as a socket or an HTTP response, which doesn't need to be seekable::
+
+        from numbas_api import CompileOptions, compile_exam, compile_exam_to_zip
+
+        files = compile_exam(source, CompileOptions(scorm=True))
+        html = files['index.html']
+
+        with open('exam.zip', 'wb') as f:
+            compile_exam_to_zip(data, f, CompileOptions(locale='de-DE'))
+
+    Nothing is written to disk and no other processes are started, unless the options ask for it, for example by giving a minifier.
+    The files read from the Numbas runtime and themes are kept in a cache shared between compilations in the same process,
+    and only read again when they change.
+    Problems with the exam or the options raise a :class:`numbas.CompileError`.
+"""
+
+from buildcache import BuildCache
+import copy
+from dataclasses import dataclass, field, fields
+from examparser.migrations import migration_head
+from examparser.numbasobject import NumbasObject
+import json
+from numbas import CompileError, NumbasCompiler, make_option_parser
+import outputsink
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Union
+
+NUMBAS_PATH = str(Path(__file__).resolve().parent.parent)
+
+# Files read from disk, shared by every compilation in this process which isn't given its own cache.
+shared_cache = BuildCache()
+
+
+@dataclass
+class CompileOptions(object):
+    """
+        The options for compiling an exam.
+        Each field corresponds to the command-line option of ``numbas.py`` with the same name; fields which are ``None`` take the same default.
+        Any other option of ``numbas.py`` can be set in ``extra``, keyed by its destination name, such as ``{'minify_jobs': 4}``.
+    """
+    path: str = NUMBAS_PATH
+    theme: str = 'default'
+    locale: str = 'en-GB'
+    scorm: bool = False
+    generic: bool = False
+    followlinks: bool = False
+    tree_shake: bool = False
+    split_scripts: bool = False
+    content_hash: bool = False
+    lazy_locales: bool = False
+    prune_locale_keys: bool = False
+    minify_js: Optional[str] = None
+    minify_css: Optional[str] = None
+    build_time: Optional[int] = None
+    mathjax_url: Optional[str] = None
+    mathjax_4_url: Optional[str] = None
+    source_url: Optional[str] = None
+    edit_url: Optional[str] = None
+    accessibility_statement_url: Optional[str] = None
+    extension_paths: List[str] = field(default_factory=list)
+    resource_root: str = ''
+    runtime: Optional[str] = None
+    runtime_url: Optional[str] = None
+    runtime_hash: Optional[str] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def to_options(self):
+        """
+            The options object used by :class:`numbas.NumbasCompiler`, with the defaults of ``numbas.py`` for anything not set here.
+        """
+        options = make_option_parser().get_default_values()
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if f.name == 'extra' or (value is None and getattr(options, f.name) is not None):
+                continue
+            setattr(options, f.name, value)
+        options.theme = str(options.theme)
+        options.path = str(options.path)
+        options.extension_paths = json.dumps([str(p) for p in self.extension_paths])
+
+        for name, value in self.extra.items():
+            if not hasattr(options, name):
+                raise CompileError("There is no option called {}.".format(name))
+            setattr(options, name, value)
+
+        # The package is never written to disk by the compiler itself.
+        options.output = None
+        options.zip = False
+        options.tar = False
+        options.pipein = False
+        options.pipeout = False
+        options.watch = False
+        options.action = None
+        options.profile = None
+        options.source = None
+        return options
+
+
+class PackageCompiler(NumbasCompiler):
+    """
+        A compiler which keeps the package in memory, instead of writing it to an output path.
+
+        If ``zip_file`` is given, the package is written to it as a zip file; otherwise, the contents of each file are collected in ``package``.
+        Messages are passed to ``report``, if given.
+    """
+    def __init__(self, options, exam_object=None, cache=None, zip_file=None, report=None):
+        self.given_exam = exam_object
+        self.zip_file = zip_file
+        self.report_function = report
+        self.memory = outputsink.MemorySink()
+        super().__init__(options, cache=cache)
+
+    def report(self, message):
+        if self.report_function is not None:
+            self.report_function(message)
+
+    def parse_exam(self):
+        if self.given_exam is None:
+            super().parse_exam()
+            return
+        try:
+            self.use_exam(self.given_exam)
+        except Exception as err:
+            raise CompileError("Failed to compile exam: {}".format(err)) from err
+
+    def output_sink(self):
+        if self.zip_file is not None:
+            return outputsink.ZipSink(stream=self.zip_file)
+        else:
+            return self.memory
+
+    @property
+    def package(self):
+        return self.memory.files
+
+
+def make_compiler(exam, options=None, version=None, cache=None, zip_file=None, report=None):
+    """
+        A compiler for the given exam, which is either the source of a ``.exam`` file, a :class:`examparser.numbasobject.NumbasObject`,
+        or a dictionary of exam data at the given version of the exam format.
+        If ``version`` is not given, the data is assumed to be at the latest version, as produced by the editor.
+        The data is not changed.
+
+        The exam is ignored when compiling a generic runtime.
+    """
+    options = (options if options is not None else CompileOptions()).to_options()
+
+    exam_object = None
+    if not options.generic:
+        if isinstance(exam, str):
+            options.source = exam
+        elif isinstance(exam, NumbasObject):
+            exam_object = exam
+        elif isinstance(exam, dict):
+            try:
+                exam_object = NumbasObject(data=copy.deepcopy(exam), version=version or migration_head())
+            except Exception as err:
+                raise CompileError("Failed to migrate the exam data: {}".format(err)) from err
+        else:
+            raise CompileError("The exam should be given as a string or a dictionary, not {}.".format(type(exam).__name__))
+        if exam_object is not None:
+            # The source is included in the package, and used to find which parts of the runtime the exam needs.
+            options.source = str(exam_object)
+
+    return PackageCompiler(options, exam_object=exam_object, cache=cache if cache is not None else shared_cache, zip_file=zip_file, report=report)
+
+
+def compile_exam(exam: Union[str, dict, NumbasObject], options: Optional[CompileOptions] = None, version: Optional[str] = None, cache: Optional[BuildCache] = None, report: Optional[Callable[[str], None]] = None) -> Dict[str, bytes]:
+    """
+        Compile an exam, and return a dictionary mapping the path of each file in the package to its contents.
+        See :func:`make_compiler` for the ways the exam can be given.
+    """
+    compiler = make_compiler(exam, options, version=version, cache=cache, report=report)
+    compiler.compile()
+    return compiler.package
+
+
+def compile_exam_to_zip(exam: Union[str, dict, NumbasObject], fileobj: BinaryIO, options: Optional[CompileOptions] = None, version: Optional[str] = None, cache: Optional[BuildCache] = None, report: Optional[Callable[[str], None]] = None) -> None:
+    """
+        Compile an exam, and write the package as a zip file to the binary file object ``fileobj``, which is left open.
+        See :func:`make_compiler` for the ways the exam can be given.
+    """
+    compiler = make_compiler(exam, options, version=version, cache=cache, zip_file=fileobj, report=report)
+    compiler.compile()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Compile lots of exams in one go.
+
+    Usage: ``numbas_batch.py [batch options] manifest.json [compiler options]``
+
+    The manifest is a JSON list of jobs. Each job is an object with the following keys:
+
+    * ``source`` - path to the exam source.
+    * ``output`` - the target path.
+    * ``theme`` - optional, the theme to use.
+    * ``locale`` - optional, the language to use.
+    * ``scorm`` - optional, ``true`` to include the files for a SCORM package.
+    * ``zip`` - optional, ``true`` to create a zip file instead of a directory.
+    * ``args`` - optional, a list of any other command-line arguments for ``numbas.py``.
+
+    Compiler options given after the manifest apply to every job.
+
+    The work which doesn't depend on the exam - collecting and joining the runtime and theme files, and making ``locale.js`` -
+    is done once for each combination of theme, locale and options, and the exams are then compiled in a pool of worker processes.
+    The result of each job is printed, and a failing job doesn't stop the others.
+    If the shared work for a theme and locale fails, only the jobs which use it fail, with the reason.
+"""
+
+from buildcache import BuildCache
+from concurrent.futures import Future, ProcessPoolExecutor
+import json
+from numbas import CompileError, NumbasCompiler, parse_compile_args
+from optparse import OptionParser
+import sys
+import time
+
+
+class BatchCompiler(NumbasCompiler):
+    """
+        A compiler which collects its messages instead of printing them, so that the output of jobs running at the same time doesn't get mixed up.
+    """
+    def __init__(self, options, cache=None):
+        self.messages = []
+        super().__init__(options, cache=cache)
+
+    def report(self, message):
+        self.messages.append(message)
+
+
+def job_args(job, common_args):
+    """
+        The command-line arguments for ``numbas.py`` corresponding to a job in the manifest.
+    """
+    args = list(common_args)
+    if job.get('theme'):
+        args += ['-t', job['theme']]
+    if job.get('locale'):
+        args += ['-l', job['locale']]
+    if job.get('scorm'):
+        args.append('-s')
+    if job.get('zip'):
+        args.append('-z')
+    args += job.get('args', [])
+    if job.get('output'):
+        args += ['-o', job['output']]
+    if job.get('source'):
+        args.append(job['source'])
+    return args
+
+
+def shared_key(options):
+    """
+        Jobs with the same key share all of the work which doesn't depend on the exam.
+    """
+    return (options.path, options.theme, options.locale, options.followlinks)
+
+
+# The cache in each worker process, filled with the shared work when the worker starts.
+worker_cache = None
+
+def init_worker(cache):
+    global worker_cache
+    worker_cache = cache
+
+
+def compile_job(args):
+    """
+        Compile one job in a worker process.
+    """
+    start = time.perf_counter()
+    result = {
+        'success': False,
+        'messages': [],
+    }
+    try:
+        options = parse_compile_args(args)
+        compiler = BatchCompiler(options, cache=worker_cache)
+        try:
+            compiler.compile()
+        finally:
+            result['messages'] = compiler.messages
+        result['success'] = True
+    except Exception as err:
+        result['error'] = str(err)
+    result['time'] = time.perf_counter() - start
+    return result
+
+
+class BatchCompile(object):
+    def __init__(self, jobs, common_args=(), workers=None):
+        self.jobs = jobs
+        self.common_args = common_args
+        self.workers = workers
+
+    def prepare_shared(self, all_options):
+        """
+            Do the work which doesn't depend on the exam once for each distinct key.
+            Returns a cache containing the results, and a dictionary mapping each key whose work failed to the error.
+        """
+        cache = BuildCache()
+        errors = {}
+        seen = set()
+        for options in all_options:
+            if options is None:
+                continue
+            key = shared_key(options)
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                BatchCompiler(options, cache=cache).prepare_shared()
+            except Exception as err:
+                # Only the jobs with this key fail; the rest of the batch carries on.
+                errors[key] = "Couldn't prepare the files shared by exams using the theme {} and the locale {}: {}".format(options.theme, options.locale, err)
+        return cache, errors
+
+    def run(self):
+        """
+            Compile all of the jobs, yielding a pair ``(job, result)`` for each job, in the order they were given.
+        """
+        all_args = [job_args(job, self.common_args) for job in self.jobs]
+        all_options = []
+        for args in all_args:
+            try:
+                all_options.append(parse_compile_args(args, source=''))
+            except CompileError:
+                # The job will fail again in the worker, and the error will be reported there.
+                all_options.append(None)
+
+        cache, errors = self.prepare_shared(all_options)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(cache,)) as executor:
+            pending = []
+            for args, options in zip(all_args, all_options):
+                key = shared_key(options) if options is not None else None
+                if key in errors:
+                    pending.append({'success': False, 'messages': [], 'error': errors[key], 'time': 0})
+                else:
+                    pending.append(executor.submit(compile_job, args))
+
+            for job, result in zip(self.jobs, pending):
+                yield job, result.result() if isinstance(result, Future) else result
+
+
+def run():
+    parser = OptionParser(usage="usage: %prog [options] manifest [compiler options]")
+    parser.disable_interspersed_args()
+    parser.add_option('-j', '--jobs',
+                        dest='workers',
+                        type='int',
+                        default=None,
+                        help='The number of worker processes to use. Defaults to the number of processors.')
+    parser.add_option('--json',
+                        dest='json',
+                        action='store_true',
+                        default=False,
+                        help='Print the result of each job as a line of JSON')
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.print_help()
+        return
+
+    with open(args[0], encoding='utf-8') as f:
+        jobs = json.load(f)
+
+    batch = BatchCompile(jobs, common_args=args[1:], workers=options.workers)
+
+    failures = 0
+    for job, result in batch.run():
+        if not result['success']:
+            failures += 1
+        if options.json:
+            print(json.dumps(dict(result, source=job.get('source'), output=job.get('output'))))
+        elif result['success']:
+            print("Compiled {} to {} in {:.2f}s".format(job.get('source'), job.get('output'), result['time']))
+        else:
+            print("Failed to compile {}: {}".format(job.get('source'), result['error']))
+        sys.stdout.flush()
+
+    if not options.json:
+        print("{} of {} exams compiled successfully.".format(len(jobs)-failures, len(jobs)))
+
+    if failures:
+        exit(1)
+
+if __name__ == '__main__':
+    run()
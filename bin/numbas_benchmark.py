@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Benchmarks for the compiler, run on synthetic exams.
+
+    Usage:
+
+    * ``numbas_benchmark.py run [options] results.json`` - time the benchmarks and save the results.
+    * ``numbas_benchmark.py compare [options] old.json new.json`` - compare two sets of results, and exit with an error if any benchmark got slower.
+
+    Each benchmark is run on a base exam, and then on variations of it with one parameter changed at a time:
+    the number of questions, parts per question and gaps per gap-fill part, the number and size of resource files,
+    the number of extensions, the format of the source (the old .exam format, or JSON), and the theme.
+
+    The benchmarks are:
+
+    * ``parse`` - reading the source: ``ExamParser.parse`` for the old format, or ``json.loads`` for JSON.
+    * ``migrate`` - ``NumbasObject.migrate_data``, from the source's version to the latest.
+    * ``compile_zip`` and ``compile_dir`` - a whole compilation, to a zip file and to a directory.
+"""
+
+from examparser import ExamParser
+from examparser.benchmark import exam_source, make_exam_data
+from examparser.numbasobject import NUMBAS_FILE_PREFIX, NumbasObject
+import copy
+import datetime
+import gc
+import json
+from numbas import NUMBAS_VERSION, NumbasCompiler, parse_compile_args
+from optparse import OptionParser
+from pathlib import Path
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+NUMBAS_PATH = Path(__file__).resolve().parent.parent
+
+BASE_CASE = {
+    'questions': 20,
+    'parts': 3,
+    'gaps': 2,
+    'resources': 2,
+    'resource_kb': 64,
+    'extensions': 0,
+    'format': 'json',
+    'theme': 'default',
+}
+
+# The parameters which don't affect parsing or migrating the source.
+PACKAGE_PARAMETERS = ('resource_kb', 'theme')
+
+
+class QuietCompiler(NumbasCompiler):
+    def report(self, message):
+        pass
+
+
+def case_label(case, keys=None):
+    keys = keys if keys is not None else BASE_CASE.keys()
+    return ','.join('{}={}'.format(k, case[k]) for k in keys)
+
+
+def make_cases(variations):
+    """
+        The base case, followed by a copy of it with each of the values in ``variations`` in turn, without duplicates.
+        ``variations`` is a dictionary mapping parameter names to lists of values.
+    """
+    cases = [dict(BASE_CASE)]
+    for key, values in variations.items():
+        for value in values:
+            case = dict(BASE_CASE, **{key: value})
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+
+def make_extension(path, name):
+    """
+        Write a synthetic extension, which adds some functions to the JME scope.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    functions = '\n'.join(
+        "    extension.scope.addFunction(new Numbas.jme.funcObj('{name}_f{i}', [Numbas.jme.types.TNum], Numbas.jme.types.TNum, function(x) {{ return x + {i}; }}));".format(name=name, i=i)
+        for i in range(50)
+    )
+    (path / (name + '.js')).write_text("Numbas.addExtension('{}', ['jme'], function(extension) {{\n{}\n}});\n".format(name, functions), encoding='utf-8')
+    (path / (name + '.css')).write_text('.{} {{ color: black; }}\n'.format(name), encoding='utf-8')
+
+
+class Workspace(object):
+    """
+        A temporary directory holding the files for a case: its resources, extensions and compiled packages.
+    """
+    def __init__(self, root, case):
+        self.root = root
+        self.case = case
+        self.resource_root = root / 'resources'
+        self.resource_root.mkdir(parents=True)
+        rng = random.Random(0)
+        self.resources = []
+        for i in range(case['resources']):
+            name = 'resource{}.png'.format(i)
+            # Random bytes don't compress, like most images.
+            (self.resource_root / name).write_bytes(rng.randbytes(case['resource_kb'] * 1024))
+            self.resources.append([name, name])
+        self.extension_paths = []
+        for i in range(case['extensions']):
+            name = 'benchmark{}'.format(i)
+            make_extension(root / 'extensions' / name, name)
+            self.extension_paths.append(str(root / 'extensions' / name))
+
+        data = make_exam_data(case['questions'], parts=case['parts'], gaps=case['gaps'])
+        data['resources'] = self.resources
+        data['extensions'] = ['benchmark{}'.format(i) for i in range(case['extensions'])]
+        self.legacy_source = exam_source(data)
+        self.source = self.legacy_source if case['format'] == 'legacy' else str(NumbasObject(self.legacy_source))
+
+    def parse(self):
+        if self.source.startswith(NUMBAS_FILE_PREFIX):
+            _, json_string = self.source.split('\n', 1)
+            return json.loads(json_string)
+        else:
+            return ExamParser().parse(self.source)
+
+    def parsed(self):
+        """
+            The parsed source and its version, ready to be migrated.
+        """
+        if self.source.startswith(NUMBAS_FILE_PREFIX):
+            version, _ = self.source.split('\n', 1)
+            return self.parse(), version[len(NUMBAS_FILE_PREFIX):].strip()
+        return self.parse(), '1'
+
+    def compile(self, zip):
+        output = self.root / ('package.zip' if zip else 'package')
+        args = ['-c', '-p', str(NUMBAS_PATH), '-t', self.case['theme'], '-o', str(output), '--resource-root', str(self.resource_root), '--extension-paths', json.dumps(self.extension_paths)]
+        if zip:
+            args.append('-z')
+        QuietCompiler(parse_compile_args(args, source=self.source)).compile()
+
+
+def time_runs(fn, repeats, setup=None):
+    """
+        Call ``fn`` ``repeats`` times, and return the time each call took, in seconds.
+        ``setup`` is called before each run, outside the timing, and its result is passed to ``fn``.
+    """
+    times = []
+    for _ in range(repeats):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        start = time.perf_counter()
+        fn(arg) if setup is not None else fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_case(case, repeats, benchmarks, done):
+    """
+        Run the benchmarks on a case, returning a dictionary mapping the name of each benchmark to its timings.
+        Benchmarks which don't depend on the parameters that differ from a case in ``done`` are skipped.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        workspace = Workspace(Path(root), case)
+
+        source_label = case_label(case, [k for k in BASE_CASE if k not in PACKAGE_PARAMETERS])
+        if source_label not in done:
+            done.add(source_label)
+            if 'parse' in benchmarks:
+                results['parse[{}]'.format(source_label)] = time_runs(workspace.parse, repeats)
+            if 'migrate' in benchmarks:
+                def migrate(parsed):
+                    obj = NumbasObject()
+                    obj.data, obj.version = parsed
+                    obj.migrate_data()
+                results['migrate[{}]'.format(source_label)] = time_runs(migrate, repeats, setup=lambda: copy.deepcopy(workspace.parsed()))
+
+        label = case_label(case)
+        if 'compile_zip' in benchmarks:
+            results['compile_zip[{}]'.format(label)] = time_runs(lambda: workspace.compile(zip=True), repeats)
+        if 'compile_dir' in benchmarks:
+            results['compile_dir[{}]'.format(label)] = time_runs(lambda: workspace.compile(zip=False), repeats)
+
+    return results
+
+
+def summarise(times):
+    return {
+        'runs': times,
+        'min': min(times),
+        'median': statistics.median(times),
+    }
+
+
+def run_benchmarks(options, output):
+    def values(option, convert=int):
+        return [convert(x) for x in option.split(',')] if option else []
+
+    variations = {
+        'questions': values(options.questions),
+        'parts': values(options.parts),
+        'gaps': values(options.gaps),
+        'resources': values(options.resources),
+        'resource_kb': values(options.resource_kb),
+        'extensions': values(options.extensions),
+        'format': values(options.formats, str),
+        'theme': values(options.themes, str) if options.themes != 'all' else sorted(p.name for p in (NUMBAS_PATH / 'themes').iterdir() if p.is_dir()),
+    }
+    benchmarks = values(options.benchmarks, str)
+
+    results = {}
+    done = set()
+    for case in make_cases(variations):
+        print("Running {}".format(case_label(case)))
+        sys.stdout.flush()
+        for name, times in run_case(case, options.repeats, benchmarks, done).items():
+            results[name] = summarise(times)
+
+    data = {
+        'numbas_version': NUMBAS_VERSION,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'repeats': options.repeats,
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+    print("Saved the results of {} benchmarks to {}".format(len(results), output))
+
+
+def compare_results(old, new, threshold, min_difference):
+    """
+        Compare the median times of the benchmarks in two sets of results.
+        Returns a list of rows ``(name, old median, new median, ratio, regression)``, and the names of the benchmarks which are only in one of the sets.
+        A benchmark has regressed if it got slower by more than the fraction ``threshold``, and by more than ``min_difference`` seconds.
+    """
+    rows = []
+    for name in sorted(set(old) & set(new)):
+        a = old[name]['median']
+        b = new[name]['median']
+        ratio = b / a if a > 0 else float('inf')
+        regression = ratio > 1 + threshold and b - a > min_difference
+        rows.append((name, a, b, ratio, regression))
+    missing = sorted(set(old) ^ set(new))
+    return rows, missing
+
+
+def run_compare(options, old_path, new_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+
+    rows, missing = compare_results(old['results'], new['results'], options.threshold / 100, options.min_difference / 1000)
+
+    width = max([len(row[0]) for row in rows] + [9])
+    print('{:<{w}} {:>10} {:>10} {:>8}'.format('benchmark', 'old (ms)', 'new (ms)', 'change', w=width))
+    for name, a, b, ratio, regression in rows:
+        print('{:<{w}} {:>10.1f} {:>10.1f} {:>+7.1f}%{}'.format(name, a * 1000, b * 1000, (ratio - 1) * 100, '  REGRESSION' if regression else '', w=width))
+    for name in missing:
+        print("{} is only in {}".format(name, old_path if name in old['results'] else new_path))
+
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print("{} of {} benchmarks got more than {}% slower.".format(len(regressions), len(rows), options.threshold))
+        exit(1)
+
+
+def run():
+    parser = OptionParser(usage="usage: %prog run [options] results.json\n       %prog compare [options] old.json new.json")
+    parser.add_option('--repeats',
+                        dest='repeats',
+                        type='int',
+                        default=3,
+                        help='The number of times to run each benchmark. Defaults to 3.')
+    parser.add_option('--benchmarks',
+                        dest='benchmarks',
+                        default='parse,migrate,compile_zip,compile_dir',
+                        help='Comma-separated names of the benchmarks to run')
+    parser.add_option('--questions',
+                        dest='questions',
+                        default='5,80',
+                        help='Comma-separated numbers of questions to try, as well as the base case of {}'.format(BASE_CASE['questions']))
+    parser.add_option('--parts',
+                        dest='parts',
+                        default='10',
+                        help='Comma-separated numbers of parts per question to try, as well as the base case of {}'.format(BASE_CASE['parts']))
+    parser.add_option('--gaps',
+                        dest='gaps',
+                        default='10',
+                        help='Comma-separated numbers of gaps per gap-fill part to try, as well as the base case of {}'.format(BASE_CASE['gaps']))
+    parser.add_option('--resources',
+                        dest='resources',
+                        default='20',
+                        help='Comma-separated numbers of resource files to try, as well as the base case of {}'.format(BASE_CASE['resources']))
+    parser.add_option('--resource-kb',
+                        dest='resource_kb',
+                        default='4096',
+                        help='Comma-separated sizes in kilobytes of each resource file to try, as well as the base case of {}'.format(BASE_CASE['resource_kb']))
+    parser.add_option('--extensions',
+                        dest='extensions',
+                        default='5',
+                        help='Comma-separated numbers of extensions to try, as well as the base case of {}'.format(BASE_CASE['extensions']))
+    parser.add_option('--formats',
+                        dest='formats',
+                        default='legacy',
+                        help='Comma-separated source formats to try, out of "legacy" and "json", as well as the base case of {}'.format(BASE_CASE['format']))
+    parser.add_option('--themes',
+                        dest='themes',
+                        default='all',
+                        help='Comma-separated themes to try, as well as the base case of {}, or "all" for every theme in the themes directory'.format(BASE_CASE['theme']))
+    parser.add_option('--threshold',
+                        dest='threshold',
+                        type='float',
+                        default=10,
+                        help='When comparing, the percentage by which a benchmark must get slower to count as a regression. Defaults to 10.')
+    parser.add_option('--min-difference',
+                        dest='min_difference',
+                        type='float',
+                        default=1,
+                        help='When comparing, the number of milliseconds by which a benchmark must get slower to count as a regression, so that noise in very quick benchmarks is ignored. Defaults to 1.')
+    (options, args) = parser.parse_args()
+
+    if args[:1] == ['run'] and len(args) == 2:
+        run_benchmarks(options, args[1])
+    elif args[:1] == ['compare'] and len(args) == 3:
+        run_compare(options, args[1], args[2])
+    else:
+        parser.print_help()
+        exit(1)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    A long-running compile server.
+
+    Compiling an exam with ``numbas.py`` means starting a new Python process, importing jinja2, and reading the runtime, theme and locale files from disk each time.
+    This server keeps all of that in memory between compilations, rereading files only when they change.
+
+    Jobs are given as JSON objects, one per line, either on stdin or through a Unix socket given with ``--socket``.
+    Each job has the following keys:
+
+    * ``args`` - a list of command-line arguments, exactly as would be given to ``numbas.py``.
+    * ``source`` - the source of the exam. If not given, the source is read from the path given in ``args``.
+    * ``id`` - optional, is copied into the response.
+
+    For each job, a JSON object is written on a single line in response, with the following keys:
+
+    * ``id`` - the ``id`` of the job.
+    * ``success`` - ``true`` if the exam compiled successfully.
+    * ``output`` - the path that the compiled package was written to.
+    * ``messages`` - a list of messages produced during compilation.
+    * ``error`` - if the compilation failed, a description of the error.
+    * ``time`` - the time taken to compile the exam, in seconds.
+"""
+
+from buildcache import BuildCache
+import json
+from numbas import NumbasCompiler, parse_compile_args
+from optparse import OptionParser
+from pathlib import Path
+import socketserver
+import sys
+import time
+import traceback
+
+
+class ServerCompiler(NumbasCompiler):
+    """
+        A compiler which collects its messages instead of printing them, so they don't get mixed up with the server's responses.
+    """
+    def __init__(self, options, cache=None):
+        self.messages = []
+        super().__init__(options, cache=cache)
+
+    def report(self, message):
+        self.messages.append(message)
+
+
+class CompileServer(object):
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else BuildCache()
+
+    def run_job(self, job):
+        """
+            Compile a single job, and return a dictionary describing the result.
+        """
+        start = time.perf_counter()
+        result = {
+            'id': job.get('id'),
+            'success': False,
+            'messages': [],
+        }
+        compiler = None
+        try:
+            options = parse_compile_args(job.get('args', []), source=job.get('source'))
+            result['output'] = options.output
+            compiler = ServerCompiler(options, cache=self.cache)
+            compiler.compile()
+            result['success'] = True
+        except Exception as err:
+            result['error'] = str(err)
+            if job.get('show_traceback'):
+                result['traceback'] = traceback.format_exc()
+        if compiler is not None:
+            result['messages'] = compiler.messages
+        result['time'] = time.perf_counter() - start
+        return result
+
+    def handle_line(self, line):
+        """
+            Run the job described by one line of JSON, and return the line of JSON to send back.
+        """
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object.")
+        except ValueError as err:
+            result = {'id': None, 'success': False, 'messages': [], 'error': 'Invalid job: {}'.format(err)}
+        else:
+            result = self.run_job(job)
+        return json.dumps(result) + '\n'
+
+    def serve_stream(self, infile, outfile):
+        for line in infile:
+            if not line.strip():
+                continue
+            outfile.write(self.handle_line(line))
+            outfile.flush()
+
+    def serve_socket(self, address):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    line = line.decode('utf-8')
+                    if not line.strip():
+                        continue
+                    self.wfile.write(server.handle_line(line).encode('utf-8'))
+                    self.wfile.flush()
+
+        Path(address).unlink(missing_ok=True)
+        with socketserver.ThreadingUnixStreamServer(address, Handler) as socket_server:
+            try:
+                socket_server.serve_forever()
+            finally:
+                Path(address).unlink(missing_ok=True)
+
+
+def run():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option('--socket',
+                        dest='socket',
+                        default=None,
+                        help='Path of a Unix socket to listen on. If not given, jobs are read from stdin and results written to stdout.')
+    (options, args) = parser.parse_args()
+
+    server = CompileServer()
+
+    if options.socket:
+        try:
+            server.serve_socket(options.socket)
+        except KeyboardInterrupt:
+            pass
+    else:
+        server.serve_stream(sys.stdin, sys.stdout)
+
+if __name__ == '__main__':
+    run()
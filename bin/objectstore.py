@@ -0,0 +1,151 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    A content-addressed store of the files written by directory builds.
+
+    Each distinct file is stored once, named after the SHA-256 hash of its contents, and the files in the output directories are links to the stored copies.
+    When lots of exams are built into sibling directories, the theme and runtime files they share only take up space once.
+
+    Files are hard-linked to the store, or cloned with a copy-on-write reflink where the filesystem supports it.
+    If neither works, for example because the store is on a different filesystem, the file is copied.
+
+    Stored files are made read-only, since changing a hard-linked file in one package would change it in every package.
+    Nothing is ever removed from the store; it can be deleted at any time without affecting the packages built with it.
+
+    The build manifest records which files were linked to the store.
+    When a directory is built again without the store, or with it after building without it, those files are written again,
+    so a directory built without the store never contains links to it.
+"""
+
+from buildmanifest import hash_file
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CHUNK_SIZE = 1024 * 1024
+
+# The Linux ioctl which makes a file share the contents of another, on filesystems such as Btrfs and XFS.
+FICLONE = 0x40049409
+
+LINK_MODES = ['hardlink', 'reflink']
+
+
+def clone_file(src, dst):
+    """
+        Make ``dst`` a copy-on-write clone of ``src``. Raises ``OSError`` if the filesystem doesn't support it.
+    """
+    if fcntl is None:
+        raise OSError("Reflinks aren't supported on this system.")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+
+class ObjectStore(object):
+    def __init__(self, path, link_mode='hardlink'):
+        self.path = Path(path)
+        self.link_mode = link_mode
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, digest):
+        return self.path / digest[:2] / digest
+
+    def _store(self, tmp, digest):
+        """
+            Move a temporary file into place as the stored copy of the contents with the given hash, unless there's already one.
+        """
+        blob = self.blob_path(digest)
+        if blob.exists():
+            os.unlink(tmp)
+            return
+        blob.parent.mkdir(exist_ok=True)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, blob)
+
+    def add_file(self, src):
+        """
+            Store a copy of a file, unless its contents are already stored. Returns the hash of its contents.
+
+            The file is hashed first, and only copied if there's no stored copy with that hash.
+            It's hashed again while it's copied, in case it changed in between.
+        """
+        digest = hash_file(src)
+        if self.blob_path(digest).exists():
+            return digest
+
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        try:
+            with open(src, 'rb') as fsrc, os.fdopen(fd, 'wb') as fdst:
+                while True:
+                    chunk = fsrc.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    fdst.write(chunk)
+            digest = h.hexdigest()
+            self._store(tmp, digest)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    def add_chunks(self, chunks, digest):
+        """
+            Store some data, given as a sequence of chunks of bytes whose hash is ``digest``, if it isn't already stored.
+        """
+        if self.blob_path(digest).exists():
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self._store(tmp, digest)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def link(self, digest, dst):
+        """
+            Make ``dst`` a link to the stored copy of the contents with the given hash, falling back to a reflink and then a copy.
+            ``dst`` must not already exist.
+        """
+        blob = self.blob_path(digest)
+        if self.link_mode == 'hardlink':
+            try:
+                os.link(blob, dst)
+                return
+            except OSError:
+                pass
+        try:
+            clone_file(blob, dst)
+            return
+        except OSError:
+            pass
+        shutil.copyfile(blob, dst)
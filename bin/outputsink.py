@@ -0,0 +1,229 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    The places a compiled package can be written to.
+
+    A sink takes the files collected by a compiler and writes them out:
+
+    * :class:`DirectorySink` - a directory on disk, only rewriting the files which have changed since the last build.
+    * :class:`ZipSink` - a zip file.
+    * :class:`TarSink` - a tar archive, optionally compressed.
+    * :class:`MemorySink` - a dictionary mapping the path of each file to its contents.
+
+    Archives are written either to a path, or to an open binary stream such as stdout or a socket, as they're produced.
+    A stream doesn't need to be seekable, so the package never has to be written to disk and read back before it's sent anywhere.
+"""
+
+import bz2
+import gzip
+import lzma
+import os
+from pathlib import Path, PurePath
+import sys
+import tarfile
+import zipwriter
+
+CHUNK_SIZE = 1024 * 1024
+
+# The compression used for tar archives with these extensions.
+TAR_COMPRESSION = {
+    '.tgz': 'gz',
+    '.gz': 'gz',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+}
+
+# Tar archives are compressed with these, rather than by tarfile, which puts the current time in gzip headers.
+COMPRESSORS = {
+    'gz': lambda out, mtime: gzip.GzipFile(fileobj=out, mode='wb', mtime=mtime),
+    'bz2': lambda out, mtime: bz2.BZ2File(out, 'wb'),
+    'xz': lambda out, mtime: lzma.LZMAFile(out, 'wb'),
+}
+
+
+class CountingWriter(object):
+    """
+        Pass writes on to a binary stream, counting the bytes written.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class ChunkReader(object):
+    """
+        A file-like object reading from an iterator of chunks of bytes.
+        ``read(n)`` always returns ``n`` bytes, unless the end has been reached, as :mod:`tarfile` expects.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def source_chunks(src):
+    """
+        The contents of a file in the package, in chunks of bytes.
+    """
+    if isinstance(src, Path):
+        with open(src, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    else:
+        yield from src.chunks()
+
+
+class OutputSink(object):
+    """
+        Somewhere a compiled package is written to.
+    """
+    # The name of the phase of the compilation which writes the package, as recorded in a profile.
+    phase = 'write_package'
+
+    def write(self, compiler):
+        """
+            Write out the files in ``compiler.files``.
+        """
+        raise NotImplementedError
+
+
+class DirectorySink(OutputSink):
+    """
+        Write the package to the directory given by the compiler's ``output`` option.
+    """
+    phase = 'compileToDir'
+
+    def write(self, compiler):
+        compiler.compileToDir()
+
+
+class MemorySink(OutputSink):
+    """
+        Keep the contents of each file in ``files``, a dictionary keyed by the file's path in the package.
+    """
+    phase = 'read_package'
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, compiler):
+        self.files = {PurePath(dst).as_posix(): zipwriter.read_source(src) for dst, src in compiler.sorted_files()}
+        compiler.profile.add_bytes(sum(len(data) for data in self.files.values()))
+
+
+class ArchiveSink(OutputSink):
+    """
+        Write the package as a single archive file, either to ``path`` or to the binary stream ``stream``.
+        A stream is flushed but not closed once the archive is finished.
+    """
+    def __init__(self, path=None, stream=None):
+        if (path is None) == (stream is None):
+            raise ValueError("Give either a path or a stream to write to.")
+        self.path = path
+        self.stream = stream
+
+    def write(self, compiler):
+        if self.stream is not None:
+            out = CountingWriter(self.stream)
+            self.write_archive(compiler, out)
+            out.flush()
+        else:
+            Path(self.path).parent.mkdir(exist_ok=True, parents=True)
+            with open(self.path, 'wb') as f:
+                out = CountingWriter(f)
+                self.write_archive(compiler, out)
+
+        compiler.profile.add_bytes(out.count)
+
+        if self.path is not None:
+            compiler.report("Exam created in %s" % os.path.relpath(self.path))
+
+    def write_archive(self, compiler, out):
+        raise NotImplementedError
+
+
+class ZipSink(ArchiveSink):
+    phase = 'compileToZip'
+
+    def write_archive(self, compiler, out):
+        compiler.write_zip(out)
+
+
+class TarSink(ArchiveSink):
+    """
+        ``compression`` is ``'gz'``, ``'bz2'`` or ``'xz'``. If not given, it's chosen by the extension of ``path``, and a stream isn't compressed.
+    """
+    phase = 'compileToTar'
+
+    def __init__(self, path=None, stream=None, compression=None):
+        super().__init__(path=path, stream=stream)
+        if compression is None and path is not None:
+            compression = TAR_COMPRESSION.get(Path(path).suffix.lower())
+        if compression and compression not in COMPRESSORS:
+            raise ValueError("Unknown compression {}.".format(compression))
+        self.compression = compression
+
+    def write_archive(self, compiler, out):
+        mtime = max(int(compiler.build_time.timestamp()), 0)
+        if self.compression:
+            with COMPRESSORS[self.compression](out, mtime) as compressed:
+                self.write_tar(compiler, compressed, mtime)
+        else:
+            self.write_tar(compiler, out, mtime)
+
+    def write_tar(self, compiler, out, mtime):
+        # Stream mode writes each block as it's produced, without seeking.
+        with tarfile.open(fileobj=out, mode='w|', format=tarfile.PAX_FORMAT) as tf:
+            for dst, src in compiler.sorted_files():
+                info = tarfile.TarInfo(PurePath(dst).as_posix())
+                info.size = zipwriter.source_size(src)
+                info.mtime = mtime
+                info.mode = 0o644
+                tf.addfile(info, ChunkReader(source_chunks(src)))
+
+
+def make_sink(options):
+    """
+        The sink for a compilation run with the given command-line options.
+    """
+    if options.pipeout:
+        stream = sys.stdout.buffer
+        return TarSink(stream=stream) if options.tar else ZipSink(stream=stream)
+    elif options.tar:
+        return TarSink(path=options.output)
+    elif options.zip:
+        return ZipSink(path=options.output)
+    else:
+        return DirectorySink()
@@ -0,0 +1,72 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Compressed copies of the text files in a package, such as ``numbas.js.gz`` next to ``numbas.js``, for web servers which can serve precompressed files.
+
+    Files are compressed with gzip, and with brotli if the ``brotli`` module is installed, at the highest compression level.
+"""
+
+import gzip
+from pathlib import PurePath
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+TEXT_SUFFIXES = {'.js', '.mjs', '.css', '.html', '.json', '.xml', '.svg', '.txt', '.exam'}
+
+# The suffixes added to the names of compressed copies.
+COMPRESSED_SUFFIXES = {'.gz', '.br'}
+
+# Files smaller than this aren't worth compressing.
+DEFAULT_THRESHOLD = 1024
+
+
+def gzip_compress(chunks, out):
+    # The modification time is left out, so the output only depends on the data.
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def brotli_compress(chunks, out):
+    compressor = brotli.Compressor(quality=11)
+    for chunk in chunks:
+        out.write(compressor.process(chunk))
+    out.write(compressor.finish())
+
+
+def compressors():
+    """
+        A list of pairs ``(suffix, compress)`` for each available compression method.
+        ``compress(chunks, out)`` compresses a sequence of chunks of bytes, writing the output to the file-like object ``out``.
+    """
+    methods = [('.gz', gzip_compress)]
+    if brotli is not None:
+        methods.append(('.br', brotli_compress))
+    return methods
+
+
+def is_compressed_copy(name, names):
+    """
+        Whether the file at the path ``name`` is a compressed copy, made by :func:`compressors`, of a text file whose path is in ``names``.
+    """
+    suffix = PurePath(name).suffix
+    if suffix not in COMPRESSED_SUFFIXES:
+        return False
+    base = name[:-len(suffix)]
+    return base in names and PurePath(base).suffix in TEXT_SUFFIXES
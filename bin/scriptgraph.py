@@ -0,0 +1,198 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    The dependency graph of the scripts in a package.
+
+    Each script wraps its code in a call to ``Numbas.queueScript(name, deps, callback)``, or ``Numbas.addExtension(name, deps, callback)`` for extensions.
+    The graph is read from those calls, so that the compiler can work out which scripts are needed, and change the lists of dependencies when some scripts are left out.
+"""
+
+import re
+
+
+re_declaration = re.compile(r'''Numbas\.(?P<function>queueScript|addExtension)\(\s*(?P<quote>['"])(?P<name>[^'"]+)(?P=quote)\s*,\s*\[(?P<deps>[^\]]*)\]''')
+re_dep = re.compile(r'''(['"])([^'"]+)\1''')
+
+
+class Module(object):
+    """
+        A script declared with ``Numbas.queueScript``.
+
+        ``source`` is the index of the file the script is declared in, and ``deps_span`` is the position of its list of dependencies in that file.
+    """
+    def __init__(self, name, deps, source, deps_span):
+        self.name = name
+        self.deps = deps
+        self.source = source
+        self.deps_span = deps_span
+
+
+def find_declarations(text):
+    """
+        The scripts declared in some Javascript code, as a list of ``(name, deps, deps_span)``.
+    """
+    declarations = []
+    for m in re_declaration.finditer(text):
+        name = m.group('name')
+        if m.group('function') == 'addExtension':
+            name = 'extensions/{0}/{0}.js'.format(name)
+        deps = [d.group(2) for d in re_dep.finditer(m.group('deps'))]
+        declarations.append((name, deps, m.span('deps')))
+    return declarations
+
+
+class ScriptGraph(object):
+    """
+        The scripts declared in a list of Javascript files, and the dependencies between them.
+    """
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.modules = {}
+        # The indices of files which don't declare any scripts. They're run as soon as they're loaded, so they're always needed.
+        self.plain_sources = set()
+        for i, text in enumerate(self.texts):
+            declarations = find_declarations(text)
+            if not declarations:
+                self.plain_sources.add(i)
+            for name, deps, span in declarations:
+                self.modules[name] = Module(name, deps, i, span)
+
+    def dependents(self):
+        """
+            A dictionary mapping the name of each script to the set of scripts that depend on it.
+        """
+        dependents = {name: set() for name in self.modules}
+        for module in self.modules.values():
+            for dep in module.deps:
+                dependents.setdefault(dep, set()).add(module.name)
+        return dependents
+
+    def roots(self):
+        """
+            The scripts which no other script depends on: they're run by the page, so they're always needed.
+        """
+        dependents = self.dependents()
+        return {name for name in self.modules if not dependents[name]}
+
+    def reachable(self, roots, excluded=()):
+        """
+            The names of the scripts which the given roots depend on, directly or indirectly, not going through any of the excluded scripts.
+        """
+        excluded = set(excluded)
+        seen = set()
+        stack = [name for name in roots if name not in excluded]
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            module = self.modules.get(name)
+            if module is not None:
+                stack += [dep for dep in module.deps if dep not in excluded and dep not in seen]
+        return seen
+
+    def needed(self, roots, excluded=()):
+        """
+            The names of the scripts needed to run the given roots, leaving out the excluded scripts where possible.
+
+            Every script in a file is run once the file is loaded, so if one script in a file is needed, the others are too, along with their dependencies.
+        """
+        roots = set(roots)
+        while True:
+            keep = self.reachable(roots, set(excluded) - roots)
+            sources = {self.modules[name].source for name in keep if name in self.modules}
+            siblings = {name for name, module in self.modules.items() if module.source in sources} - keep
+            if not siblings:
+                return keep
+            roots |= siblings
+
+    def needed_sources(self, keep):
+        """
+            The indices of the files needed to run the scripts in ``keep``.
+        """
+        return self.plain_sources | {module.source for name, module in self.modules.items() if name in keep}
+
+    def missing(self):
+        """
+            The dependencies which aren't declared by any of the scripts, as a list of pairs ``(script, dependency)``.
+        """
+        return [(name, dep) for name, module in sorted(self.modules.items()) for dep in module.deps if dep not in self.modules]
+
+    def order(self, names):
+        """
+            Put the given scripts in an order where each one comes after the scripts it depends on, as far as possible.
+            Ties are broken by the order of the files the scripts are declared in.
+
+            Returns the ordered list of names, and a list of the dependency cycles found, each a list of names.
+        """
+        names = set(names)
+        ordered = []
+        state = {}
+        cycles = []
+
+        def visit(name, path):
+            state[name] = 'visiting'
+            path.append(name)
+            for dep in self.modules[name].deps:
+                if dep not in names or dep not in self.modules:
+                    continue
+                if state.get(dep) == 'visiting':
+                    cycles.append(path[path.index(dep):] + [dep])
+                elif dep not in state:
+                    visit(dep, path)
+            path.pop()
+            state[name] = 'done'
+            ordered.append(name)
+
+        for name in sorted(names & set(self.modules), key=lambda n: (self.modules[n].source, n)):
+            if name not in state:
+                visit(name, [])
+
+        return ordered, cycles
+
+    def source_order(self, names):
+        """
+            The indices of the files declaring the given scripts, in the order they should be loaded.
+        """
+        ordered, _ = self.order(names)
+        sources = []
+        for name in ordered:
+            if self.modules[name].source not in sources:
+                sources.append(self.modules[name].source)
+        return sources
+
+    def rewrite(self, index, removed):
+        """
+            The text of a file, with the scripts in ``removed`` taken out of the lists of dependencies of the scripts it declares.
+            Returns ``None`` if nothing needs to change.
+        """
+        text = self.texts[index]
+        modules = sorted((m for m in self.modules.values() if m.source == index), key=lambda m: m.deps_span[0])
+        parts = []
+        pos = 0
+        changed = False
+        for module in modules:
+            if not any(dep in removed for dep in module.deps):
+                continue
+            start, end = module.deps_span
+            deps = [d for d in re_dep.finditer(text, start, end) if d.group(2) not in removed]
+            parts.append(text[pos:start])
+            parts.append(', '.join(d.group(0) for d in deps))
+            pos = end
+            changed = True
+        if not changed:
+            return None
+        parts.append(text[pos:])
+        return ''.join(parts)
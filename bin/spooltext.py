@@ -0,0 +1,139 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Files generated during a compilation, such as the bundled scripts and the rendered templates.
+
+    A generated file is kept in memory until the compilation's memory budget is used up, after which it's moved to a temporary file on disk,
+    like ``tempfile.SpooledTemporaryFile`` but with one budget shared by all of the files in a package.
+    Its contents are UTF-8 encoded text, and are read in chunks, so that big files don't need to be held in memory all at once.
+    Each reader gets its own view of the contents, so a file can be read by several threads at once.
+"""
+
+import io
+import os
+import tempfile
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class MemoryBudget(object):
+    """
+        A limit on the number of bytes of generated files kept in memory. If ``limit`` is ``None``, there's no limit.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def request(self, size):
+        """
+            Ask to keep another ``size`` bytes in memory. Returns ``False`` if that would go over the limit.
+        """
+        with self.lock:
+            if self.limit is not None and self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self.lock:
+            self.used -= size
+
+
+class SpooledText(object):
+    def __init__(self, text=None, budget=None):
+        self.budget = budget
+        self.memory = io.BytesIO()
+        self.file = None
+        self.path = None
+        self.size = 0
+        if text is not None:
+            self.write(text)
+
+    def __del__(self):
+        if self.file is None:
+            if self.budget is not None:
+                self.budget.release(self.size)
+        else:
+            self.file.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    @property
+    def in_memory(self):
+        return self.file is None
+
+    def rollover(self):
+        """
+            Move the contents to a temporary file on disk.
+        """
+        if self.file is not None:
+            return
+        # A named file, so that each reader can open its own handle.
+        fd, self.path = tempfile.mkstemp(prefix='numbas-')
+        self.file = open(fd, 'wb')
+        self.file.write(self.memory.getbuffer())
+        self.memory = None
+        if self.budget is not None:
+            self.budget.release(self.size)
+
+    def write(self, data):
+        """
+            Add some text or bytes to the end of the file.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.file is None and self.budget is not None and not self.budget.request(len(data)):
+            self.rollover()
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.memory.write(data)
+        self.size += len(data)
+
+    def chunks(self, size=CHUNK_SIZE):
+        """
+            The contents of the file, as a sequence of chunks of bytes.
+        """
+        if self.file is None:
+            # The buffer is only exported while a chunk is copied out of it, so a reader which stops early doesn't stop the file being written to.
+            memory = self.memory
+            position = 0
+            while True:
+                with memory.getbuffer() as view:
+                    chunk = bytes(view[position:position+size])
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+        else:
+            self.file.flush()
+            with open(self.path, 'rb') as f:
+                while True:
+                    chunk = f.read(size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    def read_bytes(self):
+        if self.file is None:
+            return self.memory.getvalue()
+        return b''.join(self.chunks())
+
+    def read_text(self):
+        return self.read_bytes().decode('utf-8')
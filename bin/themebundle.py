@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Theme bundles: a theme and all the themes it inherits from, flattened into a single file.
+
+    A bundle holds the theme's options, merged from each theme's ``numbas-theme.json``, the files from each theme's ``files`` directory,
+    with the files from later themes in the chain replacing earlier ones, and the templates from each theme's ``templates`` directory,
+    along with their compiled code.
+    Giving a bundle as the theme to the compiler replaces finding the inherited themes, reading their options and walking their directories
+    with a single read of the bundle file.
+
+    Make a bundle with ``themebundle.py [-p path/to/Numbas] theme output.numbas-theme``.
+
+    The file starts with the line ``NUMBAS THEME BUNDLE <version>``, followed by a line giving the length in bytes of a JSON header, then the header and the contents of the files.
+    The header gives the offset and size within the data of each file and template, and a hash of the contents of each file.
+    Compiled templates are only used with the version of jinja they were compiled with; otherwise they're compiled from source.
+"""
+
+import hashlib
+import jinja2
+import json
+from optparse import OptionParser
+from pathlib import Path, PurePath
+import sys
+
+MAGIC = b'NUMBAS THEME BUNDLE '
+BUNDLE_VERSION = 1
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BundleError(Exception):
+    pass
+
+
+def is_bundle(path):
+    """
+        Is the file at ``path`` a theme bundle?
+    """
+    path = Path(path)
+    if not path.is_file():
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class BundleFile(object):
+    """
+        A file in a theme bundle, which can be used in place of a file on disk in a package.
+    """
+    def __init__(self, bundle, name, offset, size, hash):
+        self.bundle = bundle
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.hash = hash
+
+    def __str__(self):
+        return '{}:{}'.format(self.bundle.path, self.name)
+
+    def chunks(self, size=CHUNK_SIZE):
+        data = self.bundle.data
+        end = self.offset + self.size
+        for i in range(self.offset, end, size):
+            yield data[i:min(i + size, end)]
+
+    def read_bytes(self):
+        return self.bundle.data[self.offset:self.offset + self.size]
+
+    def read_text(self):
+        return self.read_bytes().decode('utf-8')
+
+
+class ThemeBundle(object):
+    def __init__(self, path, header, data):
+        self.path = Path(path)
+        self.header = header
+        self.data = data
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            contents = f.read()
+        try:
+            magic_line, length_line, rest = contents.split(b'\n', 2)
+            if not magic_line.startswith(MAGIC):
+                raise ValueError()
+            version = int(magic_line[len(MAGIC):])
+            length = int(length_line)
+            header = json.loads(rest[:length].decode('utf-8'))
+        except ValueError:
+            raise BundleError("{} isn't a theme bundle.".format(path))
+        if version != BUNDLE_VERSION:
+            raise BundleError("{} is a version {} theme bundle, but only version {} is supported.".format(path, version, BUNDLE_VERSION))
+        return cls(path, header, rest[length:])
+
+    @property
+    def numbas_version(self):
+        return self.header['numbas_version']
+
+    @property
+    def options(self):
+        return self.header['options']
+
+    def files(self):
+        """
+            A dictionary mapping the path of each of the theme's files in a package to the file.
+        """
+        return {PurePath(name): BundleFile(self, name, offset, size, hash) for name, offset, size, hash in self.header['files']}
+
+    def text(self, offset, size):
+        return self.data[offset:offset + size].decode('utf-8')
+
+    def find_template(self, name):
+        """
+            The entry for the template with the given name: either the first theme in the chain which has a template with that name,
+            or a name of the form ``<theme>/<template>``.
+        """
+        for theme in self.header['templates']:
+            if name in theme['templates']:
+                return theme['templates'][name]
+        prefix, _, rest = name.partition('/')
+        for theme in self.header['templates']:
+            if theme['name'] == prefix and rest in theme['templates']:
+                return theme['templates'][rest]
+        raise jinja2.exceptions.TemplateNotFound(name)
+
+    def template_sources(self):
+        """
+            The source of every template in the bundle.
+        """
+        return [self.text(*entry['source']) for theme in self.header['templates'] for entry in theme['templates'].values()]
+
+
+class BundleLoader(jinja2.BaseLoader):
+    """
+        Load templates from a theme bundle, using their compiled code if it was compiled by this version of jinja.
+    """
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.compiled = bundle.header.get('jinja_version') == jinja2.__version__
+
+    def get_source(self, environment, template):
+        entry = self.bundle.find_template(template)
+        return self.bundle.text(*entry['source']), None, lambda: True
+
+    @jinja2.utils.internalcode
+    def load(self, environment, name, globals=None):
+        entry = self.bundle.find_template(name)
+        if not self.compiled or entry.get('code') is None:
+            return super().load(environment, name, globals)
+        namespace = {'__file__': None}
+        exec(compile(self.bundle.text(*entry['code']), '<{} {}>'.format(self.bundle.path, name), 'exec'), namespace)
+        return environment.template_class.from_module_dict(environment, namespace, globals or {})
+
+
+def write_bundle(path, numbas_version, options, files, templates, environment):
+    """
+        Write a theme bundle.
+
+        * ``options`` - the merged theme options.
+        * ``files`` - a dictionary mapping the path of each file in a package to the path of the file on disk.
+        * ``templates`` - a list of pairs ``(theme name, {template name: path})``, starting with the bundled theme and followed by the themes it inherits from.
+        * ``environment`` - the jinja environment used to compile the templates.
+    """
+    data = bytearray()
+
+    def add(contents):
+        offset = len(data)
+        data.extend(contents)
+        return [offset, len(contents)]
+
+    file_entries = []
+    for name, src in files.items():
+        contents = Path(src).read_bytes()
+        offset, size = add(contents)
+        file_entries.append([PurePath(name).as_posix(), offset, size, hashlib.sha256(contents).hexdigest()])
+
+    template_entries = []
+    for theme_name, theme_templates in templates:
+        entries = {}
+        for name, src in sorted(theme_templates.items()):
+            source = Path(src).read_text(encoding='utf-8')
+            entry = {'source': add(source.encode('utf-8'))}
+            try:
+                code = environment.compile(source, name, raw=True, defer_init=True)
+                entry['code'] = add(code.encode('utf-8'))
+            except jinja2.exceptions.TemplateSyntaxError:
+                # The error is reported if the template is used.
+                entry['code'] = None
+            entries[name] = entry
+        template_entries.append({'name': theme_name, 'templates': entries})
+
+    header = json.dumps({
+        'numbas_version': numbas_version,
+        'jinja_version': jinja2.__version__,
+        'options': options,
+        'files': file_entries,
+        'templates': template_entries,
+    }).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC + str(BUNDLE_VERSION).encode('utf-8') + b'\n')
+        f.write(str(len(header)).encode('utf-8') + b'\n')
+        f.write(header)
+        f.write(data)
+
+
+def run():
+    from numbas import CompileError, NumbasCompiler, parse_compile_args
+
+    parser = OptionParser(usage="usage: %prog [options] theme output")
+    parser.add_option('-p', '--path',
+                        dest='path',
+                        default=str(Path(__file__).resolve().parent.parent),
+                        help='The path to the Numbas files')
+    parser.add_option('--followlinks',
+                        dest='followlinks',
+                        action='store_true',
+                        default=False,
+                        help='Whether to follow symbolic links in the theme directories')
+    (options, args) = parser.parse_args()
+
+    if len(args) != 2:
+        parser.print_help()
+        exit(1)
+
+    theme, output = args
+    compile_args = ['--generic', '-p', options.path, '-t', theme, '-o', output]
+    if options.followlinks:
+        compile_args.append('--followlinks')
+
+    try:
+        compiler = NumbasCompiler(parse_compile_args(compile_args))
+        compiler.make_theme_bundle(output)
+    except CompileError as err:
+        sys.stderr.write(str(err)+'\n')
+        exit(1)
+    print("Created the theme bundle {}".format(output))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Precompiled theme templates, so that a theme's jinja templates don't have to be compiled from source on every compilation.
+
+    A theme can ship its templates compiled to Python modules, in a ``compiled-templates`` directory next to its ``templates`` directory.
+    Make it by running ``themetemplates.py path/to/theme``.
+    The directory contains a ``manifest.json`` file recording the version of jinja used and a hash of the source of each template.
+    A compiled template is only used if it was compiled by the installed version of jinja, from the current source of the template,
+    so editing a template without compiling it again is safe.
+
+    Templates which aren't precompiled can be cached as bytecode in a directory, with a subdirectory for each chain of inherited theme template paths.
+    Jinja checks that the source of a template is the same as when it was cached before using the cached bytecode.
+"""
+
+import hashlib
+import jinja2
+import json
+from optparse import OptionParser
+from pathlib import Path
+import shutil
+
+COMPILED_TEMPLATES_DIR = 'compiled-templates'
+MANIFEST_NAME = 'manifest.json'
+
+
+def hash_source(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+class PrecompiledLoader(jinja2.BaseLoader):
+    """
+        Load a theme's templates from its precompiled modules, when they were compiled from the current source.
+        Templates which have changed, or weren't precompiled, are loaded from source.
+    """
+    def __init__(self, templates_path, compiled_path, hashes):
+        self.source_loader = jinja2.FileSystemLoader(templates_path)
+        self.module_loader = jinja2.ModuleLoader(compiled_path)
+        self.hashes = hashes
+
+    def get_source(self, environment, template):
+        return self.source_loader.get_source(environment, template)
+
+    def list_templates(self):
+        return sorted(set(self.source_loader.list_templates()) | set(self.hashes))
+
+    @jinja2.utils.internalcode
+    def load(self, environment, name, globals=None):
+        try:
+            source, _, uptodate = self.source_loader.get_source(environment, name)
+        except jinja2.exceptions.TemplateNotFound:
+            # The theme only ships the compiled template.
+            if name not in self.hashes:
+                raise
+            return self.module_loader.load(environment, name, globals)
+
+        if self.hashes.get(name) != hash_source(source):
+            return super().load(environment, name, globals)
+
+        template = self.module_loader.load(environment, name, globals)
+        # Reload the template if its source changes, as for templates loaded from source.
+        template._uptodate = uptodate
+        return template
+
+
+def template_loader(templates_path):
+    """
+        A loader for the templates in a theme's ``templates`` directory, using its precompiled templates if there are any that can be used.
+    """
+    templates_path = Path(templates_path)
+    compiled_path = templates_path.parent / COMPILED_TEMPLATES_DIR
+    try:
+        with open(compiled_path / MANIFEST_NAME, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return jinja2.FileSystemLoader(templates_path)
+
+    if manifest.get('jinja_version') != jinja2.__version__:
+        return jinja2.FileSystemLoader(templates_path)
+
+    return PrecompiledLoader(templates_path, compiled_path, manifest.get('templates', {}))
+
+
+def bytecode_cache(directory, template_paths):
+    """
+        A cache of compiled templates in the given directory, for the chain of template paths of a theme and the themes it inherits from.
+    """
+    key = json.dumps([jinja2.__version__] + [str(Path(p).resolve()) for p in template_paths])
+    path = Path(directory) / hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    path.mkdir(parents=True, exist_ok=True)
+    return jinja2.FileSystemBytecodeCache(str(path))
+
+
+def compile_theme_templates(theme_path):
+    """
+        Compile the templates of a theme to Python modules in its ``compiled-templates`` directory, replacing any that are already there.
+        Returns the number of templates compiled.
+    """
+    theme_path = Path(theme_path)
+    templates_path = theme_path / 'templates'
+    compiled_path = theme_path / COMPILED_TEMPLATES_DIR
+    if not templates_path.is_dir():
+        raise Exception("{} doesn't have a templates directory.".format(theme_path))
+
+    loader = jinja2.FileSystemLoader(templates_path)
+    environment = jinja2.Environment(loader=loader)
+
+    if compiled_path.exists():
+        shutil.rmtree(compiled_path)
+    compiled_path.mkdir()
+
+    names = loader.list_templates()
+    environment.compile_templates(compiled_path, zip=None, ignore_errors=False)
+
+    manifest = {
+        'jinja_version': jinja2.__version__,
+        'templates': {name: hash_source(loader.get_source(environment, name)[0]) for name in names},
+    }
+    with open(compiled_path / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+    return len(names)
+
+
+def run():
+    parser = OptionParser(usage="usage: %prog theme [theme ...]")
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.print_help()
+        exit(1)
+
+    for theme_path in args:
+        try:
+            n = compile_theme_templates(theme_path)
+        except jinja2.exceptions.TemplateSyntaxError as e:
+            print("Error in theme template: jinja syntax error on line {} of {}: {}".format(e.lineno, e.name, e.message))
+            exit(1)
+        print("Compiled {} templates in {}".format(n, theme_path))
+
+if __name__ == '__main__':
+    run()
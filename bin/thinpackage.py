@@ -0,0 +1,119 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Thin packages: exam-only packages which use a generic runtime built separately, instead of containing their own copy of the runtime.
+
+    A generic runtime records a hash of its files in its ``numbas-manifest.json``.
+    A thin package records the hash of the runtime it was built against, and the runtime is checked before the package is built,
+    so an exam is never paired with a runtime it wasn't built for.
+"""
+
+from buildmanifest import hash_bytes, hash_file
+import hashlib
+import json
+import os
+import precompress
+from pathlib import Path, PurePath
+from zipfile import ZipFile
+
+MANIFEST_NAME = 'numbas-manifest.json'
+
+# Files which aren't part of the runtime itself, so aren't included in its hash.
+UNHASHED_FILES = {MANIFEST_NAME, '.numbas-build.json'}
+
+
+class RuntimeMismatch(Exception):
+    pass
+
+
+def package_hash(file_hashes):
+    """
+        A hash of a package, given a dictionary mapping the path of each file to a hash of its contents.
+    """
+    h = hashlib.sha256()
+    for name in sorted(file_hashes):
+        if name in UNHASHED_FILES:
+            continue
+        h.update('{}\0{}\n'.format(name, file_hashes[name]).encode('utf-8'))
+    return h.hexdigest()
+
+
+class GenericRuntime(object):
+    """
+        A generic runtime built earlier, either as a directory or a zip file.
+        ``followlinks`` says whether to follow symbolic links in a directory.
+    """
+    def __init__(self, path, followlinks=False):
+        self.path = Path(path)
+        if self.path.is_dir():
+            self.file_hashes = {}
+            for d, _, filenames in os.walk(self.path, followlinks=followlinks):
+                for f in filenames:
+                    self.file_hashes[(Path(d) / f).relative_to(self.path).as_posix()] = hash_file(Path(d) / f)
+            manifest_path = self.path / MANIFEST_NAME
+            manifest = manifest_path.read_text(encoding='utf-8') if manifest_path.exists() else None
+        elif self.path.is_file():
+            with ZipFile(self.path) as z:
+                self.file_hashes = {info.filename: hash_bytes(z.read(info)) for info in z.infolist() if not info.is_dir()}
+                manifest = z.read(MANIFEST_NAME).decode('utf-8') if MANIFEST_NAME in self.file_hashes else None
+        else:
+            raise RuntimeMismatch("Couldn't find the runtime {}".format(path))
+
+        # Compressed copies written by --precompress are made after the runtime's hash, and a web server serves them in place of the originals.
+        self.file_hashes = {name: h for name, h in self.file_hashes.items() if not precompress.is_compressed_copy(name, self.file_hashes)}
+
+        if manifest is None:
+            raise RuntimeMismatch("{} doesn't contain a {}, so it isn't a compiled package.".format(path, MANIFEST_NAME))
+        self.manifest = json.loads(manifest)
+        if 'runtime' not in self.manifest:
+            raise RuntimeMismatch("{} isn't a generic runtime. Build one with the --generic option.".format(path))
+
+    @property
+    def hash(self):
+        return self.manifest['runtime']['hash']
+
+    @property
+    def files(self):
+        """
+            The paths of the files in the runtime.
+        """
+        return [name for name in self.file_hashes if name not in UNHASHED_FILES]
+
+    def check(self, numbas_version, theme, expected_hash=None):
+        """
+            Check that the runtime was built by this version of Numbas, with the given theme, and hasn't been changed since.
+            If ``expected_hash`` is given, the runtime must have that hash.
+        """
+        if self.manifest.get('Numbas_version') != numbas_version:
+            raise RuntimeMismatch("The runtime was built by Numbas {}, but this is Numbas {}.".format(self.manifest.get('Numbas_version'), numbas_version))
+        if self.manifest['runtime'].get('theme') != theme:
+            raise RuntimeMismatch("The runtime was built with the theme {}, not {}.".format(self.manifest['runtime'].get('theme'), theme))
+        if package_hash(self.file_hashes) != self.hash:
+            raise RuntimeMismatch("The files in the runtime have changed since it was built.")
+        if expected_hash is not None and expected_hash != self.hash:
+            raise RuntimeMismatch("The runtime has the hash {}, not {}.".format(self.hash, expected_hash))
+
+    def renames(self, url, exclude=()):
+        """
+            A dictionary mapping the path of each file in the runtime, and each directory containing them, to its URL, leaving out the paths in ``exclude``.
+        """
+        url = url.rstrip('/')
+        exclude = set(exclude)
+        paths = set()
+        for name in self.files:
+            path = PurePath(name)
+            paths.add(path.as_posix())
+            paths.update(p.as_posix() for p in path.parents if p != PurePath('.'))
+        return {path: '{}/{}'.format(url, path) for path in paths if path not in exclude}
@@ -0,0 +1,389 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Watch mode: compile an exam to a directory, then rebuild it whenever one of the files it's made from changes.
+
+    The watcher keeps an index of the files in the exam's source, the runtime, the theme, the extensions, the resources, the locales and the marking scripts.
+    On Linux, it waits for inotify to say that something in one of those directories has changed; elsewhere, it checks every ``--watch-interval`` seconds.
+    Either way, it then compares the modification times of the files in the index with the ones it last saw.
+
+    Each changed file is sorted into a kind of input, such as a stylesheet, a template or the exam itself.
+    Each step of the compilation is only run again if one of the kinds of input it depends on has changed;
+    otherwise, the files and attributes it produced last time are reused.
+    For example, a change to a stylesheet only runs the step which bundles the stylesheets, and an edit to the exam source doesn't make the stylesheets again.
+    Only the output files which have changed are written.
+
+    Changes to the compiler itself aren't picked up: restart the watcher after changing it.
+"""
+
+from buildcache import BuildCache, stamp
+import copy
+import ctypes
+import ctypes.util
+import json
+from numbas import NumbasCompiler, realFile
+import os
+from pathlib import Path
+import select
+import sys
+import time
+
+# The kinds of input which each step of the compilation depends on.
+# Steps which aren't listed are cheap, and always run.
+STEP_INPUTS = {
+    'parse_exam': {'exam'},
+    'load_theme_options': set(),
+    'collect_files': {'exam', 'file_list'},
+    'render_templates': {'exam', 'templates', 'file_list'},
+    'make_xml': {'exam', 'templates'},
+    'collect_marking_scripts': {'exam', 'js', 'file_list', 'marking_scripts', 'diagnostic_scripts'},
+    'make_locale_file': {'locales'},
+    'add_source': {'exam'},
+    'add_scorm': {'exam', 'file_list', 'scorm'},
+    'collect_stylesheets': {'exam', 'css', 'file_list'},
+    # The main script file includes the exam's settings, the marking scripts and the locales.
+    'collect_scripts': {'exam', 'js', 'file_list', 'templates', 'locales', 'marking_scripts', 'diagnostic_scripts'},
+}
+
+# Attributes of the compiler which aren't results of a step.
+UNRECORDED_ATTRIBUTES = {'files', 'profile', 'cache', 'options', 'memory_budget', 'object_store', 'previous', 'changes', 'effects', 'minified', 'written'}
+
+
+def copy_value(value):
+    return copy.copy(value) if isinstance(value, (dict, list, set)) else value
+
+
+class WatchCompiler(NumbasCompiler):
+    """
+        A compiler which reuses the results of the steps of the previous compilation that don't depend on any of the kinds of input in ``changes``.
+        If ``changes`` is ``None``, every step is run.
+    """
+    def __init__(self, options, cache=None, previous=None, changes=None):
+        self.previous = previous
+        self.changes = changes
+        # The changes each step made to the compiler's files and attributes.
+        self.effects = {}
+        # The files minified by this compilation, so that unchanged files don't have to be minified again.
+        self.minified = {}
+        # The output files written.
+        self.written = []
+        super().__init__(options, cache=cache)
+
+    def step_inputs(self, name):
+        inputs = STEP_INPUTS.get(name)
+        if name == 'make_locale_file' and self.options.prune_locale_keys:
+            # Pruning depends on the keys used by everything in the package.
+            inputs = inputs | {'exam', 'js', 'templates', 'file_list'}
+        return inputs
+
+    def is_stale(self, name):
+        if self.previous is None or self.changes is None or name not in self.previous.effects:
+            return True
+        inputs = self.step_inputs(name)
+        return inputs is None or bool(inputs & self.changes)
+
+    def run_step(self, name, step):
+        if not self.is_stale(name):
+            effect = self.effects[name] = self.previous.effects[name]
+            self.apply_effect(effect)
+            return
+
+        before_files = dict(self.files)
+        before = {k: (v, copy_value(v)) for k, v in vars(self).items() if k not in UNRECORDED_ATTRIBUTES}
+        super().run_step(name, step)
+
+        attributes = {}
+        for k, v in vars(self).items():
+            if k in UNRECORDED_ATTRIBUTES:
+                continue
+            if k not in before or before[k][0] is not v or before[k][1] != v:
+                attributes[k] = copy_value(v)
+        files = {dst: src for dst, src in self.files.items() if before_files.get(dst) is not src}
+        removed = [dst for dst in before_files if dst not in self.files]
+        self.effects[name] = (attributes, files, removed)
+
+    def apply_effect(self, effect):
+        attributes, files, removed = effect
+        for k, v in attributes.items():
+            setattr(self, k, copy_value(v))
+        for dst in removed:
+            self.files.pop(dst, None)
+        self.files.update(files)
+
+    def minify_file(self, src, minifier, cache=None):
+        key = (id(src), minifier)
+        src_stamp = stamp(src) if isinstance(src, Path) else None
+        previous = self.previous.minified.get(key) if self.previous is not None else None
+        if previous is not None and previous[0] is src and previous[1] == src_stamp:
+            out = previous[2]
+        else:
+            out = super().minify_file(src, minifier, cache)
+        self.minified[key] = (src, src_stamp, out)
+        return out
+
+    def write_output(self, dst, digest, src):
+        self.written.append(dst)
+        super().write_output(dst, digest, src)
+
+
+def watched_paths(compiler, source_path):
+    """
+        The files and directories that a compilation is made from, as a list of pairs ``(path, kind)``.
+    """
+    options = compiler.options
+    numbas_path = Path(options.path)
+    paths = []
+    if source_path is not None:
+        paths.append((Path(source_path), 'exam'))
+    paths.append((numbas_path / 'runtime', 'files'))
+    if compiler.theme_bundle is not None:
+        paths.append((Path(options.theme), 'theme'))
+    else:
+        paths += [(themepath, 'theme') for themepath in compiler.themepaths]
+    paths += [(numbas_path / 'extensions' / x, 'files') for x in json.loads(options.extension_paths)]
+    for resource in compiler.resources:
+        path = resource[1] if isinstance(resource, list) else resource
+        paths.append((Path(options.resource_root) / path, 'files'))
+    paths += [
+        (numbas_path / 'locales', 'locales'),
+        (numbas_path / 'marking_scripts', 'marking_scripts'),
+        (numbas_path / 'diagnostic_scripts', 'diagnostic_scripts'),
+    ]
+    if options.scorm:
+        paths.append((numbas_path / 'scormfiles', 'scorm'))
+    return paths
+
+
+def file_kind(path):
+    return {'.css': 'css', '.js': 'js'}.get(path.suffix, 'file')
+
+
+def classify(path, root, kind):
+    """
+        The kind of input that a file is: one of the kinds in ``STEP_INPUTS``, ``'file'`` for a file which is copied into the package as it is,
+        or ``'theme'`` for a change to the theme's options or the themes it inherits from, which needs everything to be compiled again.
+    """
+    if kind == 'files':
+        return file_kind(path)
+    if kind == 'theme' and root.is_dir():
+        top = path.relative_to(root).parts[0]
+        if top == 'templates':
+            return 'templates'
+        if top == 'files':
+            return file_kind(path)
+    return kind
+
+
+class FileIndex(object):
+    """
+        The modification time and size of every file in a set of files and directories.
+    """
+    def __init__(self, paths, followlinks=False):
+        self.followlinks = followlinks
+        self.paths = paths
+        self.stamps = self.scan()
+
+    def scan(self):
+        stamps = {}
+        for root, kind in self.paths:
+            if root.is_file():
+                stamps[root] = (stamp(root), root, kind)
+                continue
+            for d, dirnames, filenames in os.walk(root, followlinks=self.followlinks):
+                dirnames[:] = [x for x in dirnames if not (x[0]=='.' and len(x)>1)]
+                for f in filenames:
+                    if realFile(f):
+                        path = Path(d) / f
+                        stamps[path] = (stamp(path), root, kind)
+        return stamps
+
+    def set_paths(self, paths):
+        """
+            Change the set of files and directories in the index.
+            Files which were already in the index keep the times last seen, so changes made since then are still found.
+        """
+        self.paths = paths
+        stamps = self.scan()
+        for path in stamps:
+            if path in self.stamps:
+                stamps[path] = (self.stamps[path][0],) + stamps[path][1:]
+        self.stamps = stamps
+
+    def directories(self):
+        dirs = set()
+        for root, _ in self.paths:
+            dirs.add(root if root.is_dir() else root.parent)
+        dirs.update(path.parent for path in self.stamps)
+        return dirs
+
+    def changes(self):
+        """
+            Scan the files again, and return the kinds of input which have changed, and the paths of the changed files.
+            Adding or removing a file is a change of kind ``'file_list'``.
+        """
+        stamps = self.scan()
+        kinds = set()
+        changed = []
+        for path in set(stamps) | set(self.stamps):
+            old = self.stamps.get(path)
+            new = stamps.get(path)
+            if old is not None and new is not None and old[0] == new[0]:
+                continue
+            _, root, kind = new or old
+            kinds.add(classify(path, root, kind))
+            if old is None or new is None:
+                kinds.add('file_list')
+            changed.append(path)
+        self.stamps = stamps
+        return kinds, sorted(changed)
+
+
+class Inotify(object):
+    """
+        Wait for changes to the files in some directories, using Linux's inotify.
+    """
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        library = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or library is None:
+            raise OSError("inotify isn't available.")
+        self.libc = ctypes.CDLL(library, use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "Couldn't start inotify.")
+        self.watched = set()
+
+    def watch(self, directories):
+        for d in directories:
+            if d in self.watched:
+                continue
+            if self.libc.inotify_add_watch(self.fd, os.fsencode(d), self.EVENTS) >= 0:
+                self.watched.add(d)
+
+    def wait(self, timeout=None):
+        """
+            Wait for something to happen in one of the watched directories, returning ``False`` if nothing happened within ``timeout`` seconds.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # The events themselves aren't needed: the index finds out what changed.
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller(object):
+    """
+        Wake up every ``interval`` seconds, for systems without inotify.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+
+    def watch(self, directories):
+        pass
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        return timeout is None
+
+    def close(self):
+        pass
+
+
+# After a change, wait until nothing else has changed for this long before compiling, because editors often write a file in several steps.
+SETTLE_TIME = 0.05
+
+
+def watch(options, source_path=None):
+    """
+        Compile the exam, then compile it again whenever one of its inputs changes, until interrupted.
+        ``source_path`` is the path of the exam's source, or ``None`` for a generic runtime.
+    """
+    options = copy.copy(options)
+    if not options.build_time and not os.environ.get('SOURCE_DATE_EPOCH'):
+        # The build time is kept the same, so that unchanged files stay the same.
+        options.build_time = str(int(time.time()))
+
+    cache = BuildCache()
+    compiler = WatchCompiler(options, cache=cache)
+    compiler.compile()
+    # Only the first compilation starts afresh.
+    options.action = None
+
+    try:
+        notifier = Inotify()
+    except OSError:
+        notifier = Poller(options.watch_interval)
+
+    index = FileIndex(watched_paths(compiler, source_path), followlinks=options.followlinks)
+    notifier.watch(index.directories())
+    print("Watching for changes. Press Ctrl+C to stop.")
+    sys.stdout.flush()
+
+    pending = set()
+    try:
+        while True:
+            notifier.wait()
+            while notifier.wait(SETTLE_TIME):
+                pass
+
+            kinds, changed = index.changes()
+            pending |= kinds
+            if not changed:
+                continue
+
+            start = time.perf_counter()
+            if 'exam' in kinds:
+                with open(source_path, encoding='utf-8') as f:
+                    options.source = f.read()
+            changes = None if 'theme' in pending else pending
+            try:
+                new_compiler = WatchCompiler(options, cache=cache, previous=compiler, changes=changes)
+                new_compiler.compile()
+            except Exception as err:
+                print("Failed to compile after changes to {}:\n{}".format(', '.join(str(p) for p in changed), err))
+                sys.stdout.flush()
+                continue
+
+            compiler = new_compiler
+            pending = set()
+            index.set_paths(watched_paths(compiler, source_path))
+            notifier.watch(index.directories())
+
+            written = [os.path.relpath(p, options.output) for p in compiler.written]
+            print("Rebuilt {} in {:.2f}s after changes to {}".format(', '.join(written) or 'nothing', time.perf_counter() - start, ', '.join(str(p) for p in changed)))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        notifier.close()
@@ -0,0 +1,305 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Write the files in a package to a zip file.
+
+    Entries are always written in the order they're given, so the output is deterministic.
+
+    * Files which are already compressed, such as images, fonts and videos, are stored without compression.
+    * Large files are copied into the archive in chunks, so they're never held in memory all at once.
+    * Other files are read and compressed in a pool of threads, a few at a time, and written to the archive as soon as their turn comes.
+
+    ``zipfile`` can only write data which it compresses itself, one entry at a time, so the archive is written by :class:`ZipWriter`,
+    which takes entries that have already been compressed.
+    Archives can be read by ``zipfile`` and any other zip reader. The ZIP64 extensions are used for entries and archives too big for the original format.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import struct
+import zlib
+
+# Files with these extensions are already compressed, so deflating them again only wastes time.
+STORED_SUFFIXES = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico',
+    '.woff', '.woff2',
+    '.mp3', '.m4a', '.aac', '.ogg', '.oga', '.opus', '.flac',
+    '.mp4', '.m4v', '.mov', '.webm', '.ogv', '.mkv', '.avi',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.br',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.ggb',
+}
+
+# Files bigger than this are streamed into the archive in chunks, instead of being compressed in memory.
+STREAM_THRESHOLD = 8 * 1024 * 1024
+
+CHUNK_SIZE = 1024 * 1024
+
+# The most uncompressed data that can be waiting to be written at once.
+MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+
+def source_size(src):
+    if isinstance(src, Path):
+        return src.stat().st_size
+    else:
+        return getattr(src, 'size', None)
+
+
+def read_source(src):
+    """
+        The whole contents of a file in the package, as bytes.
+    """
+    if hasattr(src, 'read_bytes'):
+        return src.read_bytes()
+    data = src.read()
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return data
+
+
+def iter_chunks(src):
+    """
+        The contents of a file in the package, in chunks of bytes.
+    """
+    if isinstance(src, Path):
+        with open(src, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    elif hasattr(src, 'chunks'):
+        yield from src.chunks()
+    else:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield chunk
+
+
+def compress(src, level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+        Read and deflate the whole of a file in the package.
+        Returns the CRC and size of the contents, and the compressed data.
+    """
+    data = read_source(src)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return zlib.crc32(data), len(data), compressor.compress(data) + compressor.flush()
+
+
+# The layout of the records in a zip file, as described in PKWARE's APPNOTE.TXT.
+LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+DATA_DESCRIPTOR = struct.Struct('<4sL2L')
+DATA_DESCRIPTOR_64 = struct.Struct('<4sL2Q')
+DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+CENTRAL_HEADER_SIGNATURE = b'PK\x01\x02'
+END_RECORD = struct.Struct('<4s4H2LH')
+END_RECORD_SIGNATURE = b'PK\x05\x06'
+END_RECORD_64 = struct.Struct('<4sQ2H2L4Q')
+END_RECORD_64_SIGNATURE = b'PK\x06\x06'
+END_LOCATOR_64 = struct.Struct('<4sLQL')
+END_LOCATOR_64_SIGNATURE = b'PK\x06\x07'
+ZIP64_EXTRA = 0x0001
+
+# Like zipfile, use the ZIP64 extensions for sizes and offsets over 2GB, because some readers treat the 4-byte fields as signed.
+ZIP64_LIMIT = (1 << 31) - 1
+FILECOUNT_LIMIT = 0xffff
+
+VERSION = 20
+ZIP64_VERSION = 45
+# Made on Unix, so the permissions in the external attributes are used.
+CREATE_SYSTEM = 3
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+class ZipEntry(object):
+    def __init__(self, name, date_time, compress_type):
+        try:
+            self.filename = name.encode('ascii')
+            self.flag_bits = 0
+        except UnicodeEncodeError:
+            self.filename = name.encode('utf-8')
+            self.flag_bits = FLAG_UTF8
+        year, month, day, hour, minute, second = date_time
+        self.dosdate = (year - 1980) << 9 | month << 5 | day
+        self.dostime = hour << 11 | minute << 5 | second // 2
+        self.compress_type = compress_type
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.header_offset = 0
+        self.zip64 = False
+
+
+class ZipWriter(object):
+    """
+        Write a zip archive to a binary file object, which doesn't need to be seekable.
+
+        Entries whose data has already been compressed are written with :meth:`write_compressed`, and other entries are streamed in with :meth:`write_stream`.
+        Call :meth:`close` to write the central directory. The file object is left open.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self.entries = []
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def local_header(self, entry, extract_version, crc, compress_size, file_size):
+        extra = b''
+        if entry.zip64:
+            extra = struct.pack('<2H2Q', ZIP64_EXTRA, 16, file_size, compress_size)
+            compress_size = file_size = 0xffffffff
+        return LOCAL_HEADER.pack(LOCAL_HEADER_SIGNATURE, extract_version, 0, entry.flag_bits, entry.compress_type, entry.dostime, entry.dosdate, crc, compress_size, file_size, len(entry.filename), len(extra)) + entry.filename + extra
+
+    def start_entry(self, entry):
+        entry.header_offset = self.offset
+        self.entries.append(entry)
+
+    def write_compressed(self, name, date_time, crc, file_size, data):
+        """
+            Add an entry whose contents were deflated with a raw deflate stream, such as by :func:`compress`.
+        """
+        entry = ZipEntry(name, date_time, ZIP_DEFLATED)
+        entry.crc = crc
+        entry.file_size = file_size
+        entry.compress_size = len(data)
+        entry.zip64 = file_size > ZIP64_LIMIT or len(data) > ZIP64_LIMIT
+        self.start_entry(entry)
+        self.write(self.local_header(entry, ZIP64_VERSION if entry.zip64 else VERSION, crc, entry.compress_size, file_size))
+        self.write(data)
+
+    def write_stream(self, name, date_time, chunks, compress_type, size=None):
+        """
+            Add an entry, compressing its contents a chunk at a time as they're written.
+            The CRC and sizes go in a data descriptor after the data, because they aren't known until the end.
+            ``size`` is the size of the contents, if it's known; if it isn't, the ZIP64 extensions are used in case the entry is big.
+        """
+        entry = ZipEntry(name, date_time, compress_type)
+        entry.flag_bits |= FLAG_DATA_DESCRIPTOR
+        # Deflating can make data slightly bigger, so leave some room.
+        entry.zip64 = size is None or size * 1.05 > ZIP64_LIMIT
+        self.start_entry(entry)
+        self.write(self.local_header(entry, ZIP64_VERSION if entry.zip64 else VERSION, 0, 0, 0))
+
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if compress_type == ZIP_DEFLATED else None
+        for chunk in chunks:
+            entry.crc = zlib.crc32(chunk, entry.crc)
+            entry.file_size += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            entry.compress_size += len(chunk)
+            self.write(chunk)
+        if compressor is not None:
+            chunk = compressor.flush()
+            entry.compress_size += len(chunk)
+            self.write(chunk)
+
+        if not entry.zip64 and (entry.file_size > ZIP64_LIMIT or entry.compress_size > ZIP64_LIMIT):
+            raise ValueError("{} is bigger than its size was given as.".format(name))
+        descriptor = DATA_DESCRIPTOR_64 if entry.zip64 else DATA_DESCRIPTOR
+        self.write(descriptor.pack(DATA_DESCRIPTOR_SIGNATURE, entry.crc, entry.compress_size, entry.file_size))
+
+    def close(self):
+        """
+            Write the central directory and the end of the archive.
+        """
+        start = self.offset
+        for entry in self.entries:
+            sizes = []
+            file_size, compress_size, header_offset = entry.file_size, entry.compress_size, entry.header_offset
+            if entry.zip64 or file_size > ZIP64_LIMIT:
+                sizes.append(file_size)
+                file_size = 0xffffffff
+            if entry.zip64 or compress_size > ZIP64_LIMIT:
+                sizes.append(compress_size)
+                compress_size = 0xffffffff
+            if header_offset > ZIP64_LIMIT:
+                sizes.append(header_offset)
+                header_offset = 0xffffffff
+            extra = struct.pack('<2H{}Q'.format(len(sizes)), ZIP64_EXTRA, 8 * len(sizes), *sizes) if sizes else b''
+            version = ZIP64_VERSION if sizes else VERSION
+            self.write(CENTRAL_HEADER.pack(CENTRAL_HEADER_SIGNATURE, version, CREATE_SYSTEM, version, 0, entry.flag_bits, entry.compress_type, entry.dostime, entry.dosdate, entry.crc, compress_size, file_size, len(entry.filename), len(extra), 0, 0, 0, 0o644 << 16, header_offset))
+            self.write(entry.filename)
+            self.write(extra)
+
+        count = len(self.entries)
+        size = self.offset - start
+        if count > FILECOUNT_LIMIT or size > ZIP64_LIMIT or start > ZIP64_LIMIT:
+            end_64 = self.offset
+            self.write(END_RECORD_64.pack(END_RECORD_64_SIGNATURE, END_RECORD_64.size - 12, ZIP64_VERSION, ZIP64_VERSION, 0, 0, count, count, size, start))
+            self.write(END_LOCATOR_64.pack(END_LOCATOR_64_SIGNATURE, 0, end_64, 1))
+            # Readers look for the ZIP64 records when these fields have their largest values.
+            count = 0xffff
+            size = start = 0xffffffff
+        self.write(END_RECORD.pack(END_RECORD_SIGNATURE, 0, 0, count, count, size, start, 0))
+        self.fileobj.flush()
+
+
+def write_package(fileobj, files, date_time, workers=None):
+    """
+        Write the files in a package as a zip file to a binary file object, which doesn't need to be seekable.
+
+        ``files`` is a list of pairs ``(dst, src)``, where ``dst`` is the path in the package and ``src`` is a ``Path`` or a file-like object.
+        ``date_time`` is the modification time given to every entry, as a tuple ``(year, month, day, hours, minutes, seconds)``.
+    """
+    writer = ZipWriter(fileobj)
+
+    pending = deque()
+    pending_bytes = 0
+
+    def write_next():
+        nonlocal pending_bytes
+        name, future, size = pending.popleft()
+        crc, file_size, data = future.result()
+        pending_bytes -= size
+        writer.write_compressed(name, date_time, crc, file_size, data)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for dst, src in files:
+            name = Path(dst).relative_to('.').as_posix()
+            size = source_size(src)
+            if Path(dst).suffix.lower() in STORED_SUFFIXES:
+                while pending:
+                    write_next()
+                writer.write_stream(name, date_time, iter_chunks(src), ZIP_STORED, size=size)
+            elif size is not None and size > STREAM_THRESHOLD:
+                while pending:
+                    write_next()
+                writer.write_stream(name, date_time, iter_chunks(src), ZIP_DEFLATED, size=size)
+            else:
+                size = size or 0
+                while pending and pending_bytes + size > MAX_PENDING_BYTES:
+                    write_next()
+                pending.append((name, executor.submit(compress, src), size))
+                pending_bytes += size
+
+        while pending:
+            write_next()
+
+    writer.close()
@@ -55,6 +55,65 @@ Numbas.queueScript('localisation', ['i18next', 'localisation-resources'], functi
         Numbas.locale.default_list_separator = Numbas.locale.default_list_separators[Numbas.locale.preferred_locale] || ',';
     }
 
+    /** Add the translations for a locale which was left out of `locale.js`. Called by the files in `locales/`, when they're loaded.
+     *
+     * @param {string} code - The lowercase code of the locale.
+     * @param {object} resources - The i18next resources for the locale.
+     */
+    Numbas.locale.add_resources = function(code, resources) {
+        Numbas.locale.resources[code] = resources;
+        if(i18next.isInitialized) {
+            for(var ns in resources) {
+                i18next.addResourceBundle(code, ns, resources[ns]);
+            }
+        }
+    }
+
+    var loading_resources = {};
+
+    /** The codes of the locales whose translations have to be loaded before the given locale can be used:
+     * the locale and the locale it falls back to, if their translations weren't included in `locale.js`.
+     *
+     * @param {string} locale
+     * @returns {Array.<string>}
+     */
+    Numbas.locale.missing_resources = function(locale) {
+        var lazy_resources = Numbas.locale.lazy_resources || {};
+        if(typeof document == 'undefined') {
+            return [];
+        }
+        var code = locale.toLowerCase();
+        return [code, code.split('-')[0]].filter(function(c) {
+            return lazy_resources[c] !== undefined && Numbas.locale.resources[c] === undefined;
+        });
+    }
+
+    /** Load the translations for the given locale, and the locales it falls back to, if they weren't included in `locale.js`.
+     *
+     * @param {string} locale
+     * @returns {Promise} - Resolves when the translations have loaded. If they can't be loaded, it still resolves, and the keys with no translation are shown as they are.
+     */
+    Numbas.locale.load_resources = function(locale) {
+        var lazy_resources = Numbas.locale.lazy_resources || {};
+        var codes = Numbas.locale.missing_resources(locale);
+        return Promise.all(codes.map(function(c) {
+            if(!loading_resources[c]) {
+                loading_resources[c] = new Promise(function(resolve) {
+                    var script = document.createElement('script');
+                    script.setAttribute('charset', 'UTF-8');
+                    script.setAttribute('src', Numbas.script_root + lazy_resources[c]);
+                    script.addEventListener('load', resolve);
+                    script.addEventListener('error', function() {
+                        Numbas.debug("Couldn't load the translations for "+c, true);
+                        resolve();
+                    });
+                    document.head.appendChild(script);
+                });
+            }
+            return loading_resources[c];
+        }));
+    }
+
     Numbas.locale.init = function() {
         i18next.init({
             lng: Numbas.locale.preferred_locale,
@@ -156,7 +156,47 @@ RequireScript.prototype = {
         });
     }
 };
+/** Scripts which aren't in the main script file, mapping the name of each script to the URL of the file containing it.
+ * The compiler fills this in when it splits the scripts into chunks.
+ *
+ * @type {Object<string>}
+ */
+Numbas.deferred_scripts = Numbas.deferred_scripts || {};
+
+/** The URL of the directory containing the main script file.
+ * Files loaded later on, such as chunks of scripts and translations, are relative to this rather than the page, so that a page can use a runtime stored somewhere else.
+ *
+ * @type {string}
+ */
+Numbas.script_root = (typeof document !== 'undefined' && document.currentScript && document.currentScript.src) ? new URL('.', document.currentScript.src).href : '';
+
+var requested_chunks = {};
+
+/** If the given script is in a chunk that hasn't been loaded yet, load it by adding a script tag to the page.
+ *
+ * @param {string} file - Name of the script.
+ * @returns {boolean} - Is the script in a chunk?
+ */
+function load_deferred_script(file) {
+    var url = Numbas.deferred_scripts[file];
+    if(url === undefined || typeof document === 'undefined') {
+        return false;
+    }
+    if(!requested_chunks[url]) {
+        requested_chunks[url] = true;
+        var script = document.createElement('script');
+        script.setAttribute('src', Numbas.script_root + url);
+        script.addEventListener('error', function() {
+            var err = new Numbas.Error('die.script not loaded', {file: file});
+            Numbas.display && Numbas.display.die(err);
+        });
+        document.head.appendChild(script);
+    }
+    return true;
+}
+
 /** Ask to load a javascript file. Unless `noreq` is set, the file's code must be wrapped in a call to Numbas.queueScript with its filename as the first parameter.
+ * If the file is in a chunk listed in {@link Numbas.deferred_scripts}, the chunk is loaded.
  *
  * @memberof Numbas
  * @param {string} file
@@ -169,6 +209,7 @@ var loadScript = Numbas.loadScript = function(file, noreq) {
             return scriptreqs[file];
         }
         var req = new RequireScript(file);
+        req.deferred = load_deferred_script(file);
         return req;
     }
     return scriptreqs[file];
@@ -308,7 +349,8 @@ Numbas.checkAllScriptsLoaded = function() {
     var fails = [];
     for(var file in scriptreqs) {
         var req = scriptreqs[file];
-        if(req.executed) {
+        // Scripts in chunks which are still loading haven't failed yet.
+        if(req.executed || (req.deferred && !req.callback)) {
             continue;
         }
         if(req.fdeps.every(function(f) {
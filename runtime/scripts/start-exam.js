@@ -188,12 +188,23 @@ Numbas.queueScript('start-exam', ['base', 'util', 'exam', 'settings', 'exam-to-x
     Numbas.init_promise = numbas_init.promise;
 
     Numbas.util.document_ready(function() {
-        Numbas.locale.init();
+        /** Set up the localisation, and schedule the jobs which load the exam.
+         */
+        function start() {
+            Numbas.locale.init();
+
+            var job = Numbas.schedule.add;
+            job(Numbas.xml.loadXMLDocs);
+            Numbas.diagnostic && job(Numbas.diagnostic.load_scripts);
+            Numbas.display && job(Numbas.display.init, Numbas.display);
+            job(() => numbas_init.resolve());
+        }
 
-        var job = Numbas.schedule.add;
-        job(Numbas.xml.loadXMLDocs);
-        job(Numbas.diagnostic.load_scripts);
-        Numbas.display && job(Numbas.display.init, Numbas.display);
-        job(() => numbas_init.resolve());
+        // Only wait when the translations for the locale weren't included in locale.js, so otherwise everything starts in the same order as before.
+        if(Numbas.locale.missing_resources(Numbas.locale.preferred_locale).length) {
+            Numbas.locale.load_resources(Numbas.locale.preferred_locale).then(start);
+        } else {
+            start();
+        }
     });
 });
@@ -0,0 +1,60 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Compile a batch of exams where one job's theme is broken.
+"""
+
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ROOT / 'bin'))
+
+from numbas_batch import BatchCompile
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.bad_theme = self.dir / 'bad-theme'
+        self.bad_theme.mkdir()
+        (self.bad_theme / 'inherit.txt').write_text('default\n', encoding='utf-8')
+        (self.bad_theme / 'numbas-theme.json').write_text('{"html": ', encoding='utf-8')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bad_theme_fails_only_its_jobs(self):
+        source = str(ROOT / 'tests' / 'stability-test.exam')
+        jobs = [
+            {'source': source, 'output': str(self.dir / 'bad'), 'theme': str(self.bad_theme)},
+            {'source': source, 'output': str(self.dir / 'good')},
+        ]
+        batch = BatchCompile(jobs, common_args=['-p', str(ROOT)], workers=1)
+        results = [result for job, result in batch.run()]
+
+        self.assertFalse(results[0]['success'])
+        self.assertIn("Couldn't prepare the files shared by exams using the theme", results[0]['error'])
+        self.assertFalse((self.dir / 'bad').exists())
+
+        self.assertTrue(results[1]['success'], results[1].get('error'))
+        self.assertTrue((self.dir / 'good' / 'index.html').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Profile a compilation, and check the bytes each phase is said to produce.
+"""
+
+import json
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ROOT / 'bin'))
+
+from numbas import NumbasCompiler, parse_compile_args
+
+
+class QuietCompiler(NumbasCompiler):
+    def report(self, message):
+        pass
+
+
+class BuildProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bytes_produced(self):
+        profile_path = self.dir / 'profile.json'
+        source = (ROOT / 'tests' / 'stability-test.exam').read_text(encoding='utf-8')
+        options = parse_compile_args(['-p', str(ROOT), '--profile', str(profile_path), '-o', str(self.dir / 'exam')], source=source)
+        QuietCompiler(options).compile()
+
+        phases = {phase['name']: phase for phase in json.loads(profile_path.read_text(encoding='utf-8'))['phases']}
+
+        # Collecting the runtime's files only copies them, so it produces very little.
+        self.assertLess(phases['collect_files']['bytes'], 1000)
+
+        written = (self.dir / 'exam' / 'source.exam').stat().st_size
+        self.assertEqual(phases['add_source']['bytes'], written)
+        self.assertGreater(phases['collect_scripts']['bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
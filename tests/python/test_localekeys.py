@@ -0,0 +1,57 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Find the translation keys used by the files in a package.
+"""
+
+from pathlib import Path
+import sys
+import unittest
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ROOT / 'bin'))
+
+import localekeys
+
+
+class UsedKeysTest(unittest.TestCase):
+    def check(self, text, used, unused):
+        found = localekeys.used_keys(set(used) | set(unused), [text])
+        self.assertEqual(found, set(used))
+
+    def test_string_literals(self):
+        self.check("R('control.submit answer'); Numbas.Error(\"jme.tokenise.invalid near\");", ['control.submit answer', 'jme.tokenise.invalid near'], ['control.submit'])
+
+    def test_strings_inside_strings(self):
+        self.check("""<span data-bind="text: R('exam.passed')" data-localise="exam.failed"></span>""", ['exam.passed', 'exam.failed'], [])
+
+    def test_escaped_quotes(self):
+        self.check(r'{"script": "translate(\"diagnostic.use retry\")"}', ['diagnostic.use retry'], ['diagnostic.retries left'])
+
+    def test_element_text(self):
+        self.check('<localise>control.back</localise>', ['control.back'], ['control'])
+
+    def test_apostrophes_in_prose(self):
+        self.check("<p>It's a question</p> R('question.header') don't", ['question.header'], ['question'])
+
+    def test_prefixes(self):
+        self.check("R('question.score feedback.' + kind); R(`part.marking.${name}`)", ['question.score feedback.answered', 'part.marking.correct'], ['question.header'])
+
+    def test_plurals(self):
+        self.check("R('exam.questions', {count: n})", ['exam.questions', 'exam.questions_plural'], ['exam.parts_plural'])
+
+
+if __name__ == '__main__':
+    unittest.main()
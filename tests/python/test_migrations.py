@@ -0,0 +1,97 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Check that migrating data in a single pass gives the same result as applying each migration in turn, from every version.
+"""
+
+import copy
+import json
+from pathlib import Path
+import sys
+import unittest
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ROOT / 'bin'))
+
+from examparser import ExamParser
+from examparser.benchmark import make_exam, make_question, migrate_sequentially
+from examparser.migrations import migrate, migration_chain, migrations
+
+
+def versions():
+    """
+        Every version which has a migration from it, from the oldest to the newest.
+    """
+    version = '1'
+    out = []
+    while version in migrations:
+        out.append(version)
+        version = migrations[version].__name__
+    return out
+
+
+class MigrationTarget(object):
+    def __init__(self, data):
+        self.data = data
+
+
+def data_at(data, version):
+    """
+        A copy of the given data at version 1, migrated one step at a time up to ``version``.
+    """
+    target = MigrationTarget(copy.deepcopy(data))
+    v = '1'
+    while v != version:
+        v = migrations[v](target)
+    return target.data
+
+
+class MigrationsTest(unittest.TestCase):
+    def setUp(self):
+        source = (ROOT / 'tests' / 'stability-test.exam').read_text(encoding='utf-8')
+        self.examples = {
+            'stability test': ExamParser().parse(source),
+            'synthetic exam': ExamParser().parse(make_exam(4, parts=3, gaps=2)),
+            'question': make_question(0, parts=3, gaps=2),
+        }
+
+    def test_chain(self):
+        chain, head = migration_chain('1')
+        self.assertEqual(len(chain), len(versions()))
+        self.assertNotIn(head, migrations)
+
+    def test_single_pass_matches_in_turn(self):
+        for name, original in self.examples.items():
+            for version in versions():
+                with self.subTest(example=name, version=version):
+                    start = data_at(original, version)
+                    in_turn = copy.deepcopy(start)
+                    single_pass = copy.deepcopy(start)
+                    v_in_turn = migrate_sequentially(in_turn, version)
+                    v_single_pass = migrate(single_pass, version)
+                    self.assertEqual(v_single_pass, v_in_turn)
+                    self.assertEqual(json.dumps(single_pass), json.dumps(in_turn))
+
+    def test_latest_unchanged(self):
+        data = copy.deepcopy(self.examples['synthetic exam'])
+        migrate(data, '1')
+        migrated = copy.deepcopy(data)
+        head = migration_chain('1')[1]
+        self.assertEqual(migrate(migrated, head), head)
+        self.assertEqual(migrated, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
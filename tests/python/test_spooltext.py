@@ -0,0 +1,81 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Read and write spooled files, in memory and after they've moved to disk.
+"""
+
+from pathlib import Path
+import sys
+import unittest
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ROOT / 'bin'))
+
+from buildcache import value_size
+from spooltext import MemoryBudget, SpooledText
+
+
+class SpooledTextTest(unittest.TestCase):
+    def make(self, rollover):
+        text = SpooledText(budget=MemoryBudget(0 if rollover else None))
+        for i in range(100):
+            text.write('line {}\n'.format(i))
+        self.assertEqual(text.in_memory, not rollover)
+        return text
+
+    def test_write_after_abandoned_reader(self):
+        for rollover in (False, True):
+            with self.subTest(rollover=rollover):
+                text = self.make(rollover)
+                reader = text.chunks(size=10)
+                next(reader)
+                text.write('more')
+                self.assertTrue(text.read_text().endswith('line 99\nmore'))
+
+    def test_concurrent_readers(self):
+        for rollover in (False, True):
+            with self.subTest(rollover=rollover):
+                text = self.make(rollover)
+                expected = text.read_bytes()
+                a = text.chunks(size=7)
+                b = text.chunks(size=5)
+                read_a = []
+                read_b = []
+                for chunk_a, chunk_b in zip(a, b):
+                    read_a.append(chunk_a)
+                    read_b.append(chunk_b)
+                read_a += list(a)
+                read_b += list(b)
+                self.assertEqual(b''.join(read_a), expected)
+                self.assertEqual(b''.join(read_b), expected)
+
+    def test_rollover_while_reading(self):
+        text = SpooledText(budget=MemoryBudget(20))
+        text.write('0123456789')
+        reader = text.chunks(size=4)
+        self.assertEqual(next(reader), b'0123')
+        text.write('abcdefghijklmnop')
+        self.assertFalse(text.in_memory)
+        self.assertEqual(b''.join(reader), b'456789')
+        self.assertEqual(text.read_text(), '0123456789abcdefghijklmnop')
+
+
+class ValueSizeTest(unittest.TestCase):
+    def test_nested(self):
+        self.assertEqual(value_size({'ab': ['cde', ('f', b'gh')], 'i': 1}), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
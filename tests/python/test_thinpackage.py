@@ -0,0 +1,84 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Build a generic runtime as a directory, and a thin package against it.
+"""
+
+import json
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ROOT / 'bin'))
+
+from numbas import NumbasCompiler, parse_compile_args
+import thinpackage
+
+
+class QuietCompiler(NumbasCompiler):
+    def report(self, message):
+        pass
+
+
+def compile_package(args, source=None):
+    QuietCompiler(parse_compile_args(['-p', str(ROOT)] + args, source=source)).compile()
+
+
+class ThinPackageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.source = (ROOT / 'tests' / 'stability-test.exam').read_text(encoding='utf-8')
+        self.runtime_path = self.dir / 'runtime'
+        compile_package(['--generic', '-o', str(self.runtime_path)])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_directory_runtime(self):
+        runtime = thinpackage.GenericRuntime(self.runtime_path)
+        self.assertEqual(runtime.hash, thinpackage.package_hash(runtime.file_hashes))
+
+    def test_thin_package(self):
+        output = self.dir / 'thin'
+        runtime_url = 'https://example.com/runtime/'
+        compile_package(['--runtime', str(self.runtime_path), '--runtime-url', runtime_url, '-o', str(output)], source=self.source)
+
+        runtime = thinpackage.GenericRuntime(self.runtime_path)
+        manifest = json.loads((output / thinpackage.MANIFEST_NAME).read_text(encoding='utf-8'))
+        self.assertEqual(manifest['runtime'], {'hash': runtime.hash, 'url': runtime_url})
+
+        self.assertFalse((output / 'numbas.js').exists())
+        index = (output / 'index.html').read_text(encoding='utf-8')
+        self.assertIn(runtime_url, index)
+
+    def test_precompressed_runtime(self):
+        runtime_path = self.dir / 'precompressed-runtime'
+        compile_package(['--generic', '--precompress', '-o', str(runtime_path)])
+        self.assertTrue((runtime_path / 'numbas.js.gz').exists())
+
+        runtime = thinpackage.GenericRuntime(runtime_path)
+        self.assertNotIn('numbas.js.gz', runtime.files)
+        runtime.check(runtime.manifest['Numbas_version'], 'default')
+
+        output = self.dir / 'thin'
+        compile_package(['--runtime', str(runtime_path), '--runtime-url', 'https://example.com/runtime/', '-o', str(output)], source=self.source)
+        self.assertTrue((output / thinpackage.MANIFEST_NAME).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
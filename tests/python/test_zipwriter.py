@@ -0,0 +1,111 @@
+#Copyright 2011-26 Newcastle University
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+    Write packages with zipwriter, and check the archives with zipfile.
+"""
+
+import io
+from pathlib import Path, PurePath
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import zipfile
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ROOT / 'bin'))
+
+import spooltext
+import zipwriter
+
+
+class UnseekableWriter(io.RawIOBase):
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+class ZipWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.contents = {
+            'index.html': b'<!doctype html>' + b'<p>Hello</p>' * 1000,
+            'resources/image.png': bytes(range(256)) * 10,
+            'scripts/big.js': b'var x = 1;\n' * 5000,
+            'settings.js': 'Numbas.rawxml = "é";'.encode('utf-8'),
+            'empty.txt': b'',
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def package_files(self):
+        files = []
+        for name, data in self.contents.items():
+            if name == 'settings.js':
+                src = spooltext.SpooledText(data.decode('utf-8'))
+            else:
+                src = self.dir / name.replace('/', '_')
+                src.write_bytes(data)
+            files.append((PurePath('.') / name, src))
+        return files
+
+    def check(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), list(self.contents.keys()))
+            for name, contents in self.contents.items():
+                self.assertEqual(zf.read(name), contents)
+            self.assertEqual(zf.getinfo('resources/image.png').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zf.getinfo('index.html').compress_type, zipfile.ZIP_DEFLATED)
+
+    def write(self, out):
+        # Make the big script go through the streaming path.
+        with mock.patch.object(zipwriter, 'STREAM_THRESHOLD', 40000):
+            zipwriter.write_package(out, self.package_files(), date_time=(2020, 1, 1, 0, 0, 0))
+
+    def test_seekable(self):
+        out = io.BytesIO()
+        self.write(out)
+        self.check(out.getvalue())
+
+    def test_unseekable(self):
+        out = UnseekableWriter()
+        self.write(out)
+        self.check(bytes(out.data))
+
+    def test_zip64(self):
+        out = io.BytesIO()
+        with mock.patch.object(zipwriter, 'ZIP64_LIMIT', 1000), mock.patch.object(zipwriter, 'FILECOUNT_LIMIT', 2):
+            self.write(out)
+        self.check(out.getvalue())
+
+    def test_deterministic(self):
+        a = io.BytesIO()
+        b = io.BytesIO()
+        self.write(a)
+        self.write(b)
+        self.assertEqual(a.getvalue(), b.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
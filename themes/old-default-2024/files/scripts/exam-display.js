@@ -820,6 +820,8 @@ Student name: ${sanitise_preamble(this.exam.student_name)}
 Start time: ${sanitise_preamble(this.exam.start.toISOString())}
 ----\n`;
 
+            await Numbas.awaitScripts(['download']);
+
             let exam_object = Numbas.store.examSuspendData();
             let contents = JSON.stringify(exam_object); //this will need to be a json of the exam object, which seems like it should be created somewhere already as we have ways to access it?
             let encryptedContents;